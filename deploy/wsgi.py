@@ -3,5 +3,7 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from fasjson.web.app import create_app
 
 
-application = create_app()
+# Sign the pagination cursors with a key derived from mod_auth_gssapi's session key, see
+# GssapiSessionKey in httpd.conf
+application = create_app({"FASJSON_SECRET_KEY_FILE": "/etc/fasjson-secret/session.key"})
 application.wsgi_app = ProxyFix(application.wsgi_app, x_proto=1, x_host=1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+#
+# SPDX-FileCopyrightText: Contributors to the Fedora Project
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Compare the conversion of LDAP result pages with the previous implementation.
+
+Usage: python devel/bench-converters.py [NUMBER_OF_USERS]
+"""
+
+import datetime
+import sys
+import timeit
+
+from fasjson.lib.ldap.models import UserModel
+
+
+def make_user(index):
+    creation = datetime.datetime(2015, 1, 1) + datetime.timedelta(seconds=index * 3037)
+    return {
+        "uid": [f"user-{index}".encode()],
+        "sn": [b"Surname"],
+        "givenName": [b"Given"],
+        "displayName": [b"Given Surname"],
+        "mail": [f"user-{index}@example.test".encode()],
+        "fasIRCNick": [f"irc:/user-{index}".encode()],
+        "fasLocale": [b"en_US"],
+        "fasTimeZone": [b"UTC"],
+        "fasCreationTime": [creation.strftime("%Y%m%d%H%M%SZ").encode()],
+        "fasIsPrivate": [b"FALSE"],
+    }
+
+
+def legacy_convert(result):
+    # Model.convert_ldap_result() and GeneralTimeConverter before the batch API
+    new_result = {}
+    for dest_name, converter in UserModel.fields.items():
+        try:
+            values = result[converter.ldap_name]
+        except KeyError:
+            continue
+        if dest_name == "creation":
+            value = [datetime.datetime.strptime(v.decode("utf-8"), "%Y%m%d%H%M%SZ") for v in values]
+        else:
+            value = [converter.decode(v) for v in values]
+        new_result[dest_name] = value if converter.multivalued else value[0]
+    return new_result
+
+
+def bench(name, func, baseline=None):
+    duration = min(timeit.repeat(func, number=1, repeat=5))
+    speedup = "" if baseline is None else f"  ({baseline / duration:.1f}x)"
+    print(f"{name:<30} {duration * 1000:8.1f} ms{speedup}")
+    return duration
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = [make_user(index) for index in range(count)]
+    converter = UserModel.fields["creation"]
+    column = [result["fasCreationTime"] for result in results]
+    if [legacy_convert(result) for result in results] != UserModel.convert_ldap_results(results):
+        sys.exit("The conversions differ")
+
+    print(f"Converting {count} users")
+    baseline = bench(
+        "creation: strptime()",
+        lambda: [
+            datetime.datetime.strptime(values[0].decode("utf-8"), "%Y%m%d%H%M%SZ")
+            for values in column
+        ],
+    )
+    bench("creation: from_ldap_many()", lambda: converter.from_ldap_many(column), baseline)
+    baseline = bench("entries: legacy", lambda: [legacy_convert(result) for result in results])
+    bench(
+        "entries: convert_ldap_result()",
+        lambda: [UserModel.convert_ldap_result(result) for result in results],
+        baseline,
+    )
+    bench(
+        "entries: convert_ldap_results()", lambda: UserModel.convert_ldap_results(results), baseline
+    )
+
+
+if __name__ == "__main__":
+    main()
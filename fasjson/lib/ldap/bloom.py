@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """A set of strings that may answer that it contains a string it doesn't contain.
+
+    It never answers that it does not contain a string that was added. The probability of a false
+    positive is about ``error_rate`` once ``capacity`` strings have been added.
+
+    Args:
+        capacity (int): The expected number of strings.
+        error_rate (float): The acceptable probability of false positives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_keys(cls, keys, error_rate=0.01):
+        keys = list(keys)
+        bloom_filter = cls(len(keys), error_rate)
+        for key in keys:
+            bloom_filter.add(key)
+        return bloom_filter
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return all(self._bits[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def add(self, key):
+        for bit in self._positions(key):
+            self._bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def _positions(self, key):
+        # Double hashing: the positions are derived from two independent 64 bits hashes.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+
+class NameFilter:
+    """Tell whether a user or a group may exist without asking the LDAP server.
+
+    The names of all the entries of a model are kept in a :class:`BloomFilter`, which is rebuilt
+    when it is older than ``ttl`` seconds. Names are compared case-insensitively.
+
+    The filters are built in a background thread, by a single thread at a time. Until a filter is
+    built, and once it has expired or has been invalidated, no name is rejected: the entries are
+    looked up on the server. A name created after the filter was built is still rejected until the
+    filter expires or is invalidated, which the LDAP client does when the directory version
+    changes: users and groups created in this window can't be found.
+
+    Args:
+        ttl (int): The number of seconds after which a filter is rebuilt.
+        error_rate (float): The probability that a name that does not exist is not rejected.
+        background (bool): Build the filters in a background thread.
+    """
+
+    # Seconds before trying again to build a filter after a failure
+    retry_interval = 60
+
+    def __init__(self, ttl=300, error_rate=0.01, background=True):
+        self.ttl = ttl
+        self.error_rate = error_rate
+        self.background = background
+        self.stats = {"rejections": 0, "rebuilds": 0, "failures": 0}
+        # model name -> (expiration time, filter or None if it could not be built)
+        self._filters = {}
+        # Incremented when filters are invalidated, so that a filter built from older names is not
+        # stored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(
+            len(bloom_filter)
+            for expires, bloom_filter in self._filters.values()
+            if bloom_filter is not None
+        )
+
+    def may_exist(self, model, name, get_names):
+        """Return whether an entry may exist.
+
+        Args:
+            model (Model): The model of the entry.
+            name (str): The primary key of the entry.
+            get_names (callable): A function returning the primary keys of all the entries of the
+                model, called if the filter must be built.
+        """
+        item = self._filters.get(model.__name__)
+        if (item is None or item[0] <= time.monotonic()) and self._lock.acquire(blocking=False):
+            if self.background:
+                threading.Thread(
+                    target=self._rebuild_and_unlock, args=(model, get_names), daemon=True
+                ).start()
+            else:
+                self._rebuild_and_unlock(model, get_names)
+            item = self._filters.get(model.__name__)
+        if item is None or item[1] is None or item[0] <= time.monotonic():
+            return True
+        if name.lower() in item[1]:
+            return True
+        self.stats["rejections"] += 1
+        return False
+
+    def invalidate(self, match=None):
+        """Remove filters, they will be rebuilt when they are needed.
+
+        Args:
+            match (callable, optional): A function that is given a model name and returns whether
+                its filter must be removed. By default, all filters are removed.
+        """
+        self._generation += 1
+        for model_name in list(self._filters):
+            if match is None or match(model_name):
+                self._filters.pop(model_name, None)
+
+    def _rebuild_and_unlock(self, model, get_names):
+        try:
+            self._rebuild(model, get_names)
+        except Exception as e:
+            log.warning("Could not build the filter of the %s names: %s", model.__name__, e)
+            self.stats["failures"] += 1
+            self._filters[model.__name__] = (time.monotonic() + self.retry_interval, None)
+        finally:
+            self._lock.release()
+
+    def _rebuild(self, model, get_names):
+        generation = self._generation
+        bloom_filter = BloomFilter.from_keys(
+            (name.lower() for name in get_names()), self.error_rate
+        )
+        if generation != self._generation:
+            # Invalidated while it was built
+            return
+        self._filters[model.__name__] = (time.monotonic() + self.ttl, bloom_filter)
+        self.stats["rebuilds"] += 1
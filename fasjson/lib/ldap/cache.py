@@ -0,0 +1,278 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries expire after a delay.
+
+    The size of the cache is bounded: each value has a size (1 by default, or the result of the
+    ``sizeof`` function), and the least recently used values are evicted when the total size
+    exceeds ``max_size``.
+
+    Args:
+        max_size (int): The maximum total size of the values in the cache.
+        ttl (int): The number of seconds after which a value expires.
+        sizeof (callable, optional): A function returning the size of a value.
+    """
+
+    def __init__(self, max_size=1000, ttl=60, sizeof=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # key -> (expiration time, size, value), least recently used first
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._lookup(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return default
+            self.stats["hits"] += 1
+            self._data.move_to_end(key)
+            return item[2]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while self.size > self.max_size:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, match=None):
+        """Remove values from the cache.
+
+        Args:
+            match (callable, optional): A function that is given a key and returns whether its
+                value must be removed. By default, all values are removed.
+        """
+        with self._lock:
+            if match is None:
+                self._data.clear()
+                self.size = 0
+                return
+            for key in [key for key in self._data if match(key)]:
+                self._remove(key)
+
+    def clear(self):
+        self.invalidate()
+
+    def _lookup(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        return item
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+
+def _canonical_key(key):
+    """Return a representation of a cache key that is the same in all processes.
+
+    The iteration order of sets depends on the process' hash seed, so they are sorted.
+    """
+    if isinstance(key, (set, frozenset)):
+        return repr(sorted(_canonical_key(item) for item in key))
+    if isinstance(key, tuple):
+        return repr(tuple(_canonical_key(item) for item in key))
+    return repr(key)
+
+
+class SQLiteCache:
+    """A cache shared by several processes, stored in a SQLite database.
+
+    It has the same interface and the same size and expiration rules as :class:`TTLCache`,
+    except that reading a value does not refresh it: when the cache is full, the values that
+    are the closest to expiring are evicted first. Reads don't take any lock, thanks to the
+    write-ahead log.
+
+    The database should be on a memory-backed filesystem such as ``/dev/shm`` or ``/run``. The
+    values are pickled, so it must only be writable by the application's user. Several caches
+    can share a database file with different ``namespace`` values. The hit and miss counters
+    are those of the current process.
+
+    Args:
+        path (str): The path to the database file, created if it does not exist.
+        namespace (str): The name of this cache in the database.
+        max_size (int): The maximum total size of the values in the cache.
+        ttl (int): The number of seconds after which a value expires.
+        sizeof (callable, optional): A function returning the size of a value.
+    """
+
+    def __init__(self, path, namespace="default", max_size=1000, ttl=60, sizeof=None):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._local = threading.local()
+
+    def __len__(self):
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ? AND expires > ?",
+            (self.namespace, time.time()),
+        )
+        return row.fetchone()[0]
+
+    def __contains__(self, key):
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE namespace = ? AND key = ? AND expires > ?",
+            (self.namespace, _canonical_key(key), time.time()),
+        )
+        return row.fetchone() is not None
+
+    @property
+    def size(self):
+        row = self._connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ? AND expires > ?",
+            (self.namespace, time.time()),
+        )
+        return row.fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires > ?",
+            (self.namespace, _canonical_key(key), time.time()),
+        )
+        row = row.fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return default
+        self.stats["hits"] += 1
+        return pickle.loads(row[0])  # noqa: S301
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        canonical_key = _canonical_key(key)
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND (key = ? OR expires <= ?)",
+                (self.namespace, canonical_key, now),
+            )
+            if size > self.max_size:
+                return
+            conn.execute(
+                "INSERT INTO cache (namespace, key, raw_key, expires, size, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.namespace,
+                    canonical_key,
+                    pickle.dumps(key),
+                    now + self.ttl,
+                    size,
+                    pickle.dumps(value),
+                ),
+            )
+            total = conn.execute(
+                "SELECT SUM(size) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return
+            oldest = conn.execute(
+                "SELECT key, size FROM cache WHERE namespace = ? ORDER BY expires",
+                (self.namespace,),
+            ).fetchall()
+            evicted = []
+            for old_key, old_size in oldest:
+                if total <= self.max_size:
+                    break
+                evicted.append((self.namespace, old_key))
+                total -= old_size
+            conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", evicted)
+            self.stats["evictions"] += len(evicted)
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, _canonical_key(key)),
+            )
+
+    def invalidate(self, match=None):
+        """Remove values from the cache.
+
+        Args:
+            match (callable, optional): A function that is given a key and returns whether its
+                value must be removed. By default, all values are removed.
+        """
+        with self._transaction() as conn:
+            if match is None:
+                conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                return
+            rows = conn.execute(
+                "SELECT key, raw_key FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                [
+                    (self.namespace, key)
+                    for key, raw_key in rows
+                    if match(pickle.loads(raw_key))  # noqa: S301
+                ],
+            )
+
+    def clear(self):
+        self.invalidate()
+
+    def _connection(self):
+        # Connections can't be shared between threads, or with a forked process.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # This is a cache, losing the last writes on a power failure is fine.
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, raw_key BLOB, expires REAL, size INTEGER, value BLOB, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (namespace, expires)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -1,21 +1,60 @@
 import re
+from contextlib import closing
+from itertools import islice
 
 import ldap
 from ldap.controls.pagedresults import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
 
-from .models import AgreementModel, GroupModel, SponsorModel, UserModel
+from .models import AgreementModel, GroupModel, pkey_sort_key, SponsorModel, UserModel
 
 
 GROUP_DN_RE = re.compile("^cn=([^,]+)")
 USER_DN_RE = re.compile("^uid=([^,]+)")
 
+# Errors returned by the server when it can't serve a Virtual List View for a query
+VLV_ERRORS = (
+    ldap.UNAVAILABLE_CRITICAL_EXTENSION,
+    ldap.UNWILLING_TO_PERFORM,
+    ldap.ADMINLIMIT_EXCEEDED,
+    ldap.INAPPROPRIATE_MATCHING,
+    ldap.VLV_ERROR,
+)
+
+
+# Errors returned by the server when it can't serve a sorted search for a query, or when a sorted
+# page would be over its size limit
+SORT_ERRORS = (
+    ldap.UNAVAILABLE_CRITICAL_EXTENSION,
+    ldap.UNWILLING_TO_PERFORM,
+    ldap.ADMINLIMIT_EXCEEDED,
+    ldap.INAPPROPRIATE_MATCHING,
+    ldap.SIZELIMIT_EXCEEDED,
+)
+
+
+class VLVUnavailable(Exception):
+    """The server can't serve a Virtual List View for this query."""
+
 
 class LDAPResult:
-    def __init__(self, items=None, total=None, page_size=None, page_number=None):
+    def __init__(
+        self,
+        items=None,
+        total=None,
+        page_size=None,
+        page_number=None,
+        keyset=False,
+        next_key=None,
+    ):
         self.items = items or []
         self.total = total or len(self.items)
         self.page_size = page_size
         self.page_number = page_number
+        # Keyset pagination: the next page starts after the primary key ``next_key``
+        self.keyset = keyset
+        self.next_key = next_key
 
     def __repr__(self):
         return f"<LDAPResult items=[{len(self.items)} items] page={self.page_number}>"
@@ -26,7 +65,7 @@ class LDAPResult:
         return all(
             [
                 getattr(self, attr) == getattr(other, attr)
-                for attr in ["items", "total", "page_size", "page_number"]
+                for attr in ["items", "total", "page_size", "page_number", "keyset", "next_key"]
             ]
         )
 
@@ -43,14 +82,111 @@ def _get_filter_string(attribute, value, substring_match):
 
 
 class LDAP:
-    def __init__(self, uri, basedn, login="", timeout=ldap.NO_LIMIT, trace_level=0):
+    def __init__(
+        self,
+        uri,
+        basedn,
+        login="",
+        timeout=ldap.NO_LIMIT,
+        trace_level=0,
+        vlv=False,
+        pkey_cache=None,
+        entry_cache=None,
+        username=None,
+        replica=None,
+        negative_cache=None,
+        name_filter=None,
+        directory_version=None,
+        response_cache=None,
+        compact_records=False,
+    ):
         self.basedn = basedn
+        self.vlv = vlv
+        self.pkey_cache = pkey_cache
+        self.entry_cache = entry_cache
+        # The authenticated user, their own entry is cached apart from the other users' entries
+        self.username = username
+        # A local copy of the users and groups, used instead of the server when it is ready
+        self.replica = replica
+        # The names that were not found, and the filter of the names that exist
+        self.negative_cache = negative_cache
+        self.name_filter = name_filter
+        # Clears the caches when the directory is modified, see check_directory_version()
+        self.directory_version = directory_version
+        # The web responses built from the cached data, always cleared with the other caches
+        self.response_cache = response_cache
+        # Store the entries of the searches in records, see Model.get_record_class()
+        self.compact_records = compact_records
+        # Queries that have no Virtual List View index on the server
+        self._vlv_unavailable = set()
+        # Queries that the server refuses to sort
+        self._sort_unavailable = set()
+        # Entries fetched during the current request, see _get_entry()
+        self._identity_map = {}
         ldap.set_option(ldap.OPT_REFERRALS, 0)
         self.conn = ldap.ldapobject.ReconnectLDAPObject(uri, retry_max=3, trace_level=trace_level)
         self.conn.protocol_version = 3
         self.conn.timeout = timeout
         self.conn.sasl_gssapi_bind_s(authz_id=login)
 
+    def close(self):
+        self.conn.unbind_s()
+
+    def reset(self):
+        """Forget the entries fetched during the current request.
+
+        This must be called before the client is used for another request.
+        """
+        self._identity_map.clear()
+
+    def invalidate_cache(self, model=None):
+        """Remove the cached query results and entries
+
+        Args:
+            model (Model, optional): Only remove the results of queries on this model's subtree,
+                and the entries and names of this model. Defaults to removing everything.
+        """
+        if self.pkey_cache is not None:
+            if model is None:
+                self.pkey_cache.invalidate()
+            else:
+                suffix = f"{model.sub_dn},{self.basedn}".lower()
+                self.pkey_cache.invalidate(lambda key: key[0].endswith(suffix))
+        for cache in (self.entry_cache, self.negative_cache):
+            if cache is None:
+                continue
+            if model is None:
+                cache.invalidate()
+            else:
+                cache.invalidate(lambda key: key[0] == model.__name__)
+        if self.name_filter is not None:
+            if model is None:
+                self.name_filter.invalidate()
+            else:
+                self.name_filter.invalidate(lambda name: name == model.__name__)
+        if self.response_cache is not None:
+            # A response may contain entries of several models
+            self.response_cache.invalidate()
+
+    def check_directory_version(self):
+        """Remove everything from the caches if the directory has been modified.
+
+        The server's ``lastusn`` is read at most once every ``directory_version.interval``
+        seconds, so all the caches are up to date after at most this delay, whatever their TTL.
+        """
+        if self.directory_version is None:
+            return
+        if self.directory_version.update(self._get_last_usn):
+            self.invalidate_cache()
+
+    def _get_last_usn(self):
+        """Read the last update sequence numbers of the server's backends, on the root DSE."""
+        result = self.conn.search_s("", ldap.SCOPE_BASE, attrlist=["lastusn"])
+        if not result:
+            return None
+        # The attribute has an option per backend, such as lastusn;userroot
+        return tuple(sorted(result[0][1].items()))
+
     def whoami(self):
         raw = self.conn.whoami_s()
         dn = raw[4:]
@@ -63,37 +199,47 @@ class LDAP:
                 result["service"] = value.split("@")[0]
         return result
 
-    def get_groups(self, attrs, page_size, page_number):
+    def get_groups(self, attrs, page_size, page_number, after=None):
         return self.search(
             model=GroupModel,
             attrs=GroupModel.attrs_to_ldap(attrs),
             scope=ldap.SCOPE_SUBTREE,
             page_size=page_size,
             page_number=page_number,
+            after=after,
         )
 
     def get_group(self, groupname, attrs=None):
-        dn = GroupModel.get_sub_dn_for(groupname)
-        result = self.search(
-            model=GroupModel,
-            sub_dn=dn,
-            attrs=GroupModel.attrs_to_ldap(attrs),
-            scope=ldap.SCOPE_BASE,
-        )
-        if not result.items:
-            return None
-        return result.items[0]
+        return self._get_entry(GroupModel, groupname, attrs)
 
-    def get_group_members(self, groupname, attrs, page_size, page_number):
+    def get_group_members(self, groupname, attrs, page_size, page_number, after=None):
+        if self._replica_ready():
+            return self._replica_group_members(groupname, attrs, page_size, page_number, after)
         group_dn = GroupModel.get_sub_dn_for(groupname)
         filters = "(&" f"(memberOf={group_dn},{self.basedn})" f"{UserModel.filters}" ")"
         return self.search(
             model=UserModel,
             filters=filters,
-            attrs=UserModel.attrs_to_ldap(attrs) or ["uid"],
+            # The versions of the members let the page be validated, see Model.get_version()
+            attrs=[
+                *(UserModel.attrs_to_ldap(attrs) or ["uid"]),
+                *UserModel.get_version_ldap_attrs(),
+            ],
             scope=ldap.SCOPE_SUBTREE,
             page_size=page_size,
             page_number=page_number,
+            after=after,
+        )
+
+    def iter_group_members(self, groupname, attrs):
+        if self._replica_ready():
+            return iter(self._replica_group_members(groupname, attrs).items)
+        group_dn = GroupModel.get_sub_dn_for(groupname)
+        filters = f"(&(memberOf={group_dn},{self.basedn}){UserModel.filters})"
+        return self.iter_search(
+            model=UserModel,
+            filters=filters,
+            attrs=UserModel.attrs_to_ldap(attrs) or ["uid"],
         )
 
     def get_group_sponsors(self, groupname, attrs=None):
@@ -110,35 +256,42 @@ class LDAP:
             return []
         return self._sponsors_to_users(sponsors_result, attrs)
 
-    def _list_sponsors_uid(self, sponsors_dn, attrs):
-        for sponsor in sponsors_dn.items[0]["sponsors"]:
-            group_match = GROUP_DN_RE.match(sponsor)
-            if group_match:
-                members = self.get_group_members(
-                    group_match.group(1), ["uid"], page_size=0, page_number=1
-                )
-                for member in members.items:
-                    yield member["username"]
+    def _sponsors_filter(self, sponsors_dn):
+        """Build the filter matching the users in a list of sponsor DNs.
+
+        Sponsors can be users, or groups whose members are all sponsors. Group members are
+        matched with the ``memberOf`` attribute, which the server maintains for nested groups as
+        well, so there is no group hierarchy to walk here and no possible cycle.
+
+        Returns:
+            str or None: the filter, or ``None`` if there is no sponsor.
+        """
+        uids = set()
+        groups = set()
+        for sponsor in sponsors_dn:
+            if GROUP_DN_RE.match(sponsor):
+                groups.add(sponsor)
+                continue
             user_match = USER_DN_RE.match(sponsor)
             if user_match:
-                yield user_match.group(1)
+                uids.add(user_match.group(1))
+        filters = [f"(uid={ldap.filter.escape_filter_chars(uid)})" for uid in sorted(uids)]
+        filters.extend(
+            f"(&(memberOf={ldap.filter.escape_filter_chars(group_dn)}){UserModel.filters})"
+            for group_dn in sorted(groups)
+        )
+        if not filters:
+            return None
+        return f"(&(objectClass=fasUser)(|{''.join(filters)}))"
 
     def _sponsors_to_users(self, sponsors_dn, attrs):
-        sponsors = []
-
-        for username in self._list_sponsors_uid(sponsors_dn, attrs):
-            uid = f"uid={username}"
-            sponsors.append(uid)
+        """Resolve the sponsors of a group into users, with a single search.
 
-        if not sponsors:
+        A user who is a sponsor both directly and through a group is only returned once.
+        """
+        filters = self._sponsors_filter(sponsors_dn.items[0]["sponsors"])
+        if filters is None:
             return []
-
-        filters = ["(&(objectClass=fasUser)(|"]
-        for uid in set(sponsors):
-            filters.append(f"({uid})")
-        filters.append("))")
-        filters = "".join(filters)
-
         result = self.search(
             model=UserModel,
             filters=filters,
@@ -147,6 +300,8 @@ class LDAP:
         return result.items
 
     def check_membership(self, groupname, username):
+        if self._replica_ready():
+            return self.replica.is_member(groupname, username)
         group_dn = GroupModel.get_sub_dn_for(groupname)
         filters = (
             "(&"
@@ -155,38 +310,245 @@ class LDAP:
             f"(uid={username})"
             ")"
         )
-        result = self.search(
+        result = self.iter_search(
             model=UserModel,
             filters=filters,
             attrs=["uid"],
             scope=ldap.SCOPE_SUBTREE,
         )
-        if not result.items:
+        # There can't be more than one match, don't read further than the second one.
+        with closing(result):
+            items = list(islice(result, 2))
+        if not items:
             return False
-        if len(result.items) == 1:
+        if len(items) == 1:
             return True
-        raise ValueError(f"Unexpected result length: {len(result.items)}")
+        raise ValueError(f"Unexpected result length: {len(items)}")
 
-    def get_users(self, attrs, page_size, page_number):
+    def check_memberships(self, usernames, groupnames):
+        """Check whether several users are members of several groups, with two searches.
+
+        The memberships are read from the ``memberOf`` attribute of the users, which includes the
+        groups they are indirect members of, like ``check_membership()``.
+
+        Returns:
+            dict: for each user name, a dictionary mapping each group name to whether the user is
+            a member of it, or to ``None`` if the group does not exist.
+        """
+        if not usernames or not groupnames:
+            return {username: {} for username in usernames}
+        group_filters = "".join(
+            f"(cn={ldap.filter.escape_filter_chars(groupname)})" for groupname in groupnames
+        )
+        existing_groups = self.search(
+            model=GroupModel,
+            filters=f"(&{GroupModel.filters}(|{group_filters}))",
+            attrs=["cn"],
+        )
+        existing_groups = {group["groupname"].lower() for group in existing_groups.items}
+        users = self.get_users_by_name(usernames, attrs=["groups"])
+        groups_suffix = f",{GroupModel.sub_dn},{self.basedn}".lower()
+        user_groups = {}
+        for user in users.items:
+            user_groups[user["username"].lower()] = {
+                GROUP_DN_RE.match(dn).group(1).lower()
+                for dn in user.get("groups", [])
+                if dn.lower().endswith(groups_suffix)
+            }
+        result = {}
+        for username in usernames:
+            member_of = user_groups.get(username.lower(), set())
+            result[username] = {
+                groupname: (
+                    groupname.lower() in member_of if groupname.lower() in existing_groups else None
+                )
+                for groupname in groupnames
+            }
+        return result
+
+    def get_users(self, attrs, page_size, page_number, after=None):
         return self.search(
             model=UserModel,
             attrs=UserModel.attrs_to_ldap(attrs),
             scope=ldap.SCOPE_SUBTREE,
             page_size=page_size,
             page_number=page_number,
+            after=after,
         )
 
+    def iter_users(self, attrs):
+        return self.iter_search(model=UserModel, attrs=UserModel.attrs_to_ldap(attrs))
+
     def get_user(self, username, attrs=None):
-        dn = UserModel.get_sub_dn_for(username)
-        result = self.search(
+        return self._get_entry(UserModel, username, attrs)
+
+    def _entry_cache_key(self, model, name, attrs):
+        is_self = (
+            model is UserModel
+            and self.username is not None
+            and name.lower() == self.username.lower()
+        )
+        return (model.__name__, name.lower(), attrs, "self" if is_self else "others")
+
+    def get_users_by_name(self, usernames, attrs=None):
+        """Fetch several users at once, with a single search.
+
+        The ``username`` attribute is always requested, so that the caller can tell which users
+        were not found.
+
+        Returns:
+            LDAPResult: the users that were found, in no particular order.
+        """
+        if not usernames:
+            return LDAPResult()
+        ldap_attrs = UserModel.attrs_to_ldap(attrs)
+        if ldap_attrs and UserModel.primary_key not in ldap_attrs:
+            ldap_attrs.append(UserModel.primary_key)
+        uid_filters = "".join(
+            f"(uid={ldap.filter.escape_filter_chars(username)})" for username in usernames
+        )
+        return self.search(
             model=UserModel,
-            sub_dn=dn,
-            attrs=UserModel.attrs_to_ldap(attrs),
-            scope=ldap.SCOPE_BASE,
+            filters=f"(&{UserModel.filters}(|{uid_filters}))",
+            attrs=ldap_attrs,
         )
-        if not result.items:
+
+    def _get_entry(self, model, name, attrs):
+        """Fetch a single entry by primary key, going through the identity map.
+
+        Within a request (until ``reset()`` is called), an entry is only requested from the server
+        once: a later lookup is served from memory if the entry was already fetched with the same
+        attributes or with a wider set of attributes. Missing entries are remembered too.
+
+        If the client has an ``entry_cache``, entries are also shared with the following requests,
+        by model, primary key and attributes. The authenticated user's own entry is cached apart,
+        as users may be allowed to read more of their own entry than of the others'.
+
+        The entry always has the model's version fields, see ``Model.get_version()``.
+
+        If the client has a ``replica`` that is ready, the entry is read from it instead.
+        Otherwise, names that are not in the ``name_filter`` or that are in the
+        ``negative_cache`` are known not to exist without querying the server.
+
+        Returns:
+            dict or None: the converted entry, restricted to the requested attributes, or
+            ``None`` if it does not exist.
+        """
+        ldap_attrs = model.attrs_to_ldap(attrs)
+        # An empty or missing list of attributes means all of the model's attributes
+        wanted = frozenset(ldap_attrs) if ldap_attrs else None
+        key = (model, name)
+        if key in self._identity_map:
+            fetched = self._identity_map[key]
+            if fetched is None:
+                return None
+            for fetched_attrs, entry in fetched.items():
+                if fetched_attrs == wanted:
+                    return dict(entry)
+                if wanted is not None and (fetched_attrs is None or wanted <= fetched_attrs):
+                    return self._project(model, entry, wanted)
+        if self._replica_ready():
+            entry = self.replica.get(model, name)
+            if entry is None:
+                return None
+            return self._project(model, entry, wanted)
+        if not self._may_exist(model, name):
+            self._identity_map[key] = None
+            return None
+        missing_key = (model.__name__, name.lower())
+        if self.negative_cache is not None and self.negative_cache.get(missing_key):
+            self._identity_map[key] = None
             return None
-        return result.items[0]
+        cache_key = self._entry_cache_key(model, name, wanted)
+        entry = None
+        if self.entry_cache is not None:
+            entry = self.entry_cache.get(cache_key)
+        if entry is None:
+            result = self.search(
+                model=model,
+                sub_dn=model.get_sub_dn_for(name),
+                # The version fields are operational attributes, they must be requested by name
+                attrs=[*(ldap_attrs or ["*"]), *model.get_version_ldap_attrs()],
+                scope=ldap.SCOPE_BASE,
+            )
+            if not result.items:
+                self._identity_map[key] = None
+                if self.negative_cache is not None:
+                    self.negative_cache.set(missing_key, True)
+                return None
+            entry = result.items[0]
+            if wanted is not None:
+                # Don't remember attributes that were not requested
+                entry = self._project(model, entry, wanted)
+            if self.entry_cache is not None:
+                self.entry_cache.set(cache_key, entry)
+        self._identity_map.setdefault(key, {})[wanted] = entry
+        # Return a copy, the caller may modify it
+        return dict(entry)
+
+    def _project(self, model, entry, wanted):
+        """Restrict an entry to a set of LDAP attributes, or to the model's attributes.
+
+        The version fields are always kept.
+        """
+        if wanted is None:
+            return {
+                field: value
+                for field, value in entry.items()
+                if field not in model.hidden_fields or field in model.version_fields
+            }
+        return {
+            field: value
+            for field, value in entry.items()
+            if model.fields[field].ldap_name in wanted or field in model.version_fields
+        }
+
+    def _may_exist(self, model, name):
+        if self.name_filter is None:
+            return True
+        # This is the same query as the model's list, they share the primary keys cache
+        return self.name_filter.may_exist(
+            model,
+            name,
+            lambda: self._get_pkeys(
+                base_dn=f"{model.sub_dn},{self.basedn}",
+                filters=model.filters,
+                model=model,
+                scope=ldap.SCOPE_SUBTREE,
+            ),
+        )
+
+    def _replica_ready(self):
+        return self.replica is not None and self.replica.ready
+
+    def _replica_group_members(self, groupname, attrs, page_size=0, page_number=1, after=None):
+        """Read the members of a group from the replica, paginated like ``search()`` does."""
+        usernames = self.replica.get_group_members(groupname)
+        wanted = frozenset(UserModel.attrs_to_ldap(attrs) or ["uid"])
+        total = None
+        next_key = None
+        if after is not None:
+            if not page_size:
+                raise ValueError("Keyset pagination requires a page size")
+            if after:
+                after_key = pkey_sort_key(after)
+                usernames = [name for name in usernames if pkey_sort_key(name) > after_key]
+            if len(usernames) > page_size:
+                next_key = usernames[page_size - 1]
+            usernames = usernames[:page_size]
+        elif page_size:
+            total = len(usernames)
+            first = (page_number - 1) * page_size
+            usernames = usernames[first : first + page_size]
+        items = []
+        for username in usernames:
+            entry = self.replica.get(UserModel, username)
+            # The user may have been deleted since the list of members was read
+            if entry is not None:
+                items.append(self._project(UserModel, entry, wanted))
+        if after is not None:
+            return LDAPResult(items=items, page_size=page_size, keyset=True, next_key=next_key)
+        return LDAPResult(items=items, page_size=page_size, page_number=page_number, total=total)
 
     def get_user_groups(self, username, attrs, page_size, page_number):
         user = self.get_user(username, ["groups"])
@@ -226,6 +588,7 @@ class LDAP:
         attrs,
         page_number,
         page_size,
+        after=None,
         **filters,
     ):
         filter_string = ["(&", UserModel.filters, "(&"]
@@ -269,8 +632,47 @@ class LDAP:
             attrs=UserModel.attrs_to_ldap(attrs),
             page_size=page_size,
             page_number=page_number,
+            after=after,
         )
 
+    def iter_search(
+        self,
+        model,
+        sub_dn=None,
+        filters=None,
+        attrs=None,
+        scope=ldap.SCOPE_SUBTREE,
+    ):
+        """Perform an LDAP query and yield the converted entries as they arrive.
+
+        Unlike ``search()``, the whole result set is never held in memory, and the caller can
+        stop early: the following LDAP pages are only requested when the previous one has been
+        consumed. There is no pagination.
+
+        Args:
+            model (Model): The object model that is being queried
+            sub_dn (str, optional): The DN of the subtree to query (no ``base_dn`` suffix).
+                Defaults to the ``sub_dn`` provided by the model.
+            filters (str): The LDAP filters to use (in LDAP syntax)
+            attrs (list, optional): The list of attributes to request. Defaults to the
+                model's attributes list.
+            scope (int, optional): The LDAP scope to use. Defaults to ldap.SCOPE_SUBTREE.
+
+        Yields:
+            dict: the converted entries.
+        """
+        items = self._do_search(
+            base_dn=f"{sub_dn or model.sub_dn},{self.basedn}",
+            filters=filters or model.filters,
+            model=model,
+            attrs=attrs,
+            scope=scope,
+        )
+        # Closing this generator ends the search on the server
+        with closing(items):
+            for item in items:
+                yield model.convert_ldap_result(item)
+
     def search(
         self,
         model,
@@ -281,6 +683,7 @@ class LDAP:
         scope=ldap.SCOPE_SUBTREE,
         page_size=0,
         page_number=1,
+        after=None,
     ):
         """Perform an LDAP query with pagination support.
 
@@ -290,13 +693,19 @@ class LDAP:
         As a result, to implement pagination we proceed as such:
 
           1. query the primary keys for the whole result set (this is rather fast because only
-             the primary keys are queried)
+             the primary keys are queried). If the client has a ``pkey_cache``, this list is
+             cached so that the following pages of the same query don't need to fetch it again.
           2. slice this list into pages
           3. make a second query including only the primary keys that are in the requested page,
              but requesting all attributes
           4. build a ``LDAPResult`` object that takes into account the total number of entries to
              provide pagination information
 
+        If the client has been created with ``vlv=True``, the server is first asked for the
+        requested page only, using the Virtual List View and Server Side Sorting controls. This
+        requires a VLV index on the server for the query, if there is none the query is made as
+        described above.
+
         Args:
             model (Model): The object model that is being queried
             sub_dn (str, optional): The DN of the subtree to query (no ``base_dn`` suffix).
@@ -308,6 +717,9 @@ class LDAP:
             page_size (int, optional): The number of items per page. If this is zero, disable
                 pagination and request all items. Defaults to 0.
             page_number (int, optional): The requested page number. Defaults to 1.
+            after (str, optional): Use keyset pagination instead of page numbers: return the
+                ``page_size`` entries whose primary key sorts after this one. An empty string
+                returns the first page. See ``_keyset_search()``.
 
         Returns:
             LDAPResult: The query result, with pagination information if appropriate.
@@ -315,20 +727,37 @@ class LDAP:
         base_dn = f"{sub_dn or model.sub_dn},{self.basedn}"
         filters = filters or model.filters
         total = None
-        if page_size:
-            # Get all primary keys regardless of paging
-            pkeys = self._do_search(
+        if after is not None:
+            return self._keyset_search(
                 base_dn=base_dn,
                 filters=filters,
                 model=model,
-                attrs=[model.primary_key],
+                attrs=attrs,
                 scope=scope,
+                page_size=page_size,
+                after=after,
             )
+        if page_size and self.vlv and (base_dn, filters, scope) not in self._vlv_unavailable:
+            try:
+                return self._vlv_search(
+                    base_dn=base_dn,
+                    filters=filters,
+                    model=model,
+                    attrs=attrs,
+                    scope=scope,
+                    page_size=page_size,
+                    page_number=page_number,
+                )
+            except VLVUnavailable:
+                self._vlv_unavailable.add((base_dn, filters, scope))
+        if page_size:
+            # Get all primary keys regardless of paging
+            pkeys = self._get_pkeys(base_dn=base_dn, filters=filters, model=model, scope=scope)
             total = len(pkeys)
             # Find out which items we need for this page
             first = (page_number - 1) * page_size
             last = first + page_size
-            pkeys_page = [item[model.primary_key][0].decode("utf-8") for item in pkeys[first:last]]
+            pkeys_page = pkeys[first:last]
             if not pkeys_page:
                 return LDAPResult(
                     items=[],
@@ -347,7 +776,183 @@ class LDAP:
             scope=scope,
         )
         return LDAPResult(
-            items=[model.convert_ldap_result(item) for item in items],
+            items=model.convert_ldap_results(items, compact=self.compact_records),
+            page_size=page_size,
+            page_number=page_number,
+            total=total,
+        )
+
+    def _keyset_search(self, base_dn, filters, model, attrs, scope, page_size, after):
+        """Query the page of entries following a primary key
+
+        The entries are sorted by primary key on the server, and a range filter selects those
+        after the requested key. The server stops sending entries once the page is full, so only
+        the entries of the page are transferred. The server still sorts all the entries after the
+        key, so a page is not free: the page size must be kept below the server's size limit.
+
+        If the server refuses to sort the query, the primary keys of all the matching entries are
+        fetched (see ``_get_pkeys()``) and sorted locally, in the same order as the server's.
+
+        Returns:
+            LDAPResult: The query result. Its ``next_key`` attribute is the primary key to
+            request the next page with, or ``None`` on the last page.
+        """
+        if not page_size:
+            raise ValueError("Keyset pagination requires a page size")
+        if (base_dn, filters, scope) not in self._sort_unavailable:
+            try:
+                return self._sorted_keyset_search(
+                    base_dn, filters, model, attrs, scope, page_size, after
+                )
+            except SORT_ERRORS:
+                self._sort_unavailable.add((base_dn, filters, scope))
+        pkeys = sorted(
+            (
+                pkey
+                for pkey in self._get_pkeys(base_dn, filters, model, scope)
+                if not after or pkey_sort_key(pkey) > pkey_sort_key(after)
+            ),
+            key=pkey_sort_key,
+        )
+        next_key = pkeys[page_size - 1] if len(pkeys) > page_size else None
+        pkeys_page = pkeys[:page_size]
+        items = []
+        if pkeys_page:
+            pkey = model.primary_key
+            entries_filters = "".join(
+                f"({pkey}={ldap.filter.escape_filter_chars(value)})" for value in pkeys_page
+            )
+            if attrs and pkey not in attrs:
+                attrs = [*attrs, pkey]
+            items = sorted(
+                self._do_search(
+                    base_dn=base_dn,
+                    filters=f"(&{filters}(|{entries_filters}))",
+                    model=model,
+                    attrs=attrs,
+                    scope=scope,
+                ),
+                key=lambda item: pkey_sort_key(item[pkey][0].decode("utf-8")),
+            )
+        return LDAPResult(
+            items=model.convert_ldap_results(items, compact=self.compact_records),
+            page_size=page_size,
+            keyset=True,
+            next_key=next_key,
+        )
+
+    def _sorted_keyset_search(self, base_dn, filters, model, attrs, scope, page_size, after):
+        """Query the page of entries following a primary key, sorted by the server.
+
+        Raises:
+            ldap.LDAPError: one of ``SORT_ERRORS`` if the server can't sort this query.
+        """
+        pkey = model.primary_key
+        if after:
+            value = ldap.filter.escape_filter_chars(after)
+            filters = f"(&{filters}({pkey}>={value})(!({pkey}={value})))"
+        attrs = attrs or model.get_ldap_attrs()
+        if pkey not in attrs:
+            attrs = [*attrs, pkey]
+        msgid = self.conn.search_ext(
+            base_dn,
+            scope,
+            filters,
+            attrlist=attrs,
+            serverctrls=[SSSRequestControl(criticality=True, ordering_rules=[pkey])],
+        )
+        # Fetch one more entry than requested to know whether there is a next page
+        items = []
+        while len(items) <= page_size:
+            rtype, rdata, _rmsgid, _serverctrls = self.conn.result3(msgid, all=0)
+            if rtype == ldap.RES_SEARCH_RESULT:
+                break
+            if rtype == ldap.RES_SEARCH_ENTRY:
+                items.extend(obj for dn, obj in rdata)
+        else:
+            self.conn.abandon(msgid)
+        next_key = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            next_key = items[-1][pkey][0].decode("utf-8")
+        return LDAPResult(
+            items=model.convert_ldap_results(items, compact=self.compact_records),
+            page_size=page_size,
+            keyset=True,
+            next_key=next_key,
+        )
+
+    def _get_pkeys(self, base_dn, filters, model, scope):
+        """Get the primary keys of all the entries matching a query
+
+        If the client has a ``pkey_cache``, the result is cached by query.
+
+        Returns:
+            tuple(str): the primary keys, in the order returned by the server.
+        """
+        cache_key = (base_dn.lower(), filters, scope)
+        if self.pkey_cache is not None:
+            pkeys = self.pkey_cache.get(cache_key)
+            if pkeys is not None:
+                return pkeys
+        items = self._do_search(
+            base_dn=base_dn,
+            filters=filters,
+            model=model,
+            attrs=[model.primary_key],
+            scope=scope,
+        )
+        pkeys = tuple(item[model.primary_key][0].decode("utf-8") for item in items)
+        if self.pkey_cache is not None:
+            self.pkey_cache.set(cache_key, pkeys)
+        return pkeys
+
+    def _vlv_search(self, base_dn, filters, model, attrs, scope, page_size, page_number):
+        """Query a single page using the Virtual List View control
+
+        The entries are sorted by primary key on the server, which only returns the requested
+        page and an estimate of the total number of entries.
+
+        Raises:
+            VLVUnavailable: if the server can't serve a Virtual List View for this query.
+
+        Returns:
+            LDAPResult: The query result, with pagination information.
+        """
+        first = (page_number - 1) * page_size
+        serverctrls = [
+            SSSRequestControl(criticality=True, ordering_rules=[model.primary_key]),
+            VLVRequestControl(
+                criticality=True,
+                before_count=0,
+                after_count=page_size - 1,
+                offset=first + 1,
+                content_count=0,
+            ),
+        ]
+        try:
+            msgid = self.conn.search_ext(
+                base_dn,
+                scope,
+                filters,
+                attrlist=attrs or model.get_ldap_attrs(),
+                serverctrls=serverctrls,
+            )
+            _rtype, rdata, _rmsgid, serverctrls = self.conn.result3(msgid)
+        except VLV_ERRORS as e:
+            raise VLVUnavailable(str(e)) from e
+        for ctrl in serverctrls:
+            if isinstance(ctrl, VLVResponseControl):
+                break
+        else:
+            raise VLVUnavailable("No VLV response control")
+        if ctrl.result != 0:
+            raise VLVUnavailable(f"VLV result: {ctrl.result}")
+        total = ctrl.content_count
+        # When the offset is past the end, the server returns the last entries.
+        items = [obj for dn, obj in rdata] if first < total else []
+        return LDAPResult(
+            items=model.convert_ldap_results(items, compact=self.compact_records),
             page_size=page_size,
             page_number=page_number,
             total=total,
@@ -373,36 +978,53 @@ class LDAP:
             scope (int, optional): The LDAP scope to use. Defaults to ldap.SCOPE_SUBTREE.
 
         In the implementation, SimplePagedResultControl is used to buffer results and save
-        memory, but it is not usable as a web-compatible paging system.
+        memory, but it is not usable as a web-compatible paging system. The entries are yielded
+        as each page arrives. If the generator is closed before the last page, the paged search
+        is ended on the server, which limits the number of paged searches per connection.
 
-        Returns:
-            list(dict): a list of dictionaries keyed by attributes.
+        Yields:
+            dict: dictionaries keyed by attributes.
         """
         attrs = attrs or model.get_ldap_attrs()
         page_size = 1000
         # if maximum:
         #     page_size = min(maximum, page_size)
         page_cookie = ""
-        results = []
-        while True:
-            page_control = SimplePagedResultsControl(
-                criticality=False, size=page_size, cookie=page_cookie
-            )
+        try:
+            while True:
+                page_control = SimplePagedResultsControl(
+                    criticality=False, size=page_size, cookie=page_cookie
+                )
+                msgid = self.conn.search_ext(
+                    base_dn,
+                    scope,
+                    filters,
+                    attrlist=attrs,
+                    serverctrls=[page_control],
+                )
+                rtype, rdata, rmsgid, serverctrls = self.conn.result3(msgid)
+                page_cookie = ""
+                for ctrl in serverctrls:
+                    if isinstance(ctrl, SimplePagedResultsControl):
+                        page_cookie = ctrl.cookie
+                        break
+                for _dn, obj in rdata:
+                    yield obj
+                if not page_cookie:
+                    break
+        finally:
+            # There are more pages: the search was stopped early, or failed
+            if page_cookie:
+                self._end_paged_search(base_dn, scope, filters, page_cookie)
+
+    def _end_paged_search(self, base_dn, scope, filters, page_cookie):
+        """Tell the server to drop a simple paged search, by asking for a page of size 0."""
+        page_control = SimplePagedResultsControl(criticality=False, size=0, cookie=page_cookie)
+        try:
             msgid = self.conn.search_ext(
-                base_dn,
-                scope,
-                filters,
-                attrlist=attrs,
-                serverctrls=[page_control],
+                base_dn, scope, filters, attrlist=["1.1"], serverctrls=[page_control]
             )
-            rtype, rdata, rmsgid, serverctrls = self.conn.result3(msgid)
-            results.extend(obj for dn, obj in rdata)
-            for ctrl in serverctrls:
-                if isinstance(ctrl, SimplePagedResultsControl):
-                    page_cookie = ctrl.cookie
-                    break
-            if not page_cookie:
-                break
-            # if maximum and len(results) >= maximum:
-            #     break
-        return results
+            self.conn.result3(msgid)
+        except ldap.LDAPError:
+            # The connection is broken, the server drops the search with it
+            pass
@@ -1,5 +1,5 @@
 import datetime
-from base64 import b64encode
+import sys
 
 
 class Converter:
@@ -13,10 +13,36 @@ class Converter:
             value = value[0]
         return value
 
+    def from_ldap_many(self, column):
+        """Convert the values of this attribute in several entries, such as a result page.
+
+        Args:
+            column (list): The raw values of each entry, lists of bytes.
+
+        Returns:
+            list: the converted values, in the same order.
+        """
+        if type(self).decode is Converter.decode:
+            # Plain strings, decode them without a method call per value
+            if self.multivalued:
+                return [[v.decode("utf-8") for v in values] for values in column]
+            return [values[0].decode("utf-8") for values in column]
+        decode = self.decode
+        if self.multivalued:
+            return [[decode(v) for v in values] for values in column]
+        return [decode(values[0]) for values in column]
+
     def decode(self, value):
         return value.decode("utf-8")
 
 
+class DNConverter(Converter):
+    """Distinguished names are interned, the same group DNs are in many entries."""
+
+    def decode(self, value):
+        return sys.intern(super().decode(value))
+
+
 class BoolConverter(Converter):
     def decode(self, value):
         value = super().decode(value).upper()
@@ -31,14 +57,26 @@ class GeneralTimeConverter(Converter):
     gentime_fmt = "%Y%m%d%H%M%SZ"
 
     def decode(self, value):
+        # Fast path for the YYYYMMDDHHMMSSZ format, strptime() is slow
+        if len(value) == 15 and value[14:] == b"Z" and value[:14].isdigit():
+            return datetime.datetime(
+                int(value[0:4]),
+                int(value[4:6]),
+                int(value[6:8]),
+                int(value[8:10]),
+                int(value[10:12]),
+                int(value[12:14]),
+            )
         value = super().decode(value)
         return datetime.datetime.strptime(value, self.gentime_fmt)
 
 
 class BinaryConverter(Converter):
+    """Binary values are kept as bytes, they are only encoded when the response is serialized."""
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ldap_name = f"{self.ldap_name};binary"
 
     def decode(self, value):
-        return b64encode(value).decode("ascii")
+        return value
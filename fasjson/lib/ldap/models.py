@@ -1,13 +1,86 @@
+from collections.abc import MutableMapping
+from functools import cache, lru_cache
+
 from ldap.filter import escape_filter_chars
 
 from .converters import (
     BinaryConverter,
     BoolConverter,
     Converter,
+    DNConverter,
     GeneralTimeConverter,
 )
 
 
+# Number of conversion plans kept, see Model.get_conversion_plan()
+CONVERSION_PLAN_CACHE_SIZE = 256
+
+
+def pkey_sort_key(value):
+    """Return a key that sorts primary keys in the order of the LDAP server.
+
+    The server compares the primary keys (``uid`` and ``cn``) with the caseIgnoreOrderingMatch
+    rule, after lower-casing them and removing the insignificant spaces. Primary keys that are
+    paginated outside of the server, as in the replica, must be compared with this key so that
+    the pages follow each other like the server's do.
+    """
+    return " ".join(value.lower().split())
+
+
+class Record(MutableMapping):
+    """A converted entry that stores its values in slots, it is much smaller than a dictionary.
+
+    Each model has its own subclass, see :meth:`Model.get_record_class`. Records can be used as
+    the dictionaries returned by :meth:`Model.convert_ldap_result`, their keys are limited to
+    the model's fields.
+    """
+
+    __slots__ = ()
+    # The model, and the names of its fields in order, set on the subclasses
+    _model = None
+    _fields = ()
+    _keys = frozenset()
+
+    def __getitem__(self, key):
+        if key in self._keys:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self._keys:
+            return getattr(self, key, default)
+        return default
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return (name for name in self._fields if hasattr(self, name))
+
+    def __len__(self):
+        return sum(1 for _name in self)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {dict(self)!r}>"
+
+    def __reduce__(self):
+        # The subclasses are generated, they can't be pickled by reference
+        return _make_record, (self._model, dict(self))
+
+
 class Model:
     primary_key = None
     filters = "(objectClass=*)"
@@ -16,6 +89,8 @@ class Model:
     hidden_fields = []
     # Search attributes that will never be a searched as a substring
     always_exact_match = []
+    # Fields that change whenever the entry is modified, see get_version()
+    version_fields = []
 
     @classmethod
     def get_sub_dn_for(cls, name):
@@ -30,6 +105,22 @@ class Model:
             if key not in cls.hidden_fields
         ]
 
+    @classmethod
+    def get_version_ldap_attrs(cls):
+        return [cls.fields[name].ldap_name for name in cls.version_fields]
+
+    @classmethod
+    def get_version(cls, entry):
+        """Return a string that changes when the entry is modified.
+
+        Returns:
+            str or None: the version, or ``None`` if the entry has none of the version fields.
+        """
+        values = [entry.get(name) for name in cls.version_fields]
+        if all(value is None for value in values):
+            return None
+        return "-".join(str(value) for value in values)
+
     @classmethod
     def attr_to_ldap(cls, attr):
         return cls.fields[attr].ldap_name
@@ -40,16 +131,62 @@ class Model:
             return None
         return [cls.attr_to_ldap(name) for name in attrs if name in cls.fields]
 
+    @classmethod
+    def get_conversion_plan(cls, ldap_names):
+        """Return the fields to convert in an LDAP result that has these attributes.
+
+        The plan is computed once per projection: the results of a search have the attributes
+        that were requested, except those that are empty.
+
+        Args:
+            ldap_names (tuple): The names of the result's attributes.
+
+        Returns:
+            tuple: the ``(name, ldap_name, converter)`` tuples, in the order of the fields.
+        """
+        return _get_conversion_plan(cls, ldap_names)
+
     @classmethod
     def convert_ldap_result(cls, result):
-        new_result = {}
-        for dest_name, converter in cls.fields.items():
-            try:
-                existing_value = result[converter.ldap_name]
-            except KeyError:
-                continue
-            new_result[dest_name] = converter.from_ldap(existing_value)
-        return new_result
+        return {
+            name: converter.from_ldap(result[ldap_name])
+            for name, ldap_name, converter in _get_conversion_plan(cls, tuple(result))
+        }
+
+    @classmethod
+    def get_record_class(cls):
+        """Return the :class:`Record` subclass that stores the model's entries in slots."""
+        return _get_record_class(cls)
+
+    @classmethod
+    def convert_ldap_results(cls, results, compact=False):
+        """Convert the entries of a result page, attribute by attribute.
+
+        The entries that have the same attributes are converted together: each attribute is
+        converted with one call to :meth:`Converter.from_ldap_many`.
+
+        Args:
+            results (iterable): The LDAP results.
+            compact (bool): Return records (see :meth:`get_record_class`) instead of
+                dictionaries.
+
+        Returns:
+            list: the converted entries, in the same order.
+        """
+        factory = _get_record_class(cls) if compact else dict
+        converted = []
+        # attribute names -> [(result, converted entry)]
+        projections = {}
+        for result in results:
+            entry = factory()
+            converted.append(entry)
+            projections.setdefault(tuple(result), []).append((result, entry))
+        for ldap_names, pairs in projections.items():
+            for name, ldap_name, converter in _get_conversion_plan(cls, ldap_names):
+                column = converter.from_ldap_many([result[ldap_name] for result, _entry in pairs])
+                for index, value in enumerate(column):
+                    pairs[index][1][name] = value
+        return converted
 
     @classmethod
     def get_search_attrs_map(cls):
@@ -80,7 +217,7 @@ class UserModel(Model):
         "creation": GeneralTimeConverter("fasCreationTime"),
         "is_private": BoolConverter("fasIsPrivate"),
         "locked": BoolConverter("nsAccountLock"),
-        "groups": Converter("memberof", multivalued=True),
+        "groups": DNConverter("memberof", multivalued=True),
         "github_username": Converter("fasGitHubUsername"),
         "gitlab_username": Converter("fasGitLabUsername"),
         "pronouns": Converter("fasPronoun", multivalued=True),
@@ -89,8 +226,11 @@ class UserModel(Model):
         "rssurl": Converter("fasRssURL"),
         "websites": Converter("fasWebsiteURL", multivalued=True),
         "rssurls": Converter("fasRssURL", multivalued=True),
+        "usn": Converter("entryUSN"),
+        "modified": Converter("modifyTimestamp"),
     }
-    hidden_fields = ["groups"]
+    hidden_fields = ["groups", "usn", "modified"]
+    version_fields = ["usn", "modified"]
     private_fields = [
         "human_name",
         "surname",
@@ -151,7 +291,7 @@ class SponsorModel(Model):
     filters = "(&(objectClass=fasUser)(!(nsAccountLock=TRUE)))"
     sub_dn = "cn=users,cn=accounts"
     fields = {
-        "sponsors": Converter("memberManager", multivalued=True),
+        "sponsors": DNConverter("memberManager", multivalued=True),
     }
 
 
@@ -166,7 +306,11 @@ class GroupModel(Model):
         "url": Converter("fasurl"),
         "irc": Converter("fasircchannel", multivalued=True),
         "discussion_url": Converter("fasdiscussionurl"),
+        "usn": Converter("entryUSN"),
+        "modified": Converter("modifyTimestamp"),
     }
+    hidden_fields = ["usn", "modified"]
+    version_fields = ["usn", "modified"]
 
 
 class AgreementModel(Model):
@@ -176,3 +320,29 @@ class AgreementModel(Model):
     fields = {
         "name": Converter("cn"),
     }
+
+
+@lru_cache(maxsize=CONVERSION_PLAN_CACHE_SIZE)
+def _get_conversion_plan(model, ldap_names):
+    return tuple(
+        (name, converter.ldap_name, converter)
+        for name, converter in model.fields.items()
+        if converter.ldap_name in ldap_names
+    )
+
+
+@cache
+def _get_record_class(model):
+    names = tuple(model.fields)
+    return type(
+        f"{model.__name__}Record",
+        (Record,),
+        {"__slots__": names, "_model": model, "_fields": names, "_keys": frozenset(names)},
+    )
+
+
+def _make_record(model, values):
+    record = _get_record_class(model)()
+    for name, value in values.items():
+        record[name] = value
+    return record
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import ldap
+
+
+class ConnectionPool:
+    """A per-process pool of bound LDAP clients.
+
+    Binding to the LDAP server with GSSAPI is expensive, so instead of opening a new connection for
+    every request, clients are returned to this pool at the end of the request and can be borrowed
+    again by a later request made with the same identity.
+
+    Clients are keyed by an opaque, hashable ``key`` that must include everything the connection
+    is bound to (server URI, base DN and authenticated user), a client is never handed out to a
+    different identity.
+
+    Args:
+        max_size (int): The maximum number of idle clients kept in the pool. If this is zero,
+            pooling is disabled and clients are closed when they are released.
+        idle_timeout (int): Idle clients are closed after this number of seconds.
+        check_interval (int): Clients that have been idle for longer than this number of seconds
+            are checked before being reused, and replaced if the connection is dead.
+    """
+
+    def __init__(self, max_size=10, idle_timeout=300, check_interval=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        # Idle clients, least recently used first: a list of (key, client, release time)
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self, key, factory):
+        """Borrow a client from the pool, or create one with ``factory`` if there is none.
+
+        Args:
+            key (hashable): The identity the client is bound with.
+            factory (callable): Called without arguments to create a new client.
+
+        Returns:
+            LDAP: a bound client
+        """
+        now = time.monotonic()
+        client = released_at = None
+        with self._lock:
+            expired = self._pop_expired(now)
+            for index in range(len(self._idle) - 1, -1, -1):
+                if self._idle[index][0] == key:
+                    _key, client, released_at = self._idle.pop(index)
+                    break
+        for idle_client in expired:
+            self._close(idle_client)
+        if client is not None:
+            if now - released_at < self.check_interval or self._is_alive(client):
+                self._count("reused")
+                return client
+            self._close(client)
+        self._count("created")
+        return factory()
+
+    def release(self, key, client):
+        """Give a client back to the pool once the request is done with it.
+
+        Args:
+            key (hashable): The identity the client was acquired with.
+            client (LDAP): The client to give back.
+        """
+        with self._lock:
+            self._idle.append((key, client, time.monotonic()))
+            overflow = self._idle[: max(len(self._idle) - self.max_size, 0)]
+            del self._idle[: len(overflow)]
+        for _key, idle_client, _released_at in overflow:
+            self._close(idle_client)
+
+    def discard(self, client):
+        """Close a client that must not be reused, for example after a server error."""
+        self._close(client)
+
+    def clear(self):
+        """Close all idle clients."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _key, client, _released_at in idle:
+            self._close(client)
+
+    def _pop_expired(self, now):
+        expired = [
+            client
+            for _key, client, released_at in self._idle
+            if now - released_at >= self.idle_timeout
+        ]
+        if expired:
+            self._idle = [item for item in self._idle if item[1] not in expired]
+        return expired
+
+    def _is_alive(self, client):
+        try:
+            client.whoami()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    def _count(self, stat):
+        # Requests run in several threads
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _close(self, client):
+        self._count("discarded")
+        try:
+            client.close()
+        except ldap.LDAPError:
+            pass
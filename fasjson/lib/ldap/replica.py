@@ -0,0 +1,369 @@
+import contextlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+import gssapi
+import gssapi.raw
+import ldap
+from ldap.ldapobject import ReconnectLDAPObject
+from ldap.syncrepl import SyncreplConsumer
+
+from .models import GroupModel, pkey_sort_key, UserModel
+
+
+log = logging.getLogger(__name__)
+
+# The e-syncRefreshRequired result code: the server can't resume from our cookie
+SYNC_REFRESH_REQUIRED = 4096
+
+REPLICA_FILTER = "(|(objectClass=fasUser)(objectClass=fasGroup))"
+
+
+def _has_object_class(attrs, object_class):
+    return object_class in (value.lower() for value in attrs.get("objectclass", []))
+
+
+def _is_active_user(attrs):
+    return (
+        _has_object_class(attrs, b"fasuser")
+        and attrs.get("nsaccountlock", [b""])[0].upper() != b"TRUE"
+    )
+
+
+def _is_group(attrs):
+    return _has_object_class(attrs, b"fasgroup")
+
+
+# What the models' filters match, evaluated on the local entries
+MODEL_MATCHERS = {UserModel: _is_active_user, GroupModel: _is_group}
+
+
+class _Consumer(ReconnectLDAPObject, SyncreplConsumer):
+    """Pass the content synchronization messages on to the replica."""
+
+    def __init__(self, uri, replica, **kwargs):
+        super().__init__(uri, **kwargs)
+        self.replica = replica
+
+    def syncrepl_get_cookie(self):
+        return self.replica.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self.replica._set_cookie(cookie)
+
+    def syncrepl_entry(self, dn, attrs, uuid):
+        self.replica._store(uuid, dn, attrs)
+
+    def syncrepl_delete(self, uuids):
+        self.replica._delete(uuids)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        self.replica._present(uuids, refreshDeletes)
+
+    def syncrepl_refreshdone(self):
+        self.replica._refresh_done()
+
+
+class Replica:
+    """A local copy of the users and groups, kept up to date by the LDAP server.
+
+    The replica uses the Content Synchronization protocol (RFC 4533) in refreshAndPersist mode,
+    in a background thread: once the initial refresh is done, the server sends the changes as
+    they happen. Until then, and whenever the connection is lost, ``ready`` is false and the
+    callers must query the LDAP server instead.
+
+    The replica connects with the service's credentials, not those of the users. It must only be
+    enabled if the service can read the same attributes as the users. The credentials are obtained
+    from the ``keytab`` into a credentials cache of the replica's own, which is the default cache
+    of the replica's thread only: the process-wide ``KRB5CCNAME`` points to the delegated
+    credentials of the user of the current request.
+
+    If a ``path`` is given, the entries and the synchronization cookie are saved in this file, so
+    that a restarted process only has to fetch the changes made in the meantime.
+
+    Args:
+        uri (str or callable): The LDAP server URI, or a function returning it, which is called
+            before each connection.
+        basedn (str): The base DN of the directory.
+        keytab (str, optional): The client keytab to get the service's credentials from, defaults
+            to the default client keytab of the Kerberos library.
+        path (str, optional): The file to save the replica in.
+        retry_interval (int): Seconds to wait before reconnecting after an error.
+        persist_interval (int): The replica is saved at most every this number of seconds.
+        poll_timeout (int): Seconds to wait for changes before checking if the replica should be
+            saved or stopped.
+    """
+
+    def __init__(
+        self,
+        uri,
+        basedn,
+        keytab=None,
+        path=None,
+        retry_interval=60,
+        persist_interval=300,
+        poll_timeout=10,
+    ):
+        self.uri = uri
+        self.basedn = basedn
+        self.keytab = keytab
+        self.path = path
+        self.retry_interval = retry_interval
+        self.persist_interval = persist_interval
+        self.poll_timeout = poll_timeout
+        self.cookie = None
+        self.ready = False
+        # uuid -> (dn, attributes). The attribute names are lower-cased.
+        self._entries = {}
+        # lower-cased DN -> uuid
+        self._by_dn = {}
+        # lower-cased group DN -> uuids of the entries that are members of it
+        self._members = {}
+        # uuids presented by the server during the refresh phase
+        self._present_uuids = set()
+        self._dirty = False
+        self._persisted_at = 0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        # MEMORY caches are private to the process
+        self._ccache = f"MEMORY:fasjson-replica-{id(self)}"
+        self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def attrs(self):
+        """The attributes that are replicated."""
+        names = {"objectClass", "nsAccountLock", "memberOf"}
+        for model in (UserModel, GroupModel):
+            names.update(model.get_ldap_attrs())
+            names.update(model.get_version_ldap_attrs())
+        return sorted(names)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="fasjson-replica", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # Reading
+
+    def get(self, model, name):
+        """Return an entry, converted with the model, or ``None`` if it does not exist."""
+        with self._lock:
+            attrs = self._get_attrs(model.get_sub_dn_for(name))
+        if attrs is None or not MODEL_MATCHERS[model](attrs):
+            return None
+        return self._convert(model, attrs)
+
+    def get_group_members(self, groupname):
+        """Return the names of the active users who are members of a group, sorted."""
+        group_dn = f"{GroupModel.get_sub_dn_for(groupname)},{self.basedn}".lower()
+        with self._lock:
+            members = [self._entries[uuid][1] for uuid in self._members.get(group_dn, ())]
+        usernames = [attrs["uid"][0].decode("utf-8") for attrs in members if _is_active_user(attrs)]
+        return sorted(usernames, key=pkey_sort_key)
+
+    def is_member(self, groupname, username):
+        group_dn = f"{GroupModel.get_sub_dn_for(groupname)},{self.basedn}".lower()
+        user_dn = f"{UserModel.get_sub_dn_for(username)},{self.basedn}".lower()
+        with self._lock:
+            uuid = self._by_dn.get(user_dn)
+            if uuid is None or uuid not in self._members.get(group_dn, ()):
+                return False
+            return _is_active_user(self._entries[uuid][1])
+
+    def _get_attrs(self, sub_dn):
+        uuid = self._by_dn.get(f"{sub_dn},{self.basedn}".lower())
+        if uuid is None:
+            return None
+        return self._entries[uuid][1]
+
+    def _convert(self, model, attrs):
+        # The model expects the attribute names as they are spelled in its fields
+        return model.convert_ldap_result(
+            {
+                converter.ldap_name: attrs[converter.ldap_name.lower()]
+                for converter in model.fields.values()
+                if converter.ldap_name.lower() in attrs
+            }
+        )
+
+    # Synchronization
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sync()
+            except ldap.LDAPError as e:
+                self.ready = False
+                info = e.args[0] if e.args and isinstance(e.args[0], dict) else {}
+                if info.get("result") == SYNC_REFRESH_REQUIRED:
+                    log.info("The replica needs a full refresh")
+                    self._reset()
+                    continue
+                log.warning("The replica synchronization failed: %s", e)
+            except gssapi.exceptions.GSSError as e:
+                log.warning("The replica could not get the service's credentials: %s", e)
+            self.ready = False
+            self._stop.wait(self.retry_interval)
+
+    def _acquire_credentials(self):
+        # The GSSAPI SASL mechanism uses the default credentials cache, make it the replica's for
+        # this thread, and get a ticket from the keytab into it if needed.
+        gssapi.raw.krb5_ccache_name(self._ccache.encode("utf-8"))
+        store = {"ccache": self._ccache}
+        if self.keytab is not None:
+            store["client_keytab"] = self.keytab
+        gssapi.Credentials(usage="initiate", store=store)
+
+    def _sync(self):
+        self._acquire_credentials()
+        uri = self.uri() if callable(self.uri) else self.uri
+        conn = _Consumer(uri, self, retry_max=3)
+        conn.protocol_version = 3
+        conn.sasl_gssapi_bind_s()
+        try:
+            self._present_uuids = set()
+            msgid = conn.syncrepl_search(
+                f"cn=accounts,{self.basedn}",
+                ldap.SCOPE_SUBTREE,
+                mode="refreshAndPersist",
+                filterstr=REPLICA_FILTER,
+                attrlist=self.attrs,
+            )
+            while not self._stop.is_set():
+                try:
+                    if not conn.syncrepl_poll(msgid=msgid, timeout=self.poll_timeout):
+                        break
+                except ldap.TIMEOUT:
+                    pass
+                self._maybe_persist()
+        finally:
+            try:
+                conn.unbind_s()
+            except ldap.LDAPError:
+                pass
+
+    def _set_cookie(self, cookie):
+        with self._lock:
+            self.cookie = cookie
+            self._dirty = True
+
+    def _store(self, uuid, dn, attrs):
+        with self._lock:
+            self._index(uuid, dn, {name.lower(): values for name, values in attrs.items()})
+            self._dirty = True
+
+    def _delete(self, uuids):
+        with self._lock:
+            for uuid in uuids:
+                self._unindex(uuid)
+            self._dirty = True
+
+    def _present(self, uuids, refresh_deletes):
+        if uuids is not None:
+            self._present_uuids.update(uuids)
+            return
+        if not refresh_deletes:
+            # The entries that were not presented have been deleted
+            with self._lock:
+                self._delete([uuid for uuid in self._entries if uuid not in self._present_uuids])
+        self._present_uuids = set()
+
+    def _refresh_done(self):
+        log.info("The replica is up to date with %d entries", len(self._entries))
+        self.ready = True
+        # Save the replica as soon as possible
+        self._persisted_at = 0
+
+    def _reset(self):
+        with self._lock:
+            self.cookie = None
+            self._entries = {}
+            self._by_dn = {}
+            self._members = {}
+            self._dirty = True
+
+    def _index(self, uuid, dn, attrs):
+        self._unindex(uuid)
+        self._entries[uuid] = (dn, attrs)
+        self._by_dn[dn.lower()] = uuid
+        for group_dn in attrs.get("memberof", []):
+            self._members.setdefault(group_dn.decode("utf-8").lower(), set()).add(uuid)
+
+    def _unindex(self, uuid):
+        entry = self._entries.pop(uuid, None)
+        if entry is None:
+            return
+        dn, attrs = entry
+        self._by_dn.pop(dn.lower(), None)
+        for group_dn in attrs.get("memberof", []):
+            self._members.get(group_dn.decode("utf-8").lower(), set()).discard(uuid)
+
+    # Persistence
+
+    def _maybe_persist(self):
+        if not self.path or not self._dirty:
+            return
+        if time.monotonic() - self._persisted_at < self.persist_interval:
+            return
+        self._persist()
+
+    def _persist(self):
+        with self._lock:
+            data = {"cookie": self.cookie, "entries": dict(self._entries)}
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".fasjson-replica-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                # Don't rename a file that is not entirely on disk yet
+                f.flush()
+                os.fsync(f.fileno())
+            # Several processes may save the replica, each file is complete and consistent.
+            os.replace(tmp_path, self.path)
+        except (OSError, pickle.PicklingError) as e:
+            log.warning("Could not save the replica to %s: %s", self.path, e)
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            return
+        self._persisted_at = time.monotonic()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+                    # Only unpickle what this service wrote
+                    raise ValueError(
+                        "the file is not owned by this service or can be modified by others"
+                    )
+                data = pickle.load(f)  # noqa: S301
+            cookie = data["cookie"]
+            with self._lock:
+                for uuid, (dn, attrs) in data["entries"].items():
+                    self._index(uuid, dn, attrs)
+                self.cookie = cookie
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            # Unpickling a corrupted file can raise about anything
+            log.warning(
+                "Could not load the replica from %s, it will be fully refreshed: %s", self.path, e
+            )
+            self._reset()
+            self._dirty = False
+            with contextlib.suppress(OSError):
+                os.unlink(self.path)
@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class DirectoryVersion:
+    """Track a value that changes whenever the directory is modified.
+
+    The value is probed at most once every ``interval`` seconds, by a single thread: the others
+    don't wait for the probe and keep using what they have cached.
+
+    The last value seen is kept in the ``store``, which must be shared like the caches that depend
+    on it. The first probe of a process is then compared with the value seen by the previous
+    processes, and the shared caches they filled are cleared if the directory has changed since.
+    Without a store, or once the value has expired from it, the value is considered changed.
+
+    Args:
+        interval (int): The minimum number of seconds between two probes.
+        store (TTLCache or SQLiteCache, optional): The cache to keep the last value in.
+    """
+
+    def __init__(self, interval=5, store=None):
+        self.interval = interval
+        self.store = store
+        self.value = None
+        self.stats = {"probes": 0, "changes": 0}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def update(self, probe):
+        """Probe the directory if the last probe is older than the interval.
+
+        Args:
+            probe (callable): A function returning the current value.
+
+        Returns:
+            bool: whether the value has changed since the last value seen.
+        """
+        if self._checked_at is not None and time.monotonic() < self._checked_at + self.interval:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            value = probe()
+            self._checked_at = time.monotonic()
+            self.stats["probes"] += 1
+            previous = self.value if self.store is None else self.store.get("value")
+            changed = value != previous
+            if changed:
+                self.stats["changes"] += 1
+                if self.store is not None:
+                    self.store.set("value", value)
+            self.value = value
+            return changed
+        finally:
+            self._lock.release()
@@ -26,6 +26,11 @@ def app(fixture_dir):
     return app
 
 
+@pytest.fixture
+def secret_key(app):
+    app.config["SECRET_KEY"] = "dummy"  # noqa: S105
+
+
 @pytest.fixture
 def gss_env(fixture_dir):
     output = {}
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from fasjson.lib.ldap.bloom import BloomFilter, NameFilter
+from fasjson.lib.ldap.models import GroupModel, UserModel
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter.from_keys(f"user-{idx}" for idx in range(1000))
+    assert len(bloom_filter) == 1000
+    assert all(f"user-{idx}" in bloom_filter for idx in range(1000))
+    false_positives = sum(f"other-{idx}" in bloom_filter for idx in range(10000))
+    # The expected error rate is 1%
+    assert false_positives < 300
+
+
+def test_bloom_filter_empty():
+    bloom_filter = BloomFilter.from_keys([])
+    assert len(bloom_filter) == 0
+    assert "dummy" not in bloom_filter
+
+
+@pytest.fixture
+def clock(mocker):
+    monotonic = mocker.patch("fasjson.lib.ldap.bloom.time.monotonic")
+    monotonic.return_value = 1000
+    return monotonic
+
+
+def test_name_filter(clock, mocker):
+    name_filter = NameFilter(ttl=60, background=False)
+    get_names = mocker.Mock(return_value=("Dummy", "other"))
+    assert name_filter.may_exist(UserModel, "dummy", get_names) is True
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is False
+    get_names.assert_called_once_with()
+    assert name_filter.stats == {"rejections": 1, "rebuilds": 1, "failures": 0}
+    assert len(name_filter) == 2
+
+    # The filter is rebuilt when it expires
+    clock.return_value = 1060
+    get_names.return_value = ("dummy", "other", "unknown")
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is True
+    assert name_filter.stats == {"rejections": 1, "rebuilds": 2, "failures": 0}
+
+
+def test_name_filter_background(clock, mocker):
+    name_filter = NameFilter()
+    names = threading.Event()
+
+    def get_names():
+        names.wait()
+        return ["dummy"]
+
+    # Names are not rejected while the filter is built
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is True
+    names.set()
+    for _i in range(100):
+        if not name_filter._lock.locked():
+            break
+        time.sleep(0.01)
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is False
+
+
+def test_name_filter_expired(clock, mocker):
+    # An expired filter does not reject names while it is rebuilt
+    name_filter = NameFilter(ttl=60, background=False)
+    name_filter.may_exist(UserModel, "dummy", lambda: ["dummy"])
+    clock.return_value = 1060
+    with name_filter._lock:
+        assert name_filter.may_exist(UserModel, "unknown", mocker.Mock()) is True
+
+
+def test_name_filter_failure(clock, mocker):
+    name_filter = NameFilter(background=False)
+    get_names = mocker.Mock(side_effect=RuntimeError("server down"))
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is True
+    assert name_filter.stats["failures"] == 1
+    assert len(name_filter) == 0
+    # Not retried before the retry interval
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is True
+    assert get_names.call_count == 1
+    clock.return_value = 1000 + NameFilter.retry_interval
+    get_names.side_effect = None
+    get_names.return_value = ["dummy"]
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is False
+
+
+def test_name_filter_invalidated_while_building(clock):
+    name_filter = NameFilter(background=False)
+
+    def get_names():
+        name_filter.invalidate()
+        return ["dummy"]
+
+    assert name_filter.may_exist(UserModel, "unknown", get_names) is True
+    # The filter was built from names that may be outdated, it was not stored
+    assert len(name_filter) == 0
+    assert name_filter.stats["rebuilds"] == 0
+
+
+def test_name_filter_by_model(clock):
+    name_filter = NameFilter(background=False)
+    name_filter.may_exist(UserModel, "dummy", lambda: ["dummy"])
+    assert name_filter.may_exist(GroupModel, "dummy", lambda: ["group"]) is False
+    name_filter.invalidate(lambda name: name == "GroupModel")
+    assert len(name_filter) == 1
+    name_filter.invalidate()
+    assert len(name_filter) == 0
+
+
+def test_name_filter_rebuilding(clock, mocker):
+    # While another thread builds the filter, names are not rejected
+    name_filter = NameFilter(background=False)
+    get_names = mocker.Mock()
+    with name_filter._lock:
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(name_filter.may_exist(UserModel, "dummy", get_names))
+        )
+        thread.start()
+        thread.join()
+    assert result == [True]
+    get_names.assert_not_called()
@@ -0,0 +1,174 @@
+import pytest
+
+from fasjson.lib.ldap.cache import SQLiteCache, TTLCache
+
+
+@pytest.fixture
+def monotonic(mocker):
+    clock = mocker.patch("fasjson.lib.ldap.cache.time.monotonic")
+    clock.return_value = 1000
+    return clock
+
+
+def test_cache_get_set(monotonic):
+    cache = TTLCache()
+    assert cache.get("key") is None
+    assert cache.get("key", "default") == "default"
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert "key" in cache
+    assert len(cache) == 1
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_cache_expiration(monotonic):
+    cache = TTLCache(ttl=60)
+    cache.set("key", "value")
+    monotonic.return_value = 1059
+    assert cache.get("key") == "value"
+    monotonic.return_value = 1060
+    assert cache.get("key") is None
+    assert "key" not in cache
+    assert cache.size == 0
+
+
+def test_cache_lru(monotonic):
+    cache = TTLCache(max_size=2)
+    cache.set("key1", "value1")
+    cache.set("key2", "value2")
+    # Use key1 so that key2 is the least recently used
+    cache.get("key1")
+    cache.set("key3", "value3")
+    assert "key1" in cache
+    assert "key2" not in cache
+    assert "key3" in cache
+    assert cache.stats["evictions"] == 1
+
+
+def test_cache_sizeof(monotonic):
+    cache = TTLCache(max_size=5, sizeof=len)
+    cache.set("key1", ("a", "b", "c"))
+    cache.set("key2", ("a", "b"))
+    assert cache.size == 5
+    cache.set("key3", ("a",))
+    assert "key1" not in cache
+    assert cache.size == 3
+    # Replacing a value updates the size
+    cache.set("key3", ("a", "b", "c"))
+    assert cache.size == 5
+    # Values that are too large are not stored
+    cache.set("key4", ("a", "b", "c", "d", "e", "f"))
+    assert "key4" not in cache
+    assert cache.size == 5
+
+
+def test_cache_delete(monotonic):
+    cache = TTLCache()
+    cache.set("key", "value")
+    cache.delete("key")
+    cache.delete("unknown")
+    assert "key" not in cache
+    assert cache.size == 0
+
+
+def test_cache_invalidate(monotonic):
+    cache = TTLCache()
+    cache.set(("users", 1), "value1")
+    cache.set(("groups", 2), "value2")
+    cache.invalidate(lambda key: key[0] == "users")
+    assert ("users", 1) not in cache
+    assert ("groups", 2) in cache
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+@pytest.fixture
+def wallclock(mocker):
+    clock = mocker.patch("fasjson.lib.ldap.cache.time.time")
+    clock.return_value = 1000
+    return clock
+
+
+@pytest.fixture
+def sqlite_cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite")
+
+
+def test_sqlite_cache_get_set(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path)
+    assert cache.get("key") is None
+    assert cache.get("key", "default") == "default"
+    cache.set("key", {"value": ("a", "b")})
+    assert cache.get("key") == {"value": ("a", "b")}
+    assert "key" in cache
+    assert len(cache) == 1
+    assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+
+
+def test_sqlite_cache_shared(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path, namespace="entries")
+    other_process = SQLiteCache(sqlite_cache_path, namespace="entries")
+    other_namespace = SQLiteCache(sqlite_cache_path, namespace="pkeys")
+    cache.set(("UserModel", "dummy", frozenset(["uid", "mail", "cn"])), "value")
+    assert other_process.get(("UserModel", "dummy", frozenset(["cn", "mail", "uid"]))) == "value"
+    assert len(other_namespace) == 0
+
+
+def test_sqlite_cache_expiration(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path, ttl=60)
+    cache.set("key", "value")
+    wallclock.return_value = 1059
+    assert cache.get("key") == "value"
+    wallclock.return_value = 1060
+    assert cache.get("key") is None
+    assert "key" not in cache
+    assert cache.size == 0
+
+
+def test_sqlite_cache_eviction(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path, max_size=5, sizeof=len)
+    cache.set("key1", ("a", "b", "c"))
+    wallclock.return_value = 1001
+    cache.set("key2", ("a", "b"))
+    assert cache.size == 5
+    # The oldest value is evicted
+    cache.set("key3", ("a",))
+    assert "key1" not in cache
+    assert "key2" in cache
+    assert cache.size == 3
+    assert cache.stats["evictions"] == 1
+    # Too big to be cached
+    cache.set("key2", ("a", "b", "c", "d", "e", "f"))
+    assert "key2" not in cache
+
+
+def test_sqlite_cache_eviction_all(wallclock, sqlite_cache_path):
+    # Another process stored a value bigger than this cache's maximum size
+    SQLiteCache(sqlite_cache_path, max_size=10, ttl=120, sizeof=len).set("key1", tuple("abcdef"))
+    cache = SQLiteCache(sqlite_cache_path, max_size=5, sizeof=len)
+    cache.set("key2", ("a",))
+    assert cache.size == 0
+    assert cache.stats["evictions"] == 2
+
+
+def test_sqlite_cache_invalidate(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path)
+    cache.set(("users", 1), "value1")
+    cache.set(("groups", 1), "value2")
+    cache.invalidate(lambda key: key[0] == "users")
+    assert ("users", 1) not in cache
+    assert ("groups", 1) in cache
+    cache.delete(("groups", 1))
+    assert len(cache) == 0
+    cache.set("key", "value")
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_sqlite_cache_rollback(wallclock, sqlite_cache_path):
+    cache = SQLiteCache(sqlite_cache_path)
+    cache.set("key", "value")
+    with pytest.raises(ValueError):
+        cache.invalidate(lambda key: int(key))
+    assert "key" in cache
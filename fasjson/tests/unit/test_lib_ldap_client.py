@@ -1,11 +1,20 @@
 import datetime
+import pickle
 import types
 from unittest import mock
 
+import ldap
 import pytest
 from ldap.controls.pagedresults import SimplePagedResultsControl
+from ldap.controls.sss import SSSRequestControl
+from ldap.controls.vlv import VLVRequestControl, VLVResponseControl
 
+from fasjson.lib.ldap.bloom import NameFilter
+from fasjson.lib.ldap.cache import TTLCache
 from fasjson.lib.ldap.client import LDAP, LDAPResult
+from fasjson.lib.ldap.models import GroupModel, Record, UserModel
+from fasjson.lib.ldap.replica import Replica
+from fasjson.lib.ldap.version import DirectoryVersion
 
 
 @pytest.fixture
@@ -45,6 +54,13 @@ def test_whoami_user(mock_connection):
     assert expected == ldap.whoami()
 
 
+def test_close(mock_connection):
+    mock_connection.unbind_s = mock.Mock()
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    ldap.close()
+    mock_connection.unbind_s.assert_called_once_with()
+
+
 def test_whoami_service(mock_connection):
     r = (
         "dn: krbprincipalname=test/fasjson.example.test@example.test,"
@@ -122,6 +138,29 @@ def test_get_group_members(mock_connection):
     result = ldap.get_group_members("admins", ["username"], page_number=1, page_size=0)
     expected = LDAPResult(items=[{"username": "admin"}], total=1, page_size=0, page_number=1)
     assert result == expected
+    assert mock_connection.search_ext.call_args[1]["attrlist"] == [
+        "uid",
+        "entryUSN",
+        "modifyTimestamp",
+    ]
+
+
+def test_iter_group_members(mock_connection):
+    mocked = [{"uid": [b"admin"]}, {"uid": [b"dummy"]}]
+    mock_connection.result3 = _single_page_result_factory(mocked)
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    result = ldap.iter_group_members("admins", ["username"])
+    assert isinstance(result, types.GeneratorType)
+    mock_connection.search_ext.assert_not_called()
+    assert list(result) == [{"username": "admin"}, {"username": "dummy"}]
+    call_args = mock_connection.search_ext.call_args
+    assert call_args[0][2] == (
+        "(&(memberOf=cn=admins,cn=groups,cn=accounts,dc=example,dc=test)"
+        "(&(objectClass=fasUser)(!(nsAccountLock=TRUE))))"
+    )
+    assert call_args[1]["attrlist"] == ["uid"]
 
 
 def test_get_group_sponsors(mock_connection):
@@ -183,18 +222,44 @@ def test_sponsors_to_users_empty(mock_connection):
     assert result == expected
 
 
-def test_list_sponsors_uid(mock_connection):
-    mocked = [{"uid": [b"josephthornton"]}]
-    mock_connection.result3 = _single_page_result_factory(mocked)
-
+def test_sponsors_to_users_unknown_dn(mock_connection):
+    # Sponsors that are neither users nor groups are ignored
     ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
     sponsors_dn = LDAPResult(
-        items=[{"sponsors": ["cn=translators,cn=groups,cn=accounts,dc=example,dc=test"]}]
+        items=[{"sponsors": ["krbprincipalname=HTTP/fasjson,cn=services,cn=accounts"]}]
     )
-    result = ldap._list_sponsors_uid(sponsors_dn, attrs=None)
+    assert ldap._sponsors_to_users(sponsors_dn, attrs=None) == []
+    mock_connection.search_ext.assert_not_called()
+
 
-    expected = ["josephthornton"]
-    assert list(result) == expected
+def test_sponsors_to_users_groups(mock_connection):
+    mocked = [{"uid": [b"admin"]}, {"uid": [b"josephthornton"]}]
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory(mocked))
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    sponsors_dn = LDAPResult(
+        items=[
+            {
+                "sponsors": [
+                    "cn=translators,cn=groups,cn=accounts,dc=example,dc=test",
+                    "uid=admin,cn=users,cn=accounts,dc=example,dc=test",
+                    "cn=admins,cn=groups,cn=accounts,dc=example,dc=test",
+                ]
+            }
+        ]
+    )
+    result = ldap._sponsors_to_users(sponsors_dn, attrs=["username"])
+
+    assert result == [{"username": "admin"}, {"username": "josephthornton"}]
+    # A single search for all the sponsors
+    assert mock_connection.search_ext.call_count == 1
+    member_filter = "(&(objectClass=fasUser)(!(nsAccountLock=TRUE)))"
+    assert mock_connection.search_ext.call_args[0][2] == (
+        "(&(objectClass=fasUser)(|(uid=admin)"
+        f"(&(memberOf=cn=admins,cn=groups,cn=accounts,dc=example,dc=test){member_filter})"
+        f"(&(memberOf=cn=translators,cn=groups,cn=accounts,dc=example,dc=test){member_filter})"
+        "))"
+    )
 
 
 def test_check_membership(mock_connection):
@@ -221,6 +286,67 @@ def test_check_membership_duplicate(mock_connection):
         ldap.check_membership("admins", "admin")
 
 
+def test_check_membership_stops_early(mock_connection):
+    page = (
+        101,
+        [("", {"uid": [b"admin"]})] * 3,
+        1,
+        [SimplePagedResultsControl(True, size=3, cookie="next")],
+    )
+    mock_connection.result3 = mock.Mock(return_value=page)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    with pytest.raises(ValueError):
+        ldap.check_membership("admins", "admin")
+    # The next page was not requested, the paged search was ended
+    assert mock_connection.search_ext.call_count == 2
+    page_control = mock_connection.search_ext.call_args[1]["serverctrls"][0]
+    assert page_control.size == 0
+    assert page_control.cookie == "next"
+
+
+def test_check_memberships(mock_connection):
+    groups_suffix = "cn=groups,cn=accounts,dc=example,dc=test"
+    mocked_groups = [{"cn": [b"admins"]}, {"cn": [b"Packagers"]}]
+    mocked_users = [
+        {
+            "uid": [b"admin"],
+            "memberof": [
+                f"cn=admins,{groups_suffix}".encode("ascii"),
+                f"cn=packagers,{groups_suffix}".encode("ascii"),
+                b"cn=admins,cn=roles,cn=accounts,dc=example,dc=test",
+            ],
+        },
+        {"uid": [b"packager"], "memberof": [f"cn=packagers,{groups_suffix}".encode("ascii")]},
+    ]
+    mock_connection.result3 = mock.Mock(
+        side_effect=[
+            _single_page_result_factory(mocked_groups)(1),
+            _single_page_result_factory(mocked_users)(1),
+        ]
+    )
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    result = ldap.check_memberships(
+        ["admin", "packager", "missing"], ["admins", "packagers", "unknown"]
+    )
+
+    assert result == {
+        "admin": {"admins": True, "packagers": True, "unknown": None},
+        "packager": {"admins": False, "packagers": True, "unknown": None},
+        "missing": {"admins": False, "packagers": False, "unknown": None},
+    }
+    assert mock_connection.search_ext.call_count == 2
+    assert mock_connection.search_ext.call_args_list[0][0][2] == (
+        "(&(objectClass=fasGroup)(|(cn=admins)(cn=packagers)(cn=unknown)))"
+    )
+
+
+def test_check_memberships_empty(mock_connection):
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    assert ldap.check_memberships(["admin"], []) == {"admin": {}}
+    mock_connection.search_ext.assert_not_called()
+
+
 def test_get_users(mock_connection):
     def _get_mock_result(idx):
         return {
@@ -259,6 +385,23 @@ def test_get_users(mock_connection):
     assert result == expected
 
 
+def test_iter_users(mock_connection):
+    pages = [
+        (101, [("", {"uid": [b"user-1"]})], 1, [SimplePagedResultsControl(True, cookie="c")]),
+        (101, [("", {"uid": [b"user-2"]})], 1, [SimplePagedResultsControl(True, cookie="")]),
+    ]
+    mock_connection.result3 = mock.Mock(side_effect=pages)
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    result = ldap.iter_users(["username"])
+
+    # The pages are only fetched when needed
+    assert next(result) == {"username": "user-1"}
+    assert mock_connection.result3.call_count == 1
+    assert list(result) == [{"username": "user-2"}]
+    assert mock_connection.result3.call_count == 2
+
+
 def test_get_user(mock_connection):
     mocked = [
         {
@@ -316,15 +459,293 @@ def test_get_user_with_attrs(mock_connection, mocker):
     assert mock_connection.search_ext.call_args[1]["attrlist"] == [
         "uid",
         "sn",
+        "entryUSN",
+        "modifyTimestamp",
     ]
 
 
+def test_get_user_version(mock_connection):
+    mocked = [{"uid": [b"admin"], "entryUSN": [b"42"], "modifyTimestamp": [b"20240102030405Z"]}]
+    mock_connection.result3 = _single_page_result_factory(mocked)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    user = ldap.get_user("admin", ["username"])
+    assert mock_connection.search_ext.call_args[1]["attrlist"] == [
+        "uid",
+        "entryUSN",
+        "modifyTimestamp",
+    ]
+    assert UserModel.get_version(user) == "42-20240102030405Z"
+    # The version is kept when the entry is projected
+    assert ldap.get_user("admin", ["username"]) == user
+    ldap.get_user("admin")
+    assert mock_connection.search_ext.call_args[1]["attrlist"] == [
+        "*",
+        "entryUSN",
+        "modifyTimestamp",
+    ]
+
+
+def test_get_version():
+    assert GroupModel.get_version({"usn": "1"}) == "1-None"
+    assert GroupModel.get_version({"groupname": "dummy"}) is None
+
+
+def test_convert_ldap_result():
+    result = {
+        "uid": [b"dummy"],
+        "fasWebsiteURL": [b"https://example.test", b"https://other.test"],
+        "userCertificate;binary": [b"\x00\x01"],
+        "unknown": [b"value"],
+    }
+    assert UserModel.convert_ldap_result(result) == {
+        "username": "dummy",
+        "certificates": [b"\x00\x01"],
+        "website": "https://example.test",
+        "websites": ["https://example.test", "https://other.test"],
+    }
+    # The plan is computed once per projection
+    plan = UserModel.get_conversion_plan(tuple(result))
+    assert UserModel.get_conversion_plan(tuple(result)) is plan
+    assert [name for name, _ldap_name, _converter in plan] == [
+        "username",
+        "certificates",
+        "website",
+        "websites",
+    ]
+    assert GroupModel.get_conversion_plan(tuple(result)) == ()
+
+
+def test_convert_ldap_results():
+    results = [
+        {"uid": [b"dummy"], "fasCreationTime": [b"20200309103203Z"]},
+        {"uid": [b"other"]},
+        {"uid": [b"third"], "fasCreationTime": [b"20210101000000Z"]},
+        {"unknown": [b"value"]},
+    ]
+    converted = UserModel.convert_ldap_results(iter(results))
+    assert converted == [UserModel.convert_ldap_result(result) for result in results]
+    assert converted[0]["creation"] == datetime.datetime(2020, 3, 9, 10, 32, 3)
+    assert converted[3] == {}
+
+
+def test_record():
+    record_class = UserModel.get_record_class()
+    assert UserModel.get_record_class() is record_class
+    assert issubclass(record_class, Record)
+    assert not hasattr(record_class(), "__dict__")
+
+    record = UserModel.convert_ldap_results(
+        [{"uid": [b"dummy"], "fasIsPrivate": [b"TRUE"], "sn": [b"Dummy"]}], compact=True
+    )[0]
+    assert isinstance(record, record_class)
+    assert record == {"username": "dummy", "surname": "Dummy", "is_private": True}
+    assert list(record) == ["username", "surname", "is_private"]
+    assert len(record) == 3
+    assert record["username"] == "dummy"
+    assert record.get("surname") == "Dummy"
+    assert record.get("givenname", "default") == "default"
+    assert record.get("unknown", "default") == "default"
+    assert "username" in record
+    assert "givenname" not in record
+    assert "unknown" not in record
+    assert repr(record) == (
+        "<UserModelRecord {'username': 'dummy', 'surname': 'Dummy', 'is_private': True}>"
+    )
+    with pytest.raises(KeyError):
+        record["givenname"]
+    with pytest.raises(KeyError):
+        record["unknown"]
+    with pytest.raises(KeyError):
+        record["unknown"] = "value"
+    with pytest.raises(KeyError):
+        del record["unknown"]
+    with pytest.raises(KeyError):
+        del record["givenname"]
+
+    record["givenname"] = "Given"
+    assert UserModel.anonymize(record) == {"username": "dummy", "is_private": True}
+    copy = pickle.loads(pickle.dumps(record))  # noqa: S301
+    assert isinstance(copy, record_class)
+    assert copy == record
+
+
+def test_dn_interned():
+    results = UserModel.convert_ldap_results(
+        [{"memberof": [b"cn=group,cn=groups,dc=example,dc=test"]} for _i in range(2)]
+    )
+    assert results[0]["groups"][0] is results[1]["groups"][0]
+
+
 def test_get_user_not_found(mock_connection):
     mock_connection.result3 = _single_page_result_factory([])
     ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
     assert ldap.get_user("dummy") is None
 
 
+def test_get_users_by_name(mock_connection):
+    mocked = [{"uid": [b"admin"], "mail": [b"admin@example.test"]}]
+    mock_connection.result3 = _single_page_result_factory(mocked)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    result = ldap.get_users_by_name(["admin", "dum*my"], attrs=["emails"])
+
+    assert result.items == [{"username": "admin", "emails": ["admin@example.test"]}]
+    assert mock_connection.search_ext.call_count == 1
+    call_args = mock_connection.search_ext.call_args
+    assert call_args[0][2] == (
+        "(&(&(objectClass=fasUser)(!(nsAccountLock=TRUE)))(|(uid=admin)(uid=dum\\2amy)))"
+    )
+    assert call_args[1]["attrlist"] == ["mail", "uid"]
+
+
+def test_get_users_by_name_username(mock_connection):
+    mock_connection.result3 = _single_page_result_factory([{"uid": [b"admin"]}])
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    result = ldap.get_users_by_name(["admin"], attrs=["username"])
+
+    assert result.items == [{"username": "admin"}]
+    # The username is not requested twice
+    assert mock_connection.search_ext.call_args[1]["attrlist"] == ["uid"]
+
+
+def test_get_users_compact(mock_connection):
+    mocked = [{"uid": [b"admin"], "mail": [b"admin@example.test"]}]
+    mock_connection.result3 = _single_page_result_factory(mocked)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", compact_records=True)
+
+    result = ldap.get_users_by_name(["admin"], attrs=["emails"])
+
+    assert isinstance(result.items[0], UserModel.get_record_class())
+    assert result.items == [{"username": "admin", "emails": ["admin@example.test"]}]
+
+
+def test_get_users_by_name_empty(mock_connection):
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    assert ldap.get_users_by_name([]) == LDAPResult()
+    mock_connection.search_ext.assert_not_called()
+
+
+def test_get_user_identity_map(mock_connection):
+    mocked = [{"uid": [b"admin"], "mail": [b"admin@example.test"], "fasTimeZone": [b"UTC"]}]
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory(mocked))
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+
+    user = ldap.get_user("admin", ["username", "emails"])
+    assert user == {"username": "admin", "emails": ["admin@example.test"]}
+    # The caller gets a copy
+    del user["emails"]
+    assert ldap.get_user("admin", ["username", "emails"]) == {
+        "username": "admin",
+        "emails": ["admin@example.test"],
+    }
+    # A narrower projection is served from the previous entry
+    assert ldap.get_user("admin", ["username"]) == {"username": "admin"}
+    assert mock_connection.search_ext.call_count == 1
+    # A wider projection is requested from the server
+    ldap.get_user("admin")
+    assert mock_connection.search_ext.call_count == 2
+    ldap.get_user("admin", ["timezone"])
+    assert mock_connection.search_ext.call_count == 2
+
+    ldap.reset()
+    ldap.get_user("admin", ["username"])
+    assert mock_connection.search_ext.call_count == 3
+
+
+def test_get_user_entry_cache(mock_connection):
+    mocked = [{"uid": [b"dummy"], "mail": [b"dummy@example.test"]}]
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory(mocked))
+    cache = TTLCache()
+    ldap = LDAP(
+        "ldap://dummy.com", basedn="dc=example,dc=test", entry_cache=cache, username="admin"
+    )
+
+    expected = {"username": "dummy", "emails": ["dummy@example.test"]}
+    assert ldap.get_user("dummy", ["username", "emails"]) == expected
+    assert ("UserModel", "dummy", frozenset(["uid", "mail"]), "others") in cache
+
+    # Another request is served from the cache
+    ldap.reset()
+    assert ldap.get_user("dummy", ["username", "emails"]) == expected
+    assert mock_connection.search_ext.call_count == 1
+    assert cache.stats["hits"] == 1
+
+    # The user's own entry is cached apart
+    ldap.get_user("Admin", ["username", "emails"])
+    assert mock_connection.search_ext.call_count == 2
+    assert ("UserModel", "admin", frozenset(["uid", "mail"]), "self") in cache
+
+    ldap.invalidate_cache(GroupModel)
+    assert len(cache) == 2
+    ldap.invalidate_cache(UserModel)
+    assert len(cache) == 0
+    ldap.reset()
+    ldap.get_user("dummy", ["username", "emails"])
+    assert len(cache) == 1
+    ldap.invalidate_cache()
+    assert len(cache) == 0
+
+
+def test_get_user_entry_cache_not_found(mock_connection):
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory([]))
+    cache = TTLCache()
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", entry_cache=cache)
+    assert ldap.get_user("dummy") is None
+    assert len(cache) == 0
+
+
+def test_get_user_negative_cache(mock_connection):
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory([]))
+    cache = TTLCache()
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", negative_cache=cache)
+    assert ldap.get_user("Dummy") is None
+    assert ("UserModel", "dummy") in cache
+
+    # Another request does not query the server
+    ldap.reset()
+    assert ldap.get_user("dummy", ["username"]) is None
+    assert mock_connection.search_ext.call_count == 1
+
+    ldap.invalidate_cache(GroupModel)
+    assert len(cache) == 1
+    ldap.invalidate_cache(UserModel)
+    assert len(cache) == 0
+
+
+def test_get_user_name_filter(mock_connection):
+    mocked = [{"uid": [b"Dummy"]}, {"uid": [b"other"]}]
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory(mocked))
+    name_filter = NameFilter(background=False)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", name_filter=name_filter)
+
+    assert ldap.get_user("unknown") is None
+    # Only the names were requested
+    assert mock_connection.search_ext.call_count == 1
+    assert mock_connection.search_ext.call_args[0][0] == "cn=users,cn=accounts,dc=example,dc=test"
+    assert mock_connection.search_ext.call_args[0][2] == UserModel.filters
+    assert name_filter.stats == {"rejections": 1, "rebuilds": 1, "failures": 0}
+
+    # An existing name is requested from the server
+    assert ldap.get_user("dummy") == {"username": "Dummy"}
+    assert mock_connection.search_ext.call_count == 2
+
+    ldap.invalidate_cache(GroupModel)
+    assert len(name_filter) == 2
+    ldap.invalidate_cache(UserModel)
+    assert len(name_filter) == 0
+    ldap.invalidate_cache()
+
+
+def test_get_group_identity_map_not_found(mock_connection):
+    mock_connection.result3 = mock.Mock(side_effect=_single_page_result_factory([]))
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    assert ldap.get_group("dummy", ["groupname"]) is None
+    assert ldap.get_group("dummy") is None
+    assert mock_connection.search_ext.call_count == 1
+
+
 def test_get_user_groups(mock_connection):
     mocked_user = [
         {
@@ -555,6 +976,57 @@ def test_get_paged_groups(mock_connection):
     assert result == expected
 
 
+def test_get_paged_groups_pkey_cache(mock_connection):
+    mocked = [{"cn": [f"group-{idx}".encode("ascii")]} for idx in range(1, 12)]
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", pkey_cache=TTLCache())
+    with mock.patch.object(
+        ldap, "_do_search", side_effect=[mocked, mocked[3:6], mocked[6:9]]
+    ) as do_search:
+        ldap.get_groups(attrs=None, page_number=2, page_size=3)
+        result = ldap.get_groups(attrs=None, page_number=3, page_size=3)
+
+    # The primary keys have only been fetched once
+    called_filters = [call[1]["filters"] for call in do_search.call_args_list]
+    assert called_filters == [
+        "(objectClass=fasGroup)",
+        "(&(objectClass=fasGroup)(|(cn=group-4)(cn=group-5)(cn=group-6)))",
+        "(&(objectClass=fasGroup)(|(cn=group-7)(cn=group-8)(cn=group-9)))",
+    ]
+    assert result.total == 11
+    assert [item["groupname"] for item in result.items] == ["group-7", "group-8", "group-9"]
+
+
+def test_invalidate_cache(mock_connection):
+    cache = TTLCache()
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", pkey_cache=cache)
+    users_key = ("cn=users,cn=accounts,dc=example,dc=test", "(objectClass=*)", 2)
+    groups_key = ("cn=groups,cn=accounts,dc=example,dc=test", "(objectClass=*)", 2)
+    cache.set(users_key, ("dummy",))
+    cache.set(groups_key, ("dummy",))
+    ldap.invalidate_cache(UserModel)
+    assert users_key not in cache
+    assert groups_key in cache
+    ldap.invalidate_cache()
+    assert groups_key not in cache
+
+
+def test_invalidate_cache_responses(mock_connection):
+    cache = TTLCache()
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", response_cache=cache)
+    key = ("responses", "/v1/groups/dummy/", (), None, None)
+    cache.set(key, (b"{}", None, frozenset()))
+    # The responses may contain entries of any model
+    ldap.invalidate_cache(UserModel)
+    assert key not in cache
+
+
+def test_invalidate_cache_no_cache(mock_connection):
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    # This should not crash
+    ldap.invalidate_cache(GroupModel)
+
+
 def test_get_paged_search_no_results(mock_connection):
     mocked = []
 
@@ -625,6 +1097,38 @@ def test_do_search_paged(mock_connection):
     assert result == expected
 
 
+def test_do_search_closed(mock_connection):
+    page = (101, [("", {"cn": [b"group-1"]})], 1, [SimplePagedResultsControl(True, 1, "next")])
+    mock_connection.result3 = mock.Mock(return_value=page)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    items = ldap.iter_search(model=GroupModel)
+    assert next(items) == {"groupname": "group-1"}
+    items.close()
+    assert mock_connection.search_ext.call_count == 2
+    page_control = mock_connection.search_ext.call_args[1]["serverctrls"][0]
+    assert (page_control.size, page_control.cookie) == (0, "next")
+
+
+def test_do_search_closed_server_down(mock_connection):
+    page = (101, [("", {"cn": [b"group-1"]})], 1, [SimplePagedResultsControl(True, 1, "next")])
+    mock_connection.result3 = mock.Mock(side_effect=[page, ldap.SERVER_DOWN])
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    items = client.iter_search(model=GroupModel)
+    next(items)
+    # This should not crash
+    items.close()
+
+
+def test_do_search_last_page_closed(mock_connection):
+    mock_connection.result3 = _single_page_result_factory([{"cn": [b"group-1"]}])
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    items = ldap.iter_search(model=GroupModel)
+    next(items)
+    items.close()
+    # There is no search to end
+    assert mock_connection.search_ext.call_count == 1
+
+
 def test_do_search_other_server_control(mock_connection):
     dummy_server_control = object()
     ldap_return = [101, [], 1, [dummy_server_control]]
@@ -642,3 +1146,368 @@ def test_do_search_no_server_control(mock_connection):
     ldap.get_groups(None, 0, 1)
     # No loop
     assert mock_connection.result3.call_count == 1
+
+
+def _vlv_response(content_count, result=0):
+    ctrl = VLVResponseControl()
+    ctrl.content_count = content_count
+    ctrl.result = result
+    return ctrl
+
+
+def test_vlv_search(mock_connection, mocker):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.result3 = mock.Mock(
+        return_value=(
+            101,
+            [("", {"cn": [f"group-{idx}".encode("ascii")]}) for idx in range(4, 7)],
+            1,
+            [_vlv_response(11)],
+        )
+    )
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", vlv=True)
+    result = ldap.get_groups(attrs=None, page_number=2, page_size=3)
+
+    expected = LDAPResult(
+        items=[
+            {"groupname": "group-4"},
+            {"groupname": "group-5"},
+            {"groupname": "group-6"},
+        ],
+        total=11,
+        page_size=3,
+        page_number=2,
+    )
+    assert result == expected
+    mock_connection.search_ext.assert_called_once()
+    call_args = mock_connection.search_ext.call_args
+    assert call_args[0][2] == "(objectClass=fasGroup)"
+    sort_ctrl, vlv_ctrl = call_args[1]["serverctrls"]
+    assert isinstance(sort_ctrl, SSSRequestControl)
+    assert sort_ctrl.ordering_rules == ["cn"]
+    assert isinstance(vlv_ctrl, VLVRequestControl)
+    assert vlv_ctrl.offset == 4
+    assert vlv_ctrl.after_count == 2
+
+
+def test_vlv_search_past_end(mock_connection):
+    mock_connection.result3 = mock.Mock(
+        return_value=(101, [("", {"cn": [b"group-11"]})], 1, [_vlv_response(11)])
+    )
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", vlv=True)
+    result = ldap.get_groups(attrs=None, page_number=5, page_size=3)
+    assert result == LDAPResult(items=[], total=11, page_size=3, page_number=5)
+
+
+def test_vlv_search_other_controls(mock_connection):
+    # The server also returns the sort response control
+    mock_connection.result3 = mock.Mock(
+        return_value=(101, [("", {"cn": [b"group-1"]})], 1, [mock.Mock(), _vlv_response(1)])
+    )
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", vlv=True)
+    result = ldap.get_groups(attrs=None, page_number=1, page_size=3)
+    assert result == LDAPResult(
+        items=[{"groupname": "group-1"}], total=1, page_size=3, page_number=1
+    )
+
+
+@pytest.mark.parametrize(
+    "result3",
+    [
+        mock.Mock(side_effect=ldap.UNAVAILABLE_CRITICAL_EXTENSION),
+        mock.Mock(return_value=(101, [], 1, [])),
+        mock.Mock(return_value=(101, [], 1, [_vlv_response(0, result=53)])),
+    ],
+)
+def test_vlv_search_unavailable(mock_connection, result3):
+    mock_connection.result3 = result3
+    mocked = [{"cn": [f"group-{idx}".encode("ascii")]} for idx in range(1, 12)]
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", vlv=True)
+    with mock.patch.object(
+        ldap, "_do_search", side_effect=[mocked, mocked[3:6], mocked, mocked[3:6]]
+    ) as do_search:
+        result = ldap.get_groups(attrs=None, page_number=2, page_size=3)
+        assert result.total == 11
+        assert len(result.items) == 3
+        assert do_search.call_count == 2
+        # Don't try again for the same query
+        ldap.get_groups(attrs=None, page_number=2, page_size=3)
+    assert result3.call_count == 1
+
+
+def test_vlv_search_not_paged(mock_connection):
+    mock_connection.result3 = _single_page_result_factory([{"cn": [b"group-1"]}])
+    mock_connection.search_ext = mock.Mock(return_value=1)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", vlv=True)
+    ldap.get_groups(attrs=None, page_number=1, page_size=0)
+    mock_connection.search_ext.assert_called_once()
+    serverctrls = mock_connection.search_ext.call_args[1]["serverctrls"]
+    assert [type(ctrl) for ctrl in serverctrls] == [SimplePagedResultsControl]
+
+
+def _entries_result_factory(entries):
+    """Return the entries one at a time, like result3(msgid, all=0)"""
+    responses = [(ldap.RES_SEARCH_ENTRY, [("", entry)], 1, []) for entry in entries]
+    responses.append((ldap.RES_SEARCH_RESULT, [], 1, []))
+    return mock.Mock(side_effect=responses)
+
+
+def test_keyset_search_first_page(mock_connection, mocker):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.abandon = mocker.Mock()
+    mock_connection.result3 = _entries_result_factory(
+        [{"cn": [f"group-{idx}".encode("ascii")]} for idx in range(1, 5)]
+    )
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    result = ldap.get_groups(attrs=["url"], page_number=1, page_size=3, after="")
+
+    expected = LDAPResult(
+        items=[{"groupname": "group-1"}, {"groupname": "group-2"}, {"groupname": "group-3"}],
+        page_size=3,
+        keyset=True,
+        next_key="group-3",
+    )
+    assert result == expected
+    call_args = mock_connection.search_ext.call_args
+    assert call_args[0][2] == "(objectClass=fasGroup)"
+    # The primary key is always requested
+    assert call_args[1]["attrlist"] == ["fasurl", "cn"]
+    (sort_ctrl,) = call_args[1]["serverctrls"]
+    assert sort_ctrl.ordering_rules == ["cn"]
+    # Stop the search once the page is full
+    assert mock_connection.result3.call_count == 4
+    mock_connection.abandon.assert_called_once_with(1)
+
+
+def test_keyset_search_last_page(mock_connection, mocker):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.abandon = mocker.Mock()
+    mock_connection.result3 = _entries_result_factory([{"uid": [b"dummy-4"]}])
+
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    result = ldap.get_group_members(
+        "admins", attrs=["username"], page_number=1, page_size=3, after="dummy-3"
+    )
+
+    assert result == LDAPResult(
+        items=[{"username": "dummy-4"}], page_size=3, keyset=True, next_key=None
+    )
+    assert mock_connection.search_ext.call_args[0][2] == (
+        "(&(&(memberOf=cn=admins,cn=groups,cn=accounts,dc=example,dc=test)"
+        "(&(objectClass=fasUser)(!(nsAccountLock=TRUE))))"
+        "(uid>=dummy-3)(!(uid=dummy-3)))"
+    )
+    mock_connection.abandon.assert_not_called()
+
+
+def test_keyset_search_reference(mock_connection, mocker):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.result3 = mock.Mock(
+        side_effect=[
+            (ldap.RES_SEARCH_REFERENCE, [(None, ["ldap://other"])], 1, []),
+            (ldap.RES_SEARCH_ENTRY, [("", {"cn": [b"group-1"]})], 1, []),
+            (ldap.RES_SEARCH_RESULT, [], 1, []),
+        ]
+    )
+
+    ldap_client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    result = ldap_client.get_groups(attrs=["url"], page_number=1, page_size=3, after="")
+
+    # Referrals are skipped
+    assert result.items == [{"groupname": "group-1"}]
+    assert mock_connection.result3.call_count == 3
+
+
+def test_keyset_search_escape(mock_connection, mocker):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.result3 = _entries_result_factory([])
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    ldap.search_users(attrs=None, page_number=1, page_size=3, after="a*b", username="dummy")
+    assert "(uid>=a\\2ab)(!(uid=a\\2ab))" in mock_connection.search_ext.call_args[0][2]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [ldap.UNAVAILABLE_CRITICAL_EXTENSION, ldap.ADMINLIMIT_EXCEEDED, ldap.SIZELIMIT_EXCEEDED],
+)
+def test_keyset_search_sort_unavailable(mock_connection, mocker, error):
+    mock_connection.search_ext = mocker.Mock(return_value=1)
+    mock_connection.result3 = mock.Mock(side_effect=error)
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    pkeys = ["Group-3", "group-1", "group-4", "group-2"]
+    with mock.patch.object(
+        client,
+        "_do_search",
+        side_effect=lambda filters, **kwargs: (
+            [{"cn": [pkey.encode("ascii")]} for pkey in pkeys]
+            if filters == "(objectClass=fasGroup)"
+            # The entries of the page, in no particular order
+            else [{"cn": [b"Group-3"]}, {"cn": [b"group-2"]}]
+        ),
+    ) as do_search:
+        result = client.get_groups(attrs=["url"], page_number=1, page_size=2, after="group-1")
+        assert result == LDAPResult(
+            items=[{"groupname": "group-2"}, {"groupname": "Group-3"}],
+            page_size=2,
+            keyset=True,
+            next_key="Group-3",
+        )
+        assert do_search.call_args[1]["filters"] == (
+            "(&(objectClass=fasGroup)(|(cn=group-2)(cn=Group-3)))"
+        )
+        assert do_search.call_args[1]["attrs"] == ["fasurl", "cn"]
+        # Don't try to sort again for the same query
+        result = client.get_groups(attrs=None, page_number=1, page_size=2, after="Group-3")
+        assert result.next_key is None
+    assert mock_connection.result3.call_count == 1
+
+
+def test_keyset_search_sort_unavailable_past_end(mock_connection, mocker):
+    mock_connection.result3 = mock.Mock(side_effect=ldap.UNWILLING_TO_PERFORM)
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    with mock.patch.object(client, "_get_pkeys", return_value=("group-1",)):
+        result = client.get_groups(attrs=None, page_number=1, page_size=2, after="group-1")
+    assert result == LDAPResult(items=[], page_size=2, keyset=True)
+
+
+def test_keyset_search_no_page_size(mock_connection):
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    with pytest.raises(ValueError):
+        ldap.get_users(attrs=None, page_number=1, page_size=0, after="")
+
+
+@pytest.fixture
+def replica():
+    replica = Replica("ldap://dummy.com", "dc=example,dc=test")
+    group_dn = b"cn=group1,cn=groups,cn=accounts,dc=example,dc=test"
+    for name in ["dummy-1", "Dummy-2", "dummy-3"]:
+        replica._store(
+            name,
+            f"uid={name},cn=users,cn=accounts,dc=example,dc=test",
+            {
+                "objectClass": [b"fasUser"],
+                "uid": [name.encode("utf-8")],
+                "sn": [b"Dummy"],
+                "memberOf": [group_dn],
+            },
+        )
+    replica.ready = True
+    return replica
+
+
+def test_replica_get_user(mock_connection, replica):
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    assert client.get_user("dummy-1") == {"username": "dummy-1", "surname": "Dummy"}
+    assert client.get_user("dummy-1", attrs=["groups"]) == {
+        "groups": ["cn=group1,cn=groups,cn=accounts,dc=example,dc=test"]
+    }
+    assert client.get_user("nobody") is None
+    mock_connection.search_ext.assert_not_called()
+
+
+def test_replica_not_ready(mock_connection, replica):
+    replica.ready = False
+    mock_connection.result3 = _single_page_result_factory([])
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    assert client.get_user("dummy-1") is None
+    mock_connection.search_ext.assert_called_once()
+
+
+def test_replica_check_membership(mock_connection, replica):
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    assert client.check_membership("group1", "dummy-1") is True
+    assert client.check_membership("group2", "dummy-1") is False
+    mock_connection.search_ext.assert_not_called()
+
+
+def test_replica_group_members(mock_connection, replica):
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    result = client.get_group_members("group1", attrs=None, page_size=2, page_number=2)
+    assert result == LDAPResult(
+        items=[{"username": "dummy-3"}], total=3, page_size=2, page_number=2
+    )
+    result = client.get_group_members("group1", attrs=["surname"], page_size=0, page_number=1)
+    assert result.items == [{"surname": "Dummy"}] * 3
+    assert [user["username"] for user in client.iter_group_members("group1", None)] == [
+        "dummy-1",
+        "Dummy-2",
+        "dummy-3",
+    ]
+    mock_connection.search_ext.assert_not_called()
+
+
+def test_replica_group_members_keyset(mock_connection, replica):
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    result = client.get_group_members("group1", None, page_size=2, page_number=1, after="")
+    assert result == LDAPResult(
+        items=[{"username": "dummy-1"}, {"username": "Dummy-2"}],
+        page_size=2,
+        keyset=True,
+        next_key="Dummy-2",
+    )
+    result = client.get_group_members("group1", None, page_size=2, page_number=1, after="dummy-2")
+    assert result == LDAPResult(items=[{"username": "dummy-3"}], page_size=2, keyset=True)
+    # The primary keys are compared like the server does
+    result = client.get_group_members("group1", None, page_size=2, page_number=1, after="DUMMY-2 ")
+    assert result == LDAPResult(items=[{"username": "dummy-3"}], page_size=2, keyset=True)
+    with pytest.raises(ValueError):
+        client.get_group_members("group1", None, page_size=0, page_number=1, after="")
+
+
+def test_replica_group_members_deleted(mock_connection, replica, mocker):
+    client = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", replica=replica)
+    mocker.patch.object(replica, "get_group_members", return_value=["dummy-1", "deleted"])
+    result = client.get_group_members("group1", None, page_size=0, page_number=1)
+    assert result.items == [{"username": "dummy-1"}]
+
+
+def test_check_directory_version(mock_connection, mocker):
+    mock_connection.search_s = mocker.Mock(
+        return_value=[("", {"lastusn;userroot": [b"10"], "lastusn;changelog": [b"3"]})]
+    )
+    value = (("lastusn;changelog", [b"3"]), ("lastusn;userroot", [b"10"]))
+    store = TTLCache()
+    store.set("value", value)
+    cache = TTLCache()
+    cache.set("dummy", "value")
+    pkey_cache = TTLCache()
+    pkey_cache.set("dummy", "value")
+    name_filter = mocker.Mock()
+    version = DirectoryVersion(interval=0, store=store)
+    ldap = LDAP(
+        "ldap://dummy.com",
+        basedn="dc=example,dc=test",
+        entry_cache=cache,
+        pkey_cache=pkey_cache,
+        name_filter=name_filter,
+        directory_version=version,
+    )
+
+    # The directory has not changed since the last value seen
+    ldap.check_directory_version()
+    mock_connection.search_s.assert_called_once_with("", 0, attrlist=["lastusn"])
+    assert version.value == value
+    assert "dummy" in cache
+
+    mock_connection.search_s.return_value = [("", {"lastusn;userroot": [b"11"]})]
+    ldap.check_directory_version()
+    assert "dummy" not in cache
+    assert "dummy" not in pkey_cache
+    name_filter.invalidate.assert_called_once_with()
+
+
+def test_check_directory_version_no_result(mock_connection, mocker):
+    mock_connection.search_s = mocker.Mock(return_value=[])
+    version = DirectoryVersion(interval=0)
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test", directory_version=version)
+    ldap.check_directory_version()
+    assert version.value is None
+
+
+def test_check_directory_version_disabled(mock_connection):
+    ldap = LDAP("ldap://dummy.com", basedn="dc=example,dc=test")
+    # This should not crash
+    ldap.check_directory_version()
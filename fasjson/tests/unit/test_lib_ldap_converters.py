@@ -1,3 +1,5 @@
+import datetime
+
 import pytest
 
 from fasjson.lib.ldap import converters
@@ -17,4 +19,36 @@ def test_bool_wrong_value():
 def test_binary():
     c = converters.BinaryConverter("userCertificate")
     assert c.ldap_name == "userCertificate;binary"
-    assert c.from_ldap([b"dummy"]) == "ZHVtbXk="
+    assert c.from_ldap([b"dummy"]) == b"dummy"
+
+
+def test_general_time():
+    c = converters.GeneralTimeConverter("fasCreationTime")
+    assert c.from_ldap([b"20200309103203Z"]) == datetime.datetime(2020, 3, 9, 10, 32, 3)
+
+
+@pytest.mark.parametrize(
+    "value", [b"20200230103203Z", b"20200309243203Z", b"20200309103203", b"2020-3-09103203Z"]
+)
+def test_general_time_invalid(value):
+    c = converters.GeneralTimeConverter("fasCreationTime")
+    with pytest.raises(ValueError):
+        c.from_ldap([value])
+
+
+def test_from_ldap_many():
+    c = converters.Converter("uid")
+    assert c.from_ldap_many([[b"dummy"], [b"\xc3\x9cn\xc3\xafcode"]]) == ["dummy", "Ünïcode"]
+    c = converters.Converter("mail", multivalued=True)
+    assert c.from_ldap_many([[b"a@example.test", b"b@example.test"], []]) == [
+        ["a@example.test", "b@example.test"],
+        [],
+    ]
+
+
+def test_from_ldap_many_subclass():
+    c = converters.GeneralTimeConverter("fasCreationTime")
+    column = [[b"20200309103203Z"], [b"20210101000000Z"]]
+    assert c.from_ldap_many(column) == [c.from_ldap(values) for values in column]
+    c = converters.BoolConverter("fasIsPrivate", multivalued=True)
+    assert c.from_ldap_many([[b"TRUE", b"false"]]) == [[True, False]]
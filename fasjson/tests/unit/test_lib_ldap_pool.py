@@ -0,0 +1,132 @@
+import threading
+from unittest import mock
+
+import ldap
+import pytest
+
+from fasjson.lib.ldap.pool import ConnectionPool
+
+
+@pytest.fixture
+def monotonic(mocker):
+    clock = mocker.patch("fasjson.lib.ldap.pool.time.monotonic")
+    clock.return_value = 1000
+    return clock
+
+
+def test_pool_create(monotonic):
+    pool = ConnectionPool()
+    client = mock.Mock()
+    factory = mock.Mock(return_value=client)
+    assert pool.acquire("dummy", factory) is client
+    factory.assert_called_once_with()
+    assert pool.stats["created"] == 1
+
+
+def test_pool_reuse(monotonic):
+    pool = ConnectionPool()
+    client = mock.Mock()
+    pool.release("dummy", client)
+    assert len(pool) == 1
+    factory = mock.Mock()
+    assert pool.acquire("dummy", factory) is client
+    factory.assert_not_called()
+    assert len(pool) == 0
+    assert pool.stats["reused"] == 1
+    # The connection was released recently, don't check it
+    client.whoami.assert_not_called()
+
+
+def test_pool_other_identity(monotonic):
+    pool = ConnectionPool()
+    client = mock.Mock()
+    pool.release("dummy", client)
+    other_client = mock.Mock()
+    assert pool.acquire("other", lambda: other_client) is other_client
+    assert len(pool) == 1
+
+
+def test_pool_max_size(monotonic):
+    pool = ConnectionPool(max_size=2)
+    clients = [mock.Mock() for _i in range(3)]
+    for client in clients:
+        pool.release("dummy", client)
+    assert len(pool) == 2
+    # The least recently used client has been closed
+    clients[0].close.assert_called_once_with()
+    clients[1].close.assert_not_called()
+    clients[2].close.assert_not_called()
+
+
+def test_pool_disabled(monotonic):
+    pool = ConnectionPool(max_size=0)
+    client = mock.Mock()
+    pool.release("dummy", client)
+    assert len(pool) == 0
+    client.close.assert_called_once_with()
+
+
+def test_pool_idle_timeout(monotonic):
+    pool = ConnectionPool(idle_timeout=300)
+    client = mock.Mock()
+    pool.release("dummy", client)
+    monotonic.return_value = 1300
+    new_client = mock.Mock()
+    assert pool.acquire("dummy", lambda: new_client) is new_client
+    client.close.assert_called_once_with()
+
+
+def test_pool_health_check(monotonic):
+    pool = ConnectionPool(check_interval=30)
+    client = mock.Mock()
+    pool.release("dummy", client)
+    monotonic.return_value = 1031
+    assert pool.acquire("dummy", mock.Mock()) is client
+    client.whoami.assert_called_once_with()
+
+
+def test_pool_health_check_failed(monotonic):
+    pool = ConnectionPool(check_interval=30)
+    client = mock.Mock()
+    client.whoami.side_effect = ldap.SERVER_DOWN
+    client.close.side_effect = ldap.SERVER_DOWN
+    pool.release("dummy", client)
+    monotonic.return_value = 1031
+    new_client = mock.Mock()
+    assert pool.acquire("dummy", lambda: new_client) is new_client
+    client.close.assert_called_once_with()
+    assert pool.stats["discarded"] == 1
+
+
+def test_pool_discard():
+    pool = ConnectionPool()
+    client = mock.Mock()
+    pool.discard(client)
+    client.close.assert_called_once_with()
+    assert len(pool) == 0
+
+
+def test_pool_clear():
+    pool = ConnectionPool()
+    clients = [mock.Mock() for _i in range(2)]
+    for client in clients:
+        pool.release("dummy", client)
+    pool.clear()
+    assert len(pool) == 0
+    for client in clients:
+        client.close.assert_called_once_with()
+
+
+def test_pool_stats_threads():
+    pool = ConnectionPool(max_size=0)
+
+    def use_pool():
+        for _i in range(1000):
+            pool.release("dummy", pool.acquire("dummy", mock.Mock))
+
+    threads = [threading.Thread(target=use_pool) for _i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.stats == {"created": 4000, "reused": 0, "discarded": 4000}
@@ -0,0 +1,329 @@
+import pickle
+
+import gssapi
+import ldap
+import pytest
+
+from fasjson.lib.ldap.models import GroupModel, pkey_sort_key, UserModel
+from fasjson.lib.ldap.replica import _Consumer, Replica, SYNC_REFRESH_REQUIRED
+
+
+BASEDN = "dc=example,dc=test"
+GROUP_DN = f"cn=group1,cn=groups,cn=accounts,{BASEDN}"
+
+
+def _user(name, groups=(), locked=False):
+    attrs = {
+        "objectClass": [b"fasUser"],
+        "uid": [name.encode("utf-8")],
+        "displayName": [name.upper().encode("utf-8")],
+        "memberOf": [group.encode("utf-8") for group in groups],
+    }
+    if locked:
+        attrs["nsAccountLock"] = [b"TRUE"]
+    return f"uid={name},cn=users,cn=accounts,{BASEDN}", attrs
+
+
+def _group(name):
+    attrs = {"objectClass": [b"fasGroup"], "cn": [name.encode("utf-8")]}
+    return f"cn={name},cn=groups,cn=accounts,{BASEDN}", attrs
+
+
+@pytest.fixture
+def replica():
+    replica = Replica("ldap://dummy.com", BASEDN)
+    replica._store("u1", *_user("dummy", groups=[GROUP_DN]))
+    replica._store("u2", *_user("Other", groups=[GROUP_DN]))
+    replica._store("u3", *_user("locked", groups=[GROUP_DN], locked=True))
+    replica._store("g1", *_group("group1"))
+    return replica
+
+
+def test_replica_get(replica):
+    assert replica.get(UserModel, "dummy") == {
+        "username": "dummy",
+        "human_name": "DUMMY",
+        "groups": [GROUP_DN],
+    }
+    assert replica.get(UserModel, "DUMMY")["username"] == "dummy"
+    assert replica.get(GroupModel, "group1") == {"groupname": "group1"}
+
+
+def test_replica_get_not_found(replica):
+    assert replica.get(UserModel, "nobody") is None
+    # Locked users are not visible, like with the model's filters
+    assert replica.get(UserModel, "locked") is None
+    # The entry is not of the requested type
+    assert replica.get(GroupModel, "dummy") is None
+
+
+def test_replica_group_members(replica):
+    assert replica.get_group_members("group1") == ["dummy", "Other"]
+    assert replica.get_group_members("group2") == []
+
+
+def test_replica_group_members_order(replica):
+    replica._store("u4", *_user("dummy 2", groups=[GROUP_DN]))
+    replica._store("u5", *_user("Dummy1", groups=[GROUP_DN]))
+    # Like caseIgnoreOrderingMatch on the server
+    assert replica.get_group_members("group1") == ["dummy", "dummy 2", "Dummy1", "Other"]
+    assert pkey_sort_key("  Dummy   2 ") == "dummy 2"
+
+
+def test_replica_is_member(replica):
+    assert replica.is_member("group1", "dummy") is True
+    assert replica.is_member("group1", "other") is True
+    assert replica.is_member("group1", "locked") is False
+    assert replica.is_member("group2", "dummy") is False
+    assert replica.is_member("group1", "nobody") is False
+
+
+def test_replica_modify(replica):
+    replica._store("u1", *_user("dummy"))
+    assert replica.get_group_members("group1") == ["Other"]
+    replica._store("u1", *_user("renamed", groups=[GROUP_DN]))
+    assert replica.get(UserModel, "dummy") is None
+    assert replica.get_group_members("group1") == ["Other", "renamed"]
+
+
+def test_replica_delete(replica):
+    replica._delete(["u1", "unknown"])
+    assert replica.get(UserModel, "dummy") is None
+    assert replica.get_group_members("group1") == ["Other"]
+    assert len(replica) == 3
+
+
+def test_replica_present_deletes_missing(replica):
+    replica._present(["u1", "g1"], False)
+    replica._present(None, False)
+    assert len(replica) == 2
+    assert replica.get(UserModel, "other") is None
+    assert replica.get(UserModel, "dummy") is not None
+
+
+def test_replica_present_refresh_deletes(replica):
+    replica._present(["u1"], False)
+    replica._present(None, True)
+    assert len(replica) == 4
+    assert replica._present_uuids == set()
+
+
+def test_replica_persist(replica, tmp_path):
+    path = str(tmp_path / "replica.pickle")
+    replica.path = path
+    replica._set_cookie(b"cookie")
+    replica._refresh_done()
+    assert replica.ready is True
+    replica._maybe_persist()
+    assert replica._dirty is False
+
+    restored = Replica("ldap://dummy.com", BASEDN, path=path)
+    assert restored.cookie == b"cookie"
+    assert restored.ready is False
+    assert len(restored) == 4
+    assert restored.get_group_members("group1") == ["dummy", "Other"]
+
+
+def test_replica_persist_interval(replica, tmp_path):
+    replica.path = str(tmp_path / "replica.pickle")
+    replica._persist()
+    replica._set_cookie(b"cookie")
+    replica._maybe_persist()
+    # Saved too recently
+    assert replica._dirty is True
+
+
+def test_replica_persist_error(replica, tmp_path, mocker):
+    replica.path = str(tmp_path / "replica.pickle")
+    mocker.patch("fasjson.lib.ldap.replica.os.replace", side_effect=OSError("denied"))
+    replica._persist()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_replica_persist_pickling_error(replica, tmp_path, mocker):
+    replica.path = str(tmp_path / "replica.pickle")
+    mocker.patch(
+        "fasjson.lib.ldap.replica.pickle.dump", side_effect=pickle.PicklingError("unpicklable")
+    )
+    replica._persist()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_replica_load_invalid(tmp_path):
+    path = tmp_path / "replica.pickle"
+    path.write_bytes(b"garbage")
+    replica = Replica("ldap://dummy.com", BASEDN, path=str(path))
+    assert len(replica) == 0
+    assert replica.cookie is None
+    # The file is removed and the replica will be fully refreshed
+    assert not path.exists()
+    assert replica._dirty is False
+
+
+def test_replica_load_truncated(replica, tmp_path):
+    path = tmp_path / "replica.pickle"
+    replica.path = str(path)
+    replica._set_cookie(b"cookie")
+    replica._persist()
+    path.write_bytes(path.read_bytes()[:-10])
+    restored = Replica("ldap://dummy.com", BASEDN, path=str(path))
+    assert len(restored) == 0
+    assert restored.cookie is None
+    assert not path.exists()
+
+
+def test_replica_load_unexpected_content(tmp_path):
+    path = tmp_path / "replica.pickle"
+    path.write_bytes(pickle.dumps({"cookie": b"cookie", "entries": {"uuid": None}}))
+    path.chmod(0o600)
+    replica = Replica("ldap://dummy.com", BASEDN, path=str(path))
+    # Nothing is half-loaded
+    assert len(replica) == 0
+    assert replica.cookie is None
+    assert not path.exists()
+
+
+def test_replica_load_writable_by_others(replica, tmp_path):
+    path = tmp_path / "replica.pickle"
+    replica.path = str(path)
+    replica._set_cookie(b"cookie")
+    replica._persist()
+    path.chmod(0o666)
+    restored = Replica("ldap://dummy.com", BASEDN, path=str(path))
+    assert len(restored) == 0
+    assert restored.cookie is None
+
+
+def test_replica_load_missing(tmp_path):
+    replica = Replica("ldap://dummy.com", BASEDN, path=str(tmp_path / "replica.pickle"))
+    assert len(replica) == 0
+
+
+def test_replica_attrs():
+    replica = Replica("ldap://dummy.com", BASEDN)
+    assert "memberOf" in replica.attrs
+    assert "uid" in replica.attrs
+    assert "cn" in replica.attrs
+
+
+def test_consumer_callbacks(mocker):
+    mocker.patch("ldap.ldapobject.ReconnectLDAPObject.__init__", return_value=None)
+    replica = mocker.Mock(cookie=b"cookie")
+    consumer = _Consumer("ldap://dummy.com", replica)
+    assert consumer.syncrepl_get_cookie() == b"cookie"
+    consumer.syncrepl_set_cookie(b"new")
+    replica._set_cookie.assert_called_once_with(b"new")
+    consumer.syncrepl_entry("dn", {}, "u1")
+    replica._store.assert_called_once_with("u1", "dn", {})
+    consumer.syncrepl_delete(["u1"])
+    replica._delete.assert_called_once_with(["u1"])
+    consumer.syncrepl_present(None, refreshDeletes=True)
+    replica._present.assert_called_once_with(None, True)
+    consumer.syncrepl_refreshdone()
+    replica._refresh_done.assert_called_once_with()
+
+
+@pytest.fixture
+def consumer(mocker):
+    consumer = mocker.Mock()
+    mocker.patch("fasjson.lib.ldap.replica._Consumer", return_value=consumer)
+    return consumer
+
+
+@pytest.fixture
+def credentials(mocker):
+    ccache_name = mocker.patch("fasjson.lib.ldap.replica.gssapi.raw.krb5_ccache_name")
+    credentials = mocker.patch("fasjson.lib.ldap.replica.gssapi.Credentials")
+    return ccache_name, credentials
+
+
+def test_replica_sync(replica, consumer, credentials):
+    consumer.syncrepl_search.return_value = 42
+    consumer.syncrepl_poll.side_effect = [True, ldap.TIMEOUT(), False]
+    replica._sync()
+    # The bind uses the replica's own credentials cache, not the process' KRB5CCNAME
+    ccache_name, credentials = credentials
+    ccache = f"MEMORY:fasjson-replica-{id(replica)}"
+    ccache_name.assert_called_once_with(ccache.encode("utf-8"))
+    credentials.assert_called_once_with(usage="initiate", store={"ccache": ccache})
+    consumer.sasl_gssapi_bind_s.assert_called_once_with()
+    consumer.syncrepl_search.assert_called_once_with(
+        f"cn=accounts,{BASEDN}",
+        ldap.SCOPE_SUBTREE,
+        mode="refreshAndPersist",
+        filterstr="(|(objectClass=fasUser)(objectClass=fasGroup))",
+        attrlist=replica.attrs,
+    )
+    assert consumer.syncrepl_poll.call_count == 3
+    consumer.syncrepl_poll.assert_called_with(msgid=42, timeout=replica.poll_timeout)
+    consumer.unbind_s.assert_called_once_with()
+
+
+def test_replica_sync_keytab(consumer, credentials, mocker):
+    consumer_class = mocker.patch("fasjson.lib.ldap.replica._Consumer", return_value=consumer)
+    replica = Replica(lambda: "ldap://ldap1:389", BASEDN, keytab="/etc/keytabs/http")
+    replica.stop()
+    replica._sync()
+    credentials[1].assert_called_once_with(
+        usage="initiate",
+        store={"ccache": replica._ccache, "client_keytab": "/etc/keytabs/http"},
+    )
+    consumer_class.assert_called_once_with("ldap://ldap1:389", replica, retry_max=3)
+
+
+def test_replica_sync_stopped(replica, consumer, credentials):
+    consumer.unbind_s.side_effect = ldap.SERVER_DOWN()
+    replica.stop()
+    replica._sync()
+    consumer.syncrepl_poll.assert_not_called()
+
+
+def test_replica_run_error(replica, mocker):
+    replica.ready = True
+
+    def _sync():
+        replica.stop()
+        raise ldap.SERVER_DOWN({"desc": "Can't contact LDAP server"})
+
+    mocker.patch.object(replica, "_sync", side_effect=_sync)
+    replica._run()
+    assert replica.ready is False
+    assert len(replica) == 4
+
+
+def test_replica_run_credentials_error(replica, consumer, mocker):
+    mocker.patch("fasjson.lib.ldap.replica.gssapi.raw.krb5_ccache_name")
+
+    def _credentials(**kwargs):
+        replica.stop()
+        raise gssapi.exceptions.GSSError(851968, 2529639053)
+
+    mocker.patch("fasjson.lib.ldap.replica.gssapi.Credentials", side_effect=_credentials)
+    replica.ready = True
+    replica._run()
+    assert replica.ready is False
+    consumer.sasl_gssapi_bind_s.assert_not_called()
+
+
+def test_replica_run_refresh_required(replica, mocker):
+    replica.cookie = b"cookie"
+    error = ldap.LDAPError({"result": SYNC_REFRESH_REQUIRED, "desc": "Refresh required"})
+    calls = []
+
+    def _sync():
+        calls.append(None)
+        if len(calls) == 1:
+            raise error
+        replica.stop()
+
+    mocker.patch.object(replica, "_sync", side_effect=_sync)
+    replica._run()
+    assert replica.cookie is None
+    assert len(replica) == 0
+
+
+def test_replica_start(replica, mocker):
+    mocker.patch.object(replica, "_run")
+    replica.start()
+    replica._thread.join()
+    replica._run.assert_called_once_with()
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from fasjson.lib.ldap.cache import TTLCache
+from fasjson.lib.ldap.version import DirectoryVersion
+
+
+@pytest.fixture
+def clock(mocker):
+    monotonic = mocker.patch("fasjson.lib.ldap.version.time.monotonic")
+    monotonic.return_value = 1000
+    return monotonic
+
+
+def test_directory_version(clock, mocker):
+    version = DirectoryVersion(interval=5)
+    probe = mocker.Mock(return_value="1")
+    # Without a store, the first value is a change
+    assert version.update(probe) is True
+    assert version.value == "1"
+
+    # Not probed again before the interval
+    probe.return_value = "2"
+    clock.return_value = 1004
+    assert version.update(probe) is False
+    assert probe.call_count == 1
+
+    clock.return_value = 1005
+    assert version.update(probe) is True
+    assert version.value == "2"
+    clock.return_value = 1010
+    assert version.update(probe) is False
+    assert version.stats == {"probes": 3, "changes": 2}
+
+
+def test_directory_version_store(clock, mocker):
+    store = TTLCache()
+    store.set("value", "1")
+    version = DirectoryVersion(interval=5, store=store)
+    probe = mocker.Mock(return_value="1")
+    # The value has not changed since the previous process
+    assert version.update(probe) is False
+    assert version.value == "1"
+
+    # Another process has seen the change
+    store.set("value", "2")
+    probe.return_value = "2"
+    clock.return_value = 1005
+    assert version.update(probe) is False
+
+    probe.return_value = "3"
+    clock.return_value = 1010
+    assert version.update(probe) is True
+    assert store.get("value") == "3"
+    assert version.stats == {"probes": 3, "changes": 1}
+
+
+def test_directory_version_store_expired(clock, mocker):
+    store = TTLCache()
+    version = DirectoryVersion(interval=5, store=store)
+    assert version.update(mocker.Mock(return_value="1")) is True
+    assert store.get("value") == "1"
+
+
+def test_directory_version_probing(clock, mocker):
+    # Other threads don't wait for the probe
+    version = DirectoryVersion()
+    probe = mocker.Mock()
+    with version._lock:
+        result = []
+        thread = threading.Thread(target=lambda: result.append(version.update(probe)))
+        thread.start()
+        thread.join()
+    assert result == [False]
+    probe.assert_not_called()
+
+
+def test_directory_version_error(clock, mocker):
+    version = DirectoryVersion()
+    with pytest.raises(RuntimeError):
+        version.update(mocker.Mock(side_effect=RuntimeError))
+    # The next call probes again
+    assert version.update(mocker.Mock(return_value="1")) is True
+    assert version.stats == {"probes": 1, "changes": 1}
@@ -96,3 +96,15 @@ def test_logging_config(mocker):
     }
     create_app(config={"LOGGING": logging_config})
     dictConfig.assert_called_with(logging_config)
+
+
+def test_secret_key_file(tmp_path):
+    secret_key_path = tmp_path / "session.key"
+    secret_key_path.write_bytes(b"secret")
+    app = create_app(config={"FASJSON_SECRET_KEY_FILE": str(secret_key_path)})
+    assert app.config["SECRET_KEY"] == b"secret"
+    # An explicit secret key is kept
+    app = create_app(
+        config={"SECRET_KEY": "other", "FASJSON_SECRET_KEY_FILE": str(secret_key_path)}
+    )
+    assert app.config["SECRET_KEY"] == "other"  # noqa: S105
@@ -1,6 +1,10 @@
 import json
+from types import SimpleNamespace
 
 import ldap
+import pytest
+
+from fasjson.web.app import create_app
 
 
 def test_root_anonymous(anon_client):
@@ -22,6 +26,61 @@ def test_root_anonymous(anon_client):
     assert body == expected
 
 
+@pytest.fixture
+def stats_client(fixture_dir):
+    app = create_app(
+        {
+            "FASJSON_STATS": True,
+            "FASJSON_IPA_CONFIG_PATH": f"{fixture_dir}/ipa.default.conf",
+            "FASJSON_IPA_CA_CERT_PATH": f"{fixture_dir}/ipa.ca.crt",
+            "TESTING": True,
+        }
+    )
+    with app.test_client() as client:
+        yield client
+
+
+def test_stats(stats_client, mocker):
+    mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=([SimpleNamespace(target="ldap1", port=389, priority=0, weight=0)], 3600),
+    )
+    pkey_cache = stats_client.application.extensions["fasjson_ldap_cache"]["pkeys"]
+    pkey_cache.set("dummy", ("a", "b"))
+    pkey_cache.get("dummy")
+    rv = stats_client.get("/stats")
+
+    assert rv.status_code == 200
+    assert rv.get_json() == {
+        "caches": {"pkeys": {"size": 1, "hits": 1, "misses": 0, "evictions": 0}},
+        "pool": {"size": 0, "created": 0, "reused": 0, "discarded": 0},
+        "directory_version": {"probes": 0, "changes": 0},
+        "srv": {"hits": 0, "refreshes": 1, "failures": 0},
+    }
+
+
+def test_stats_no_directory_version(stats_client):
+    stats_client.application.extensions["fasjson_directory_version"] = None
+    rv = stats_client.get("/stats")
+
+    assert rv.status_code == 200
+    assert "directory_version" not in rv.get_json()
+
+
+def test_stats_no_srv_cache(stats_client, mocker):
+    # The SRV records have not been resolved yet
+    mocker.patch.object(stats_client.application, "before_request_funcs", {})
+    rv = stats_client.get("/stats")
+
+    assert rv.status_code == 200
+    assert "srv" not in rv.get_json()
+
+
+def test_stats_disabled(anon_client):
+    rv = anon_client.get("/stats")
+    assert rv.status_code == 404
+
+
 def test_live_success(anon_client):
     rv = anon_client.get("/healthz/live")
     assert 200 == rv.status_code
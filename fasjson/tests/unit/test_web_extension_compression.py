@@ -0,0 +1,164 @@
+import gzip
+import json
+import zlib
+
+import brotli
+import pytest
+import zstandard
+from flask import Response
+
+from fasjson.web.app import create_app
+from fasjson.web.extensions import flask_compression
+from fasjson.web.extensions.flask_compression import (
+    _compress_stream,
+    Compression,
+    GzipCompressor,
+    ZstdCompressor,
+)
+
+
+DATA = {
+    "result": [{"username": f"user-{i}", "emails": [f"user-{i}@example.test"]} for i in range(200)]
+}
+BODY = json.dumps(DATA).encode()
+
+DECOMPRESS = {
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+@pytest.fixture
+def closed():
+    return []
+
+
+@pytest.fixture
+def test_client(app, closed):
+    def json_view():
+        response = Response(BODY, mimetype="application/json")
+        response.set_etag("dummy")
+        return response
+
+    def small_view():
+        return Response(b"{}", mimetype="application/json")
+
+    def text_view():
+        return Response(BODY, mimetype="text/html")
+
+    def error_view():
+        return Response(BODY, status=404, mimetype="application/json")
+
+    def encoded_view():
+        return Response(BODY, mimetype="application/json", headers={"Content-Encoding": "gzip"})
+
+    def stream_view():
+        def generate():
+            try:
+                yield "["
+                for _i in range(200):
+                    yield b'{"name":"item"},'
+                yield b"{}]"
+            finally:
+                closed.append(True)
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    for view in (json_view, small_view, text_view, error_view, encoded_view, stream_view):
+        app.add_url_rule(f"/test/{view.__name__}", view.__name__, view)
+    with app.test_client() as client:
+        yield client
+
+
+def test_compression_init(app):
+    assert app.extensions["fasjson_compression"] == ["zstd", "br", "gzip"]
+
+
+def test_compression_delayed_init(app):
+    compression = Compression()
+    assert compression.app is None
+    app.config["FASJSON_COMPRESSION"] = ["gzip"]
+    compression.init_app(app)
+    assert app.extensions["fasjson_compression"] == ["gzip"]
+
+
+def test_compression_unknown():
+    with pytest.raises(ValueError):
+        create_app({"FASJSON_COMPRESSION": ["gzip", "lzma"]})
+
+
+def test_compression_unavailable(mocker):
+    mocker.patch.dict(flask_compression.COMPRESSORS, {"zstd": (ZstdCompressor, False)})
+    app = create_app()
+    assert app.extensions["fasjson_compression"] == ["br", "gzip"]
+
+
+def test_compression_disabled():
+    app = create_app({"FASJSON_COMPRESSION": []})
+    assert app.extensions["fasjson_compression"] == []
+    with app.test_request_context("/"):
+        response = app.process_response(Response(BODY, mimetype="application/json"))
+    assert "Vary" not in response.headers
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compression(test_client, encoding):
+    rv = test_client.get("/test/json_view", headers={"Accept-Encoding": encoding})
+    assert rv.headers["Content-Encoding"] == encoding
+    assert rv.headers["Vary"] == "Accept-Encoding"
+    assert rv.headers["ETag"] == 'W/"dummy"'
+    assert int(rv.headers["Content-Length"]) < len(BODY)
+    assert DECOMPRESS[encoding](rv.get_data()) == BODY
+
+
+def test_compression_preference(test_client):
+    rv = test_client.get("/test/json_view", headers={"Accept-Encoding": "gzip, br, zstd"})
+    assert rv.headers["Content-Encoding"] == "zstd"
+    rv = test_client.get("/test/json_view", headers={"Accept-Encoding": "gzip, br;q=0.5"})
+    assert rv.headers["Content-Encoding"] == "gzip"
+
+
+@pytest.mark.parametrize("headers", [{}, {"Accept-Encoding": "deflate"}])
+def test_compression_not_accepted(test_client, headers):
+    rv = test_client.get("/test/json_view", headers=headers)
+    assert "Content-Encoding" not in rv.headers
+    assert rv.headers["Vary"] == "Accept-Encoding"
+    assert rv.get_data() == BODY
+
+
+def test_compression_small(test_client):
+    rv = test_client.get("/test/small_view", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in rv.headers
+    assert rv.headers["Vary"] == "Accept-Encoding"
+    assert rv.get_data() == b"{}"
+
+
+@pytest.mark.parametrize("view", ["text_view", "error_view", "encoded_view"])
+def test_compression_skipped(test_client, view):
+    rv = test_client.get(f"/test/{view}", headers={"Accept-Encoding": "br"})
+    assert rv.headers.get("Content-Encoding") != "br"
+    assert "Vary" not in rv.headers
+    assert rv.get_data() == BODY
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compression_stream(test_client, closed, encoding):
+    rv = test_client.get("/test/stream_view", headers={"Accept-Encoding": encoding})
+    assert rv.headers["Content-Encoding"] == encoding
+    assert rv.is_streamed
+    assert "Content-Length" not in rv.headers
+    chunks = list(rv.response)
+    # Each chunk is flushed, it can be decompressed as soon as it is received
+    if encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decompressor.decompress(chunks[0]) == b"["
+    assert DECOMPRESS[encoding](b"".join(chunks)) == b"[" + b'{"name":"item"},' * 200 + b"{}]"
+    rv.close()
+    assert closed == [True]
+
+
+def test_compression_stream_not_closable():
+    # A list of chunks has nothing to close
+    chunks = _compress_stream(["[", b"{}]"], GzipCompressor())
+    assert gzip.decompress(b"".join(chunks)) == b"[{}]"
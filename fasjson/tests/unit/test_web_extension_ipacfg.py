@@ -10,7 +10,9 @@ from fasjson.web.extensions.flask_ipacfg import (
     _mix_weight,
     IPAConfig,
     query_srv,
+    resolve_srv,
     sort_prio_weight,
+    SRVCache,
 )
 
 
@@ -25,6 +27,9 @@ xmlrpc_uri = https://ipa.testing/ipa/xml
 enable_ra = True
 """
 
+LDAP1 = SimpleNamespace(target="ldap1", port=389, priority=0, weight=0)
+LDAP2 = SimpleNamespace(target="ldap2", port=389, priority=0, weight=0)
+
 
 @pytest.fixture
 def app_with_filtered_config(app, mocker):
@@ -125,11 +130,14 @@ def test_already_loaded(mocker, app):
 def test_detect_dns(mocker, app):
     ext = IPAConfig(app)
     mocker.patch(
-        "fasjson.web.extensions.flask_ipacfg.query_srv",
-        return_value=[
-            SimpleNamespace(target="ldap1", port=389),
-            SimpleNamespace(target="ldap2", port=389),
-        ],
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=(
+            [
+                LDAP1,
+                SimpleNamespace(target="ldap2", port=389, priority=10, weight=0),
+            ],
+            3600,
+        ),
     )
     with app.test_request_context("/v1/"):
         ext._detect_ldap()
@@ -137,6 +145,140 @@ def test_detect_dns(mocker, app):
     assert app.config["FASJSON_LDAP_URI"] == expected
 
 
+def test_detect_dns_cached(mocker, app):
+    ext = IPAConfig(app)
+    resolve_srv = mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=([LDAP1], 3600),
+    )
+    with app.test_request_context("/v1/"):
+        ext._detect_ldap()
+        ext._detect_ldap()
+    resolve_srv.assert_called_once()
+    assert ext.srv_cache.stats == {"hits": 1, "refreshes": 1, "failures": 0}
+    assert app.config["FASJSON_LDAP_URI"] == "ldap://ldap1:389"
+
+
+def test_detect_dns_failure(mocker, app):
+    ext = IPAConfig(app)
+    mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        side_effect=dns.exception.Timeout,
+    )
+    with app.test_request_context("/v1/"):
+        ext._detect_ldap()
+    assert app.config["FASJSON_LDAP_URI"] == "ldap://ipa.example.test"
+
+
+@pytest.fixture
+def monotonic(mocker):
+    clock = mocker.patch("fasjson.web.extensions.flask_ipacfg.time.monotonic")
+    clock.return_value = 1000
+    return clock
+
+
+def test_srv_cache_expired(mocker, monotonic):
+    resolve_srv = mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        side_effect=[([LDAP1], 60), ([LDAP2], 60)],
+    )
+    cache = SRVCache("_ldap._tcp.example.com", background=False)
+    assert cache.get() == [LDAP1]
+    monotonic.return_value = 1030
+    assert cache.get() == [LDAP1]
+    assert resolve_srv.call_count == 1
+    monotonic.return_value = 1060
+    assert cache.get() == [LDAP2]
+    assert resolve_srv.call_count == 2
+    assert cache.stats == {"hits": 2, "refreshes": 2, "failures": 0}
+
+
+def test_srv_cache_background(mocker, monotonic):
+    thread = mocker.patch("fasjson.web.extensions.flask_ipacfg.threading.Thread")
+    mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        side_effect=[([LDAP1], 60), ([LDAP2], 60)],
+    )
+    cache = SRVCache("_ldap._tcp.example.com")
+    assert cache.get() == [LDAP1]
+    monotonic.return_value = 1060
+    # The stale records are returned while the refresh is running
+    assert cache.get() == [LDAP1]
+    thread.assert_called_once_with(target=cache._refresh_and_unlock, daemon=True)
+    thread.return_value.start.assert_called_once_with()
+    # Only one refresh at a time
+    cache.get()
+    thread.assert_called_once()
+    cache._refresh_and_unlock()
+    assert cache.get() == [LDAP2]
+
+
+def test_srv_cache_min_ttl(mocker, monotonic):
+    resolve_srv = mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=([LDAP1], 0),
+    )
+    cache = SRVCache("_ldap._tcp.example.com", background=False)
+    cache.get()
+    cache.get()
+    resolve_srv.assert_called_once()
+
+
+def test_srv_cache_resolver_outage(mocker, monotonic):
+    resolve_srv = mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        side_effect=[([LDAP1], 60), dns.exception.Timeout, ([LDAP2], 60)],
+    )
+    cache = SRVCache("_ldap._tcp.example.com", background=False)
+    cache.get()
+    monotonic.return_value = 1060
+    # Keep serving the last known list
+    assert cache.get() == [LDAP1]
+    assert cache.get() == [LDAP1]
+    assert resolve_srv.call_count == 2
+    assert cache.stats["failures"] == 1
+    # Retry later
+    monotonic.return_value = 1060 + SRVCache.retry_interval
+    cache.get()
+    assert cache.get() == [LDAP2]
+
+
+def test_srv_cache_never_resolved(mocker, monotonic):
+    resolve_srv = mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        side_effect=[dns.exception.Timeout, ([LDAP1], 60)],
+    )
+    cache = SRVCache("_ldap._tcp.example.com", background=False)
+    with pytest.raises(dns.exception.Timeout):
+        cache.get()
+    # Don't query the resolver again right away
+    with pytest.raises(dns.exception.Timeout):
+        cache.get()
+    assert resolve_srv.call_count == 1
+    monotonic.return_value = 1000 + SRVCache.retry_interval
+    assert cache.get() == [LDAP1]
+
+
+def test_srv_cache_shuffle(mocker, monotonic):
+    records = [
+        SimpleNamespace(target=f"ldap{idx}", port=389, priority=0, weight=0) for idx in range(3)
+    ]
+    backup = SimpleNamespace(target="backup", port=389, priority=10, weight=0)
+    mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=([*records, backup], 60),
+    )
+    shuffle = mocker.patch("fasjson.web.extensions.flask_ipacfg.random.shuffle")
+    shuffle.side_effect = lambda records: records.reverse()
+    cache = SRVCache("_ldap._tcp.example.com", background=False)
+    # The records of the same priority are shuffled on each lookup
+    assert cache.get() == [*reversed(records), backup]
+    assert cache.get() == [*reversed(records), backup]
+    assert shuffle.call_count == 2
+    # The cached list is left untouched
+    assert cache.records == [*records, backup]
+
+
 def test_dns_query():
     resolver = mock.Mock()
     resolver.resolve.return_value = _make_dns_answer(
@@ -154,6 +296,14 @@ def test_dns_query():
     assert result_names[1:3] in [["ldap2", "ldap3"], ["ldap3", "ldap2"]]
 
 
+def test_dns_resolve_ttl():
+    resolver = mock.Mock()
+    resolver.resolve.return_value = _make_dns_answer([{"name": "ldap1"}])
+    result, ttl = resolve_srv("_ldap._tcp.example.com", resolver)
+    assert [str(r.target) for r in result] == ["ldap1"]
+    assert 3590 < ttl <= 3600
+
+
 def test_dns_query_same_prio_same_weight():
     names = ["ldap1", "ldap2", "ldap3"]
     resolver = mock.Mock()
@@ -0,0 +1,27 @@
+import pytest
+
+from fasjson.web.app import create_app
+from fasjson.web.extensions.flask_jsonencoder import JSONEncoder as JSONEncoderExtension
+from fasjson.web.utils.encoding import JSONEncoder, OrjsonEncoder
+
+
+def test_jsonencoder_init(app):
+    assert isinstance(app.extensions["fasjson_json_encoder"], OrjsonEncoder)
+
+
+def test_jsonencoder_delayed_init(app):
+    extension = JSONEncoderExtension()
+    assert extension.app is None
+    app.config["FASJSON_JSON_ENCODER"] = "json"
+    extension.init_app(app)
+    assert isinstance(app.extensions["fasjson_json_encoder"], JSONEncoder)
+
+
+def test_jsonencoder_config():
+    app = create_app({"FASJSON_JSON_ENCODER": "json"})
+    assert isinstance(app.extensions["fasjson_json_encoder"], JSONEncoder)
+
+
+def test_jsonencoder_unknown():
+    with pytest.raises(ValueError):
+        create_app({"FASJSON_JSON_ENCODER": "unknown"})
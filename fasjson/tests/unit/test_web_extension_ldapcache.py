@@ -0,0 +1,86 @@
+from fasjson.lib.ldap.bloom import NameFilter
+from fasjson.lib.ldap.cache import SQLiteCache, TTLCache
+from fasjson.web.app import create_app
+from fasjson.web.extensions.flask_ldapcache import LDAPCache
+
+
+def test_ldapcache_init(app):
+    cache = app.extensions["fasjson_ldap_cache"]["pkeys"]
+    assert isinstance(cache, TTLCache)
+    assert cache.max_size == app.config["FASJSON_PKEY_CACHE_SIZE"]
+    assert cache.ttl == app.config["FASJSON_PKEY_CACHE_TTL"]
+
+
+def test_ldapcache_delayed_init(app):
+    ldap_cache = LDAPCache()
+    assert ldap_cache.app is None
+    ldap_cache.init_app(app)
+    assert isinstance(app.extensions["fasjson_ldap_cache"]["pkeys"], TTLCache)
+
+
+def test_ldapcache_disabled():
+    app = create_app({"FASJSON_PKEY_CACHE_SIZE": 0})
+    assert app.extensions["fasjson_ldap_cache"]["pkeys"] is None
+    assert app.extensions["fasjson_ldap_cache"]["entries"] is None
+    assert app.extensions["fasjson_ldap_cache"]["missing"] is None
+    assert app.extensions["fasjson_ldap_cache"]["names"] is None
+    assert app.extensions["fasjson_ldap_cache"]["responses"] is None
+
+
+def test_ldapcache_directory_version(app):
+    version = app.extensions["fasjson_directory_version"]
+    assert version.interval == 5
+    assert isinstance(version.store, TTLCache)
+    app = create_app({"FASJSON_DIRECTORY_VERSION_INTERVAL": 0})
+    assert app.extensions["fasjson_directory_version"] is None
+
+
+def test_ldapcache_directory_version_no_cache():
+    # There is nothing to clear
+    app = create_app({"FASJSON_PKEY_CACHE_SIZE": 0, "FASJSON_NAME_FILTER": False})
+    assert app.extensions["fasjson_directory_version"] is None
+
+
+def test_ldapcache_entries():
+    app = create_app({"FASJSON_ENTRY_CACHE_SIZE": 100, "FASJSON_ENTRY_CACHE_TTL": 10})
+    cache = app.extensions["fasjson_ldap_cache"]["entries"]
+    assert isinstance(cache, TTLCache)
+    assert cache.max_size == 100
+    assert cache.ttl == 10
+
+
+def test_ldapcache_missing():
+    app = create_app({"FASJSON_NEGATIVE_CACHE_SIZE": 100, "FASJSON_NEGATIVE_CACHE_TTL": 5})
+    cache = app.extensions["fasjson_ldap_cache"]["missing"]
+    assert isinstance(cache, TTLCache)
+    assert cache.max_size == 100
+    assert cache.ttl == 5
+
+
+def test_ldapcache_responses():
+    app = create_app({"FASJSON_RESPONSE_CACHE_SIZE": 1000, "FASJSON_RESPONSE_CACHE_TTL": 20})
+    cache = app.extensions["fasjson_ldap_cache"]["responses"]
+    assert isinstance(cache, TTLCache)
+    assert cache.max_size == 1000
+    assert cache.ttl == 20
+    # The size is the length of the encoded response
+    assert cache.sizeof((b"abc", None, frozenset())) == 3
+
+
+def test_ldapcache_names():
+    app = create_app({"FASJSON_NAME_FILTER": True, "FASJSON_NAME_FILTER_TTL": 60})
+    name_filter = app.extensions["fasjson_ldap_cache"]["names"]
+    assert isinstance(name_filter, NameFilter)
+    assert name_filter.ttl == 60
+    assert name_filter.error_rate == 0.01
+
+
+def test_ldapcache_shared(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    app = create_app({"FASJSON_CACHE_PATH": path, "FASJSON_ENTRY_CACHE_SIZE": 100})
+    caches = app.extensions["fasjson_ldap_cache"]
+    assert isinstance(caches["pkeys"], SQLiteCache)
+    assert caches["pkeys"].path == path
+    assert caches["pkeys"].namespace == "pkeys"
+    assert isinstance(caches["entries"], SQLiteCache)
+    assert caches["entries"].namespace == "entries"
@@ -0,0 +1,63 @@
+import ldap
+import pytest
+from flask import g
+
+from fasjson.lib.ldap.pool import ConnectionPool
+from fasjson.web.extensions.flask_ldappool import LDAPPool
+
+
+def test_ldappool_init(app):
+    pool = app.extensions["fasjson_ldap_pool"]
+    assert isinstance(pool, ConnectionPool)
+    assert pool.max_size == app.config["FASJSON_LDAP_POOL_SIZE"]
+
+
+def test_ldappool_delayed_init(app):
+    ext = LDAPPool()
+    assert ext.app is None
+    ext.init_app(app)
+    assert app.extensions["fasjson_ldap_pool"].max_size == app.config["FASJSON_LDAP_POOL_SIZE"]
+
+
+def test_ldappool_release(app, mocker):
+    pool = app.extensions["fasjson_ldap_pool"]
+    client = mocker.Mock()
+    with app.app_context():
+        g.ldap_client = client
+        g.ldap_client_key = "dummy"
+    assert len(pool) == 1
+    client.reset.assert_called_once_with()
+    assert pool.acquire("dummy", mocker.Mock()) is client
+
+
+def test_ldappool_release_no_client(app):
+    pool = app.extensions["fasjson_ldap_pool"]
+    with app.app_context():
+        pass
+    assert len(pool) == 0
+
+
+def test_ldappool_release_ldap_error(app, mocker):
+    pool = app.extensions["fasjson_ldap_pool"]
+    client = mocker.Mock()
+    ctx = app.app_context()
+    ctx.push()
+    g.ldap_client = client
+    g.ldap_client_key = "dummy"
+    ctx.pop(ldap.SERVER_DOWN())
+    assert len(pool) == 0
+    client.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize("error", [ldap.SERVER_DOWN, ldap.LOCAL_ERROR])
+def test_ldappool_release_handled_error(app, client, gss_user, mocker, error):
+    # The API's error handlers catch the exception, the teardown does not receive it
+    pool = app.extensions["fasjson_ldap_pool"]
+    ldap_client = mocker.Mock()
+    ldap_client.whoami.side_effect = error
+    mocker.patch("fasjson.web.utils.ipa.get_client", return_value=ldap_client)
+    rv = client.get("/v1/me/")
+    assert rv.status_code == 500
+    assert len(pool) == 0
+    ldap_client.reset.assert_not_called()
+    ldap_client.close.assert_called_once_with()
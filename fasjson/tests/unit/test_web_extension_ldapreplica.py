@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from fasjson.web.app import create_app
+from fasjson.web.extensions.flask_ldapreplica import LDAPReplica
+
+
+def test_ldapreplica_disabled(app):
+    assert app.extensions["fasjson_ldap_replica"] is None
+    with app.test_request_context("/"):
+        app.preprocess_request()
+    assert app.extensions["fasjson_ldap_replica"] is None
+
+
+def test_ldapreplica_started(mocker, fixture_dir):
+    replica_class = mocker.patch("fasjson.web.extensions.flask_ldapreplica.Replica")
+    mocker.patch(
+        "fasjson.web.extensions.flask_ipacfg.resolve_srv",
+        return_value=([SimpleNamespace(target="ldap1", port=389, priority=0, weight=0)], 3600),
+    )
+    app = create_app(
+        {
+            "FASJSON_REPLICA": True,
+            "FASJSON_REPLICA_KEYTAB": "/etc/keytabs/http",
+            "FASJSON_REPLICA_PATH": "/tmp/replica",  # noqa: S108
+            "FASJSON_IPA_CONFIG_PATH": f"{fixture_dir}/ipa.default.conf",
+        }
+    )
+    # The replica is started when the application is set up, not on a request
+    replica_class.assert_called_once_with(
+        mocker.ANY,
+        "dc=example,dc=test",
+        keytab="/etc/keytabs/http",
+        path="/tmp/replica",  # noqa: S108
+        retry_interval=60,
+        persist_interval=300,
+    )
+    replica_class.return_value.start.assert_called_once_with()
+    assert app.extensions["fasjson_ldap_replica"] is replica_class.return_value
+    with app.test_request_context("/"):
+        app.preprocess_request()
+    replica_class.assert_called_once()
+
+    # The LDAP servers are detected before each connection
+    get_ldap_uri = replica_class.call_args[0][0]
+    assert get_ldap_uri() == "ldap://ldap1:389"
+
+
+def test_ldapreplica_delayed_init(app):
+    ext = LDAPReplica()
+    assert ext.app is None
+    ext.init_app(app)
+    assert app.extensions["fasjson_ldap_replica"] is None
@@ -2,6 +2,7 @@ import pytest
 from flask_restx import fields
 
 from fasjson.web.resources.base import Namespace
+from fasjson.web.utils.marshalling import compile_model
 
 
 @pytest.fixture
@@ -39,3 +40,40 @@ def test_marshal_with_field_tuple_response(api):
 
     resource = TestResource()
     assert resource.get() == ({"result": True}, 200, headers)
+
+
+@pytest.fixture
+def compiled_model(api):
+    return compile_model(api.model("Test", {"name": fields.String(), "size": fields.Integer()}))
+
+
+def test_marshal_with_compiled(app, api, compiled_model):
+    class TestResource:
+        @api.marshal_with(compiled_model)
+        def get(self):
+            return {"name": "dummy", "size": 1, "other": "value"}
+
+        @api.marshal_with(compiled_model, envelope=None)
+        def list(self):
+            return [{"name": "dummy", "size": 1}], 201, {}
+
+    resource = TestResource()
+    with app.test_request_context("/", headers={"X-Fields": "{name}"}):
+        assert resource.get() == {"result": {"name": "dummy"}}
+    with app.test_request_context("/"):
+        assert resource.get() == {"result": {"name": "dummy", "size": 1}}
+        assert resource.list() == ([{"name": "dummy", "size": 1}], 201, {})
+    assert "responses" in TestResource.get.__apidoc__
+
+
+def test_marshal_with_compiled_unsupported(app, api, compiled_model, mocker):
+    serializer = mocker.spy(compiled_model.compiled, "serializer")
+
+    class TestResource:
+        @api.marshal_with(compiled_model, mask="{name}")
+        def get(self):
+            return {"name": "dummy", "size": 1}
+
+    with app.test_request_context("/"):
+        assert TestResource().get() == {"result": {"name": "dummy"}}
+    serializer.assert_not_called()
@@ -1,3 +1,4 @@
+import json
 from functools import partial
 
 import pytest
@@ -111,6 +112,64 @@ def test_group_members_success(client, gss_user, mock_ldap_client):
     assert expected == rv.get_json()
 
 
+def test_group_members_etag(client, gss_user, mock_ldap_client):
+    members = [{"username": "admin", "usn": "1"}]
+    group = {"groupname": "admins", "usn": "10"}
+    mock_ldap_client(
+        get_group_members=lambda name, attrs, page_size, page_number: LDAPResult(
+            items=[dict(member) for member in members]
+        ),
+        get_group=lambda n, attrs=None: dict(group),
+    )
+
+    rv = client.get("/v1/groups/admins/members/")
+    assert 200 == rv.status_code
+    etag = rv.headers["ETag"]
+    rv = client.get("/v1/groups/admins/members/", headers={"If-None-Match": etag})
+    assert 304 == rv.status_code
+
+    # A member was modified
+    members[0]["usn"] = "2"
+    rv = client.get("/v1/groups/admins/members/", headers={"If-None-Match": etag})
+    assert 200 == rv.status_code
+    etag = rv.headers["ETag"]
+
+    # A member was removed from a nested group
+    members.pop()
+    rv = client.get("/v1/groups/admins/members/", headers={"If-None-Match": etag})
+    assert 200 == rv.status_code
+    assert rv.get_json() == {"result": []}
+
+
+def test_group_members_cursor(client, gss_user, mock_ldap_client, mocker, secret_key):
+    result = LDAPResult(items=[{"username": "admin"}], page_size=1, keyset=True, next_key="admin")
+    mocked = mock_ldap_client(
+        get_group_members=mocker.Mock(return_value=result),
+        get_group=lambda n, attrs=None: {"cn": n},
+    )
+    rv = client.get("/v1/groups/admins/members/?page_size=1&cursor=")
+
+    assert 200 == rv.status_code
+    assert mocked.get_group_members.call_args[1]["after"] == ""
+    assert "next_cursor" in rv.get_json()["page"]
+
+
+def test_group_members_stream(client, gss_user, mock_ldap_client):
+    data = [{"username": "admin"}, {"username": "dummy"}]
+    mock_ldap_client(
+        iter_group_members=lambda name, attrs: iter(data),
+        get_group=lambda n, attrs=None: {"cn": n},
+    )
+    rv = client.get("/v1/groups/admins/members/?stream=1")
+
+    assert 200 == rv.status_code
+    assert rv.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in rv.get_data(as_text=True).splitlines()] == [
+        {"username": "admin", "uri": "http://localhost/v1/users/admin/"},
+        {"username": "dummy", "uri": "http://localhost/v1/users/dummy/"},
+    ]
+
+
 def test_group_members_error(client, gss_user, mock_ldap_client):
     mock_ldap_client(
         # get_group_members=lambda name, ps, pn: result,
@@ -319,3 +378,37 @@ def test_group_starting_with_number(client, gss_user, mock_ldap_client):
     }
     assert 200 == rv.status_code
     assert rv.get_json() == {"result": expected}
+
+
+def test_is_member_batch(client, gss_user, mock_ldap_client, mocker):
+    memberships = {"admin": {"admins": True, "dummy": None}, "someone": {"admins": False}}
+    mocked = mock_ldap_client(check_memberships=mocker.Mock(return_value=memberships))
+
+    rv = client.post(
+        "/v1/groups/is-member/",
+        json={"usernames": ["admin", "someone", "admin"], "groups": ["admins", "dummy"]},
+    )
+
+    assert 200 == rv.status_code
+    assert rv.get_json() == {"result": memberships}
+    mocked.check_memberships.assert_called_once_with(["admin", "someone"], ["admins", "dummy"])
+
+
+def test_is_member_batch_too_many(client, gss_user, mock_ldap_client, mocker):
+    client.application.config["FASJSON_BATCH_MAX_SIZE"] = 1
+    mocked = mock_ldap_client(check_memberships=mocker.Mock())
+
+    rv = client.post("/v1/groups/is-member/", json={"usernames": ["admin"], "groups": ["a", "b"]})
+
+    assert 400 == rv.status_code
+    assert rv.get_json() == {"message": "Too many users or groups requested, the maximum is 1."}
+    mocked.check_memberships.assert_not_called()
+
+
+def test_group_etag(client, gss_user, mock_ldap_client):
+    mock_ldap_client(get_group=lambda n, attrs: {"groupname": n, "modified": "20240102030405Z"})
+
+    rv = client.get("/v1/groups/dummy-group/")
+    assert 200 == rv.status_code
+    rv = client.get("/v1/groups/dummy-group/", headers={"If-None-Match": rv.headers["ETag"]})
+    assert 304 == rv.status_code
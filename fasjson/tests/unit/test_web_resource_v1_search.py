@@ -244,3 +244,21 @@ def test_search_user_by_group(client, ldap_with_search_result):
 
     assert 200 == rv.status_code
     assert rv.get_json() == {"result": expected, "page": page}
+
+
+def test_search_user_cursor(client, ldap_with_search_result, secret_key):
+    mocked = ldap_with_search_result(num=1, page_size=40, page_number=1, total_results=1)
+    rv = client.get("/v1/search/users/?username=dummy&cursor=")
+
+    assert 200 == rv.status_code
+    last_call_kw = mocked.search_users.call_args_list[-1][1]
+    assert last_call_kw["after"] == ""
+    assert "cursor" not in last_call_kw
+
+
+def test_search_user_cursor_only(client, ldap_with_search_result, secret_key):
+    ldap_with_search_result(num=1, page_size=40, page_number=1, total_results=1)
+    rv = client.get("/v1/search/users/?cursor=")
+
+    assert 400 == rv.status_code
+    assert rv.get_json() == {"message": "At least one search term must be provided."}
@@ -1,5 +1,8 @@
+import json
 from functools import partial
 
+import cbor2
+import msgpack
 import pytest
 
 from fasjson.lib.ldap.client import LDAPResult
@@ -79,6 +82,40 @@ def test_user_no_private_info(client, gss_user, mock_ldap_client):
     assert rv.get_json() == {"result": expected}
 
 
+def test_user_etag(client, gss_user, mock_ldap_client):
+    data = get_user_ldap_data("dummy")
+    data["usn"] = "42"
+    mock_ldap_client(get_user=lambda u, attrs: dict(data))
+
+    rv = client.get("/v1/users/dummy/")
+    assert 200 == rv.status_code
+    etag = rv.headers["ETag"]
+
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": etag})
+    assert 304 == rv.status_code
+    assert rv.headers["ETag"] == etag
+    assert rv.get_data() == b""
+
+    # The representation depends on the mask
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": etag, "X-Fields": "{username}"})
+    assert 200 == rv.status_code
+    assert rv.headers["ETag"] != etag
+
+    # The entry was modified
+    data["usn"] = "43"
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": etag})
+    assert 200 == rv.status_code
+    assert rv.headers["ETag"] != etag
+
+
+def test_user_no_version(client, gss_user, mock_ldap_client):
+    mock_ldap_client(get_user=lambda u, attrs: get_user_ldap_data("dummy"))
+
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": "*"})
+    assert 200 == rv.status_code
+    assert "ETag" not in rv.headers
+
+
 def test_user_with_mask(client, gss_user, mock_ldap_client):
     data = get_user_ldap_data("dummy")
     mock_ldap_client(get_user=lambda u, attrs: data)
@@ -108,6 +145,92 @@ def test_users_success(client, gss_user, mock_ldap_client):
     assert rv.get_json() == {"result": expected}
 
 
+@pytest.mark.parametrize(
+    "mediatype,decode",
+    [("application/msgpack", msgpack.unpackb), ("application/cbor", cbor2.loads)],
+)
+def test_users_binary(client, gss_user, mock_ldap_client, mediatype, decode):
+    data = [get_user_ldap_data(f"dummy-{idx}") for idx in range(1, 3)]
+    data[0]["certificates"] = [b"\x00\x01", b"\x00\x02"]
+    mock_ldap_client(get_users=lambda attrs, page_size, page_number: LDAPResult(items=data))
+
+    rv = client.get("/v1/users/", headers={"Accept": mediatype})
+
+    expected = [get_user_api_output(f"dummy-{idx}") for idx in range(1, 3)]
+    # The certificates are sent as raw bytes
+    expected[0]["certificates"] = [b"\x00\x01", b"\x00\x02"]
+    assert 200 == rv.status_code
+    assert rv.mimetype == mediatype
+    assert "Accept" in rv.vary
+    assert decode(rv.get_data()) == {"result": expected}
+
+    # In base64 in JSON
+    rv = client.get("/v1/users/", headers={"Accept": "application/json"})
+    assert rv.get_json()["result"][0]["certificates"] == ["AAE=", "AAI="]
+
+
+def test_users_cursor(client, gss_user, mock_ldap_client, mocker, secret_key):
+    data = [get_user_ldap_data(f"dummy-{idx}") for idx in range(1, 3)]
+    result = LDAPResult(items=data, page_size=2, keyset=True, next_key="dummy-2")
+    mocked = mock_ldap_client(get_users=mocker.Mock(return_value=result))
+
+    rv = client.get("/v1/users/?page_size=2&cursor=")
+
+    assert 200 == rv.status_code
+    mocked.get_users.assert_called_once_with(attrs=None, page_size=2, page_number=1, after="")
+    page = rv.get_json()["page"]
+    assert page["page_size"] == 2
+    assert page["next_page"].startswith("http://localhost/v1/users/?page_size=2&cursor=")
+
+    rv = client.get(f"/v1/users/?page_size=2&cursor={page['next_cursor']}")
+    assert 200 == rv.status_code
+    assert mocked.get_users.call_args[1]["after"] == "dummy-2"
+
+
+def test_users_cursor_invalid(client, gss_user, mock_ldap_client, mocker, secret_key):
+    mocked = mock_ldap_client(get_users=mocker.Mock())
+    rv = client.get("/v1/users/?page_size=2&cursor=invalid")
+    assert 400 == rv.status_code
+    assert rv.get_json() == {"message": "Invalid cursor.", "cursor": "invalid"}
+    mocked.get_users.assert_not_called()
+
+
+def test_users_stream(client, gss_user, mock_ldap_client):
+    data = [get_user_ldap_data(f"dummy-{idx}") for idx in range(1, 4)]
+    data[1]["is_private"] = True
+    mock_ldap_client(iter_users=lambda attrs: iter(data))
+
+    rv = client.get("/v1/users/?stream=1", headers={"X-Fields": "{username,human_name}"})
+
+    assert 200 == rv.status_code
+    assert rv.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in rv.get_data(as_text=True).splitlines()] == [
+        {"username": "dummy-1", "human_name": "dummy-1"},
+        {"username": "dummy-2", "human_name": None},
+        {"username": "dummy-3", "human_name": "dummy-3"},
+    ]
+
+
+def test_users_stream_accept(client, gss_user, mock_ldap_client):
+    mock_ldap_client(iter_users=lambda attrs: iter([get_user_ldap_data("dummy")]))
+
+    rv = client.get("/v1/users/", headers={"Accept": "application/x-ndjson"})
+
+    assert 200 == rv.status_code
+    assert rv.mimetype == "application/x-ndjson"
+    assert json.loads(rv.get_data(as_text=True)) == get_user_api_output("dummy")
+
+
+def test_users_stream_paged(client, gss_user, mock_ldap_client, mocker):
+    mocked = mock_ldap_client(iter_users=mocker.Mock())
+
+    rv = client.get("/v1/users/?stream=1&page_size=10")
+
+    assert 400 == rv.status_code
+    assert rv.get_json() == {"message": "Streamed responses can't be paginated."}
+    mocked.iter_users.assert_not_called()
+
+
 def test_users_with_mask(client, gss_user, mock_ldap_client):
     data = [get_user_ldap_data(f"dummy-{idx}") for idx in range(1, 10)]
     result = LDAPResult(items=data)
@@ -127,6 +250,50 @@ def test_users_with_mask(client, gss_user, mock_ldap_client):
     assert rv.get_json() == {"result": expected}
 
 
+def test_users_batch(client, gss_user, mock_ldap_client, mocker):
+    data = [get_user_ldap_data("dummy-1"), get_user_ldap_data("Dummy-2")]
+    data[1]["is_private"] = True
+    mocked = mock_ldap_client(get_users_by_name=mocker.Mock(return_value=LDAPResult(items=data)))
+
+    rv = client.post(
+        "/v1/users/batch/",
+        json={"usernames": ["dummy-1", "dummy-2", "missing", "dummy-1"]},
+        headers={"X-Fields": "{username,human_name}"},
+    )
+
+    assert 200 == rv.status_code
+    mocked.get_users_by_name.assert_called_once_with(
+        ["dummy-1", "dummy-2", "missing"], attrs=["username", "human_name"]
+    )
+    assert rv.get_json() == {
+        "result": [
+            {"username": "dummy-1", "human_name": "dummy-1"},
+            {"username": "Dummy-2", "human_name": None},
+        ],
+        "not_found": ["missing"],
+    }
+
+
+def test_users_batch_too_many(client, gss_user, mock_ldap_client, mocker):
+    client.application.config["FASJSON_BATCH_MAX_SIZE"] = 2
+    mocked = mock_ldap_client(get_users_by_name=mocker.Mock())
+
+    rv = client.post("/v1/users/batch/", json={"usernames": ["a", "b", "c"]})
+
+    assert 400 == rv.status_code
+    assert rv.get_json() == {"message": "Too many users requested, the maximum is 2."}
+    mocked.get_users_by_name.assert_not_called()
+
+
+def test_users_batch_invalid(client, gss_user, mock_ldap_client):
+    mock_ldap_client()
+
+    rv = client.post("/v1/users/batch/", json={"usernames": "dummy"})
+
+    assert 400 == rv.status_code
+    assert "usernames" in rv.get_json()["errors"]
+
+
 def test_user_groups_success(client, gss_user, mock_ldap_client):
     groups = ["group1", "group2"]
     result = LDAPResult(items=[{"groupname": name} for name in groups])
@@ -17,7 +17,44 @@ def test_ldap_client(mocker, gss_user, app):
         basedn="dc=example,dc=test",
         login="dummy",
         timeout=30,
+        vlv=False,
+        pkey_cache=app.extensions["fasjson_ldap_cache"]["pkeys"],
+        entry_cache=None,
+        username="dummy",
+        replica=None,
+        negative_cache=None,
+        name_filter=None,
+        directory_version=app.extensions["fasjson_directory_version"],
+        response_cache=None,
+        compact_records=False,
     )
+    get_client.return_value.check_directory_version.assert_called_once_with()
+
+
+def test_ldap_client_reuse(mocker, gss_user, app):
+    get_client = mocker.patch("fasjson.web.utils.ipa.get_client")
+    with app.test_request_context("/v1/me/"):
+        app.preprocess_request()
+        g.gss_creds = object()
+        g.username = "dummy"
+        client = ldap_client()
+        # Same request
+        assert ldap_client() is client
+    get_client.assert_called_once()
+    # Next request by the same user
+    with app.test_request_context("/v1/me/"):
+        app.preprocess_request()
+        g.gss_creds = object()
+        g.username = "dummy"
+        assert ldap_client() is client
+    get_client.assert_called_once()
+    # Request by another user
+    with app.test_request_context("/v1/me/"):
+        app.preprocess_request()
+        g.gss_creds = object()
+        g.username = "other"
+        ldap_client()
+    assert get_client.call_count == 2
 
 
 def test_ldap_client_anon(mocker, gss_user, app):
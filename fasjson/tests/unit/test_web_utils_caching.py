@@ -0,0 +1,226 @@
+import msgpack
+import pytest
+
+from fasjson.lib.ldap.cache import TTLCache
+
+from .utils import get_user_api_output, get_user_ldap_data
+
+
+@pytest.fixture
+def response_cache(app):
+    cache = TTLCache(max_size=100000, ttl=30, sizeof=lambda value: len(value[0]))
+    app.extensions["fasjson_ldap_cache"]["responses"] = cache
+    return cache
+
+
+@pytest.fixture
+def mock_ldap_client(mock_ipa_client, mocker):
+    def factory(module, **kwargs):
+        client = mock_ipa_client(f"fasjson.web.resources.{module}", "ldap", **kwargs)
+        mocker.patch("fasjson.web.utils.caching.ldap_client", return_value=client)
+        return client
+
+    return factory
+
+
+@pytest.fixture
+def mock_get_user(mock_ldap_client, mocker):
+    def factory(data):
+        get_user = mocker.Mock(side_effect=lambda username, attrs: dict(data))
+        mock_ldap_client("users", get_user=get_user)
+        return get_user
+
+    return factory
+
+
+def test_cache_disabled(client, gss_user, mock_get_user):
+    get_user = mock_get_user(get_user_ldap_data("dummy"))
+
+    client.get("/v1/users/dummy/")
+    client.get("/v1/users/dummy/")
+
+    assert get_user.call_count == 2
+
+
+def test_cache_hit(client, gss_user, mock_get_user, response_cache):
+    get_user = mock_get_user(get_user_ldap_data("dummy"))
+
+    rv1 = client.get("/v1/users/dummy/")
+    rv2 = client.get("/v1/users/dummy/")
+
+    assert get_user.call_count == 1
+    assert rv2.status_code == 200
+    assert rv2.mimetype == "application/json"
+    assert rv2.get_json() == {"result": get_user_api_output("dummy")}
+    assert rv2.get_data() == rv1.get_data()
+    assert len(response_cache) == 1
+
+    # Shared with the other users
+    rv = client.get("/v1/users/dummy/", environ_base={"GSS_NAME": "someone@EXAMPLE.TEST"})
+    assert get_user.call_count == 1
+    assert rv.get_data() == rv1.get_data()
+
+
+def test_cache_key(client, gss_user, mock_get_user, response_cache):
+    get_user = mock_get_user(get_user_ldap_data("dummy"))
+
+    client.get("/v1/users/dummy/")
+    rv = client.get("/v1/users/dummy/", headers={"X-Fields": "{username}"})
+    assert get_user.call_count == 2
+    assert rv.get_json() == {"result": {"username": "dummy"}}
+    client.get("/v1/users/dummy/?a=1&b=2")
+    assert get_user.call_count == 3
+    # The order of the query arguments does not matter
+    client.get("/v1/users/dummy/?b=2&a=1")
+    assert get_user.call_count == 3
+
+
+def test_cache_representation(client, gss_user, mock_get_user, response_cache):
+    get_user = mock_get_user(get_user_ldap_data("dummy"))
+
+    client.get("/v1/users/dummy/")
+    client.get("/v1/users/dummy/", headers={"Accept": "application/msgpack"})
+    assert get_user.call_count == 2
+    rv = client.get("/v1/users/dummy/", headers={"Accept": "application/msgpack"})
+    assert get_user.call_count == 2
+    assert rv.mimetype == "application/msgpack"
+    assert rv.headers["Vary"] == "Accept"
+    assert msgpack.unpackb(rv.get_data()) == {"result": get_user_api_output("dummy")}
+    rv = client.get("/v1/users/dummy/", headers={"Accept": "*/*"})
+    assert get_user.call_count == 2
+    assert rv.mimetype == "application/json"
+
+
+def test_cache_etag(client, gss_user, mock_get_user, response_cache):
+    data = get_user_ldap_data("dummy")
+    data["usn"] = "42"
+    get_user = mock_get_user(data)
+
+    etag = client.get("/v1/users/dummy/").headers["ETag"]
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": etag})
+
+    assert get_user.call_count == 1
+    assert rv.status_code == 304
+    assert rv.headers["ETag"] == etag
+    rv = client.get("/v1/users/dummy/", headers={"If-None-Match": '"other"'})
+    assert rv.status_code == 200
+    assert rv.headers["ETag"] == etag
+
+
+def test_cache_etag_shared(client, gss_user, mock_get_user, response_cache):
+    data = get_user_ldap_data("dummy")
+    data["usn"] = "42"
+    mock_get_user(data)
+    other_user = {"GSS_NAME": "someone@EXAMPLE.TEST"}
+
+    etag = client.get("/v1/users/dummy/").headers["ETag"]
+    # The ETag of the shared response is the same as the one the endpoint builds for other users
+    response_cache.clear()
+    assert client.get("/v1/users/dummy/", environ_base=other_user).headers["ETag"] == etag
+    rv = client.get("/v1/users/dummy/", environ_base=other_user, headers={"If-None-Match": etag})
+    assert rv.status_code == 304
+
+
+def test_cache_etag_private(client, gss_user, mock_get_user, response_cache):
+    data = get_user_ldap_data("admin")
+    data["usn"] = "42"
+    data["is_private"] = True
+    mock_get_user(data)
+    other_user = {"GSS_NAME": "dummy@EXAMPLE.TEST"}
+
+    etag = client.get("/v1/users/admin/", environ_base=other_user).headers["ETag"]
+    # The private user's own entry is not anonymized, it has another ETag
+    own_etag = client.get("/v1/users/admin/").headers["ETag"]
+    assert own_etag != etag
+    rv = client.get("/v1/users/admin/", headers={"If-None-Match": etag})
+    assert rv.status_code == 200
+    assert rv.headers["ETag"] == own_etag
+    rv = client.get("/v1/users/admin/", headers={"If-None-Match": own_etag})
+    assert rv.status_code == 304
+
+
+def test_cache_private(client, gss_user, mock_get_user, response_cache):
+    data = get_user_ldap_data("admin")
+    data["is_private"] = True
+    get_user = mock_get_user(data)
+    other_user = {"GSS_NAME": "dummy@EXAMPLE.TEST"}
+
+    # Another user gets an anonymized response, the private user doesn't
+    rv = client.get("/v1/users/admin/", environ_base=other_user)
+    assert rv.get_json()["result"]["surname"] is None
+    rv = client.get("/v1/users/admin/")
+    assert rv.get_json()["result"]["surname"] == "admin"
+    assert get_user.call_count == 2
+    assert len(response_cache) == 2
+
+    # Both responses are cached
+    rv = client.get("/v1/users/admin/", environ_base=other_user)
+    assert rv.get_json()["result"]["surname"] is None
+    rv = client.get("/v1/users/admin/")
+    assert rv.get_json()["result"]["surname"] == "admin"
+    assert get_user.call_count == 2
+
+
+def test_cache_private_self_first(client, gss_user, mock_get_user, response_cache):
+    data = get_user_ldap_data("admin")
+    data["is_private"] = True
+    get_user = mock_get_user(data)
+
+    client.get("/v1/users/admin/")
+    rv = client.get("/v1/users/admin/", environ_base={"GSS_NAME": "dummy@EXAMPLE.TEST"})
+
+    # The private user's response was not shared
+    assert get_user.call_count == 2
+    assert rv.get_json()["result"]["surname"] is None
+
+
+def test_cache_error(client, gss_user, mock_get_user, response_cache):
+    get_user = mock_get_user({})
+    get_user.side_effect = lambda username, attrs: None
+
+    rv = client.get("/v1/users/dummy/")
+    client.get("/v1/users/dummy/")
+
+    assert rv.status_code == 404
+    assert get_user.call_count == 2
+    assert len(response_cache) == 0
+
+
+def test_cache_streamed(client, gss_user, mock_ldap_client, response_cache):
+    users = [get_user_ldap_data("dummy")]
+    mock_ldap_client("users", iter_users=lambda attrs: iter(users))
+
+    rv = client.get("/v1/users/", headers={"Accept": "application/x-ndjson"})
+
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/x-ndjson"
+    assert len(response_cache) == 0
+
+
+def test_cache_json_then_ndjson(client, gss_user, mock_ldap_client, response_cache, mocker):
+    users = [get_user_ldap_data("dummy")]
+    result = mocker.Mock(items=users, total=1, page_size=0, page_number=1)
+    mock_ldap_client(
+        "users",
+        get_users=mocker.Mock(return_value=result),
+        iter_users=lambda attrs: iter(users),
+    )
+
+    rv = client.get("/v1/users/")
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/json"
+    assert len(response_cache) == 1
+
+    # The cached JSON document is not served to a client that wants a stream
+    rv = client.get("/v1/users/", headers={"Accept": "application/x-ndjson"})
+    assert rv.status_code == 200
+    assert rv.mimetype == "application/x-ndjson"
+    assert rv.get_data().count(b"\n") == 1
+    assert len(response_cache) == 1
+
+
+def test_cache_unauthorized(anon_client, response_cache):
+    rv = anon_client.get("/v1/users/dummy/")
+
+    assert rv.status_code == 401
+    assert len(response_cache) == 0
@@ -0,0 +1,60 @@
+import pytest
+from flask import g
+
+from fasjson.web.utils.conditional import check_etag, make_etag, NotModified
+
+
+def test_make_etag(app):
+    with app.test_request_context("/v1/users/admin/"):
+        g.username = "admin"
+        etag = make_etag("42")
+        assert make_etag("43") != etag
+        assert make_etag("42", personal=True) != etag
+        g.username = "dummy"
+        assert make_etag("42") == etag
+
+
+def test_make_etag_representation(app):
+    etags = set()
+    for accept in ("application/json", "application/msgpack", "application/cbor"):
+        with app.test_request_context("/v1/users/admin/", headers={"Accept": accept}):
+            g.username = "admin"
+            etags.add(make_etag("42"))
+    assert len(etags) == 3
+
+
+def test_check_etag(app):
+    with app.test_request_context("/v1/users/admin/"):
+        g.username = "admin"
+        etag = make_etag("42")
+    with app.test_request_context("/v1/users/admin/", headers={"If-None-Match": f'"{etag}"'}):
+        g.username = "admin"
+        with pytest.raises(NotModified) as excinfo:
+            check_etag("42")
+        assert excinfo.value.get_headers() == [("ETag", f'"{etag}"')]
+
+
+def test_check_etag_other_representation(app):
+    with app.test_request_context("/v1/users/admin/", headers={"Accept": "application/msgpack"}):
+        g.username = "admin"
+        etag = make_etag("42")
+    with app.test_request_context("/v1/users/admin/", headers={"If-None-Match": f'"{etag}"'}):
+        g.username = "admin"
+        # The client has the MessagePack body, not the JSON one
+        check_etag("42")
+
+
+def test_check_etag_error(app):
+    with app.test_request_context("/v1/users/admin/"):
+        g.username = "admin"
+        check_etag("42")
+        response = app.process_response(app.response_class(status=500))
+    assert "ETag" not in response.headers
+
+
+def test_check_etag_unknown_version(app):
+    with app.test_request_context("/v1/users/admin/"):
+        g.username = "admin"
+        check_etag("42", None)
+        response = app.process_response(app.response_class())
+    assert "ETag" not in response.headers
@@ -0,0 +1,194 @@
+import json
+from datetime import date, datetime, time, UTC
+
+import cbor2
+import msgpack
+import pytest
+from flask import Blueprint
+
+from fasjson.web.apis import base
+from fasjson.web.apis.base import FasJsonApi, output_cbor, output_json, output_msgpack
+from fasjson.web.utils import encoding
+from fasjson.web.utils.encoding import (
+    Base64Bytes,
+    Encoder,
+    get_encoder,
+    JSONEncoder,
+    OrjsonEncoder,
+)
+
+
+DATA = {
+    "result": [
+        {
+            "username": "dummy",
+            "human_name": "Dummy Ünïcode",
+            "creation": datetime(2020, 3, 9, 10, 32, 3, tzinfo=UTC),
+            "birthday": date(2020, 3, 9),
+            "alarm": time(10, 32),
+            "raw": b"value",
+            "certificate": Base64Bytes(b"\x00\x01"),
+            "emails": ["dummy@example.test"],
+            "locked": False,
+            "count": 1,
+        }
+    ],
+}
+EXPECTED = {
+    "result": [
+        {
+            "username": "dummy",
+            "human_name": "Dummy Ünïcode",
+            "creation": "2020-03-09T10:32:03+00:00",
+            "birthday": "2020-03-09",
+            "alarm": "10:32:00",
+            "raw": "value",
+            "certificate": "AAE=",
+            "emails": ["dummy@example.test"],
+            "locked": False,
+            "count": 1,
+        }
+    ],
+}
+
+
+@pytest.fixture(params=[JSONEncoder, OrjsonEncoder])
+def encoder(request):
+    return request.param()
+
+
+def test_encode(encoder):
+    output = encoder.encode(DATA)
+    assert json.loads(output) == EXPECTED
+    assert b" " not in output.replace(b"Dummy \xc3\x9cn", b"")
+    assert "Ünïcode".encode() in output
+
+
+def test_encode_indent(encoder):
+    output = encoder.encode(DATA, indent=True)
+    assert json.loads(output) == EXPECTED
+    assert b'\n  "result": [' in output
+
+
+def test_encode_unsupported(encoder):
+    with pytest.raises(TypeError):
+        encoder.encode({"value": object()})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 10])
+def test_iterencode(encoder, chunk_size):
+    data = {"page": {"total": 3}, "result": [{"name": f"item-{i}"} for i in range(3)]}
+    parts = list(encoder.iterencode(data, "result", chunk_size))
+    assert json.loads(b"".join(parts)) == data
+    assert len(parts) == 4 + -(-3 // chunk_size)
+
+
+def test_encoder_base():
+    with pytest.raises(TypeError):
+        Encoder()
+
+
+def test_get_encoder():
+    assert isinstance(get_encoder(), OrjsonEncoder)
+    assert isinstance(get_encoder("orjson"), OrjsonEncoder)
+    assert isinstance(get_encoder("json"), JSONEncoder)
+    assert isinstance(get_encoder(JSONEncoder), JSONEncoder)
+    with pytest.raises(ValueError):
+        get_encoder("unknown")
+
+
+def test_get_encoder_no_orjson(mocker):
+    mocker.patch.object(encoding, "orjson", None)
+    assert isinstance(get_encoder(), JSONEncoder)
+    with pytest.raises(ValueError):
+        get_encoder("orjson")
+
+
+def test_output_json(app):
+    with app.test_request_context("/"):
+        response = output_json(DATA, 200, {"X-Test": "value"})
+    assert response.status_code == 200
+    assert response.headers["X-Test"] == "value"
+    assert not response.is_streamed
+    assert response.get_data().endswith(b"}\n")
+    assert json.loads(response.get_data()) == EXPECTED
+
+
+def test_output_json_indent(app):
+    app.config["FASJSON_JSON_COMPACT"] = False
+    with app.test_request_context("/"):
+        response = output_json({"result": True}, 200)
+    assert response.get_data() == b'{\n  "result": true\n}\n'
+
+
+def test_output_json_debug(app):
+    app.debug = True
+    with app.test_request_context("/"):
+        response = output_json({"result": True}, 200)
+    assert response.get_data() == b'{\n  "result": true\n}\n'
+
+
+def test_output_json_restx_settings(app):
+    app.config["RESTX_JSON"] = {"indent": 4, "sort_keys": True}
+    with app.test_request_context("/"):
+        response = output_json(DATA, 200, {"X-Test": "value"})
+    assert response.headers["X-Test"] == "value"
+    assert response.get_data().startswith(b'{\n    "')
+    assert json.loads(response.get_data()) == EXPECTED
+
+
+def test_output_json_incremental(app):
+    app.config["FASJSON_JSON_CHUNK_SIZE"] = 2
+    data = {"result": [{"name": f"item-{i}"} for i in range(5)], "page": {"page_size": 0}}
+    with app.test_request_context("/"):
+        response = output_json(data, 200)
+        small = output_json({"result": data["result"][:2]}, 200)
+    assert response.is_streamed
+    assert response.get_data().endswith(b"}\n")
+    assert json.loads(response.get_data()) == data
+    assert not small.is_streamed
+
+
+def test_output_msgpack(app):
+    with app.test_request_context("/"):
+        response = output_msgpack(DATA, 200, {"X-Test": "value"})
+    assert response.headers["X-Test"] == "value"
+    assert response.headers["Vary"] == "Accept"
+    result = msgpack.unpackb(response.get_data())["result"][0]
+    # Binary data is not encoded in base64
+    assert result.pop("certificate") == b"\x00\x01"
+    assert result.pop("raw") == b"value"
+    expected = dict(EXPECTED["result"][0])
+    del expected["certificate"], expected["raw"]
+    assert result == expected
+
+
+def test_output_cbor(app):
+    data = {"result": {"username": "dummy", "certificates": [Base64Bytes(b"\x00\x01")]}}
+    with app.test_request_context("/"):
+        response = output_cbor(data, 200, {"X-Test": "value"})
+    assert response.headers["X-Test"] == "value"
+    assert response.headers["Vary"] == "Accept"
+    assert cbor2.loads(response.get_data()) == data
+
+
+def test_output_cbor_default(app):
+    data = {"result": {"alarm": time(10, 32)}}
+    with app.test_request_context("/"):
+        response = output_cbor(data, 200)
+    assert cbor2.loads(response.get_data()) == {"result": {"alarm": "10:32:00"}}
+
+
+def test_output_cbor_unknown(app):
+    with app.test_request_context("/"), pytest.raises(TypeError):
+        output_cbor({"result": object()}, 200)
+
+
+def test_binary_representations(mocker):
+    api = FasJsonApi(Blueprint("test", __name__))
+    assert api.representations["application/msgpack"] is output_msgpack
+    assert api.representations["application/cbor"] is output_cbor
+    mocker.patch.dict(base.BINARY_REPRESENTATIONS, {"application/cbor": (output_cbor, False)})
+    api = FasJsonApi(Blueprint("test", __name__))
+    assert "application/msgpack" in api.representations
+    assert "application/cbor" not in api.representations
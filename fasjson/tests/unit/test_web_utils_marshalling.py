@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from datetime import date
+
+import pytest
+from flask_restx import fields, marshal, Model
+
+from fasjson.lib.ldap.models import UserModel as LDAPUserModel
+from fasjson.web.resources.groups import GroupModel, MemberModel, SponsorModel
+from fasjson.web.resources.users import UserAgreementsModel, UserGroupsModel, UserModel
+from fasjson.web.utils.encoding import Base64Bytes
+from fasjson.web.utils.marshalling import Binary, compile_model, CompiledModel, get_serializer
+
+from .utils import get_user_ldap_data
+
+
+@pytest.fixture
+def request_context(app):
+    with app.test_request_context("/v1/users/dummy/", base_url="https://fasjson.example.test"):
+        yield
+
+
+def get_group_ldap_data(name):
+    return {
+        "groupname": name,
+        "description": None,
+        "mailing_list": f"{name}@groups.example.test",
+        "irc": [f"#{name}", None],
+    }
+
+
+@pytest.mark.parametrize(
+    "model,item",
+    [
+        (UserModel, get_user_ldap_data("dummy")),
+        (UserModel, {**get_user_ldap_data("dummy"), "locked": None, "sshpubkeys": ["key"]}),
+        (UserModel, {"username": "dummy"}),
+        (UserModel, {"username": "dum my", "emails": ("a", "b"), "creation": date(2020, 1, 1)}),
+        (UserModel, {"username": "dummy", "locked": "true", "human_name": 42}),
+        (UserGroupsModel, get_group_ldap_data("group")),
+        (GroupModel, get_group_ldap_data("group")),
+        (MemberModel, get_user_ldap_data("dummy")),
+        (SponsorModel, get_user_ldap_data("dummy")),
+    ],
+)
+@pytest.mark.parametrize("mask", [None, "{username,groupname,uri}", "{emails,locked,creation}"])
+def test_serializer(request_context, model, item, mask):
+    expected = marshal(item, model, mask=mask)
+    assert model.compiled.serializer(mask)(dict(item)) == expected
+    assert model.compiled.serializer(mask, ordered=True)(dict(item)) == OrderedDict(expected)
+
+
+def test_serializer_uri(request_context):
+    serialize = UserModel.compiled.serializer("{uri}")
+    assert serialize({"username": "dummy"}) == {
+        "uri": "https://fasjson.example.test/v1/users/dummy/"
+    }
+    # Quoted by the URL converter
+    assert serialize({"username": "dum my"}) == {
+        "uri": "https://fasjson.example.test/v1/users/dum%20my/"
+    }
+
+
+def test_serializer_not_dict(request_context):
+    class Item:
+        def __init__(self):
+            self.username = "dummy"
+
+    serialize = MemberModel.compiled.serializer()
+    assert serialize(Item()) == marshal(Item(), MemberModel)
+
+
+def test_serializer_fields(request_context):
+    model = compile_model(
+        Model(
+            "Test",
+            {
+                "size": fields.Integer(),
+                "renamed": fields.String(attribute="name"),
+                "default": fields.String(default=lambda: "value"),
+                "nested": fields.List(fields.String(attribute="name")),
+                "relative": fields.Url("v1.users_user"),
+                "current": fields.Url(),
+                "membership": fields.Url("v1.groups_is_member", absolute=True, scheme="ftp"),
+            },
+        )
+    )
+    item = {
+        "size": 1,
+        "name": "dummy",
+        "nested": [{"name": "a"}],
+        "username": "dummy",
+        "groupname": "group",
+    }
+    assert model.compiled.serializer()(item) == marshal(item, model)
+
+
+def test_serializer_mask_cache(request_context):
+    compiled = CompiledModel(UserModel)
+    compiled.serializer("{username}")
+    compiled.serializer("{username}")
+    compiled.serializer()
+    assert compiled._compile.cache_info().hits == 1
+    assert compiled._compile.cache_info().misses == 2
+
+
+def test_marshal(request_context):
+    item = get_user_ldap_data("dummy")
+    assert SponsorModel.compiled.marshal([item]) == [marshal(item, SponsorModel)]
+    assert SponsorModel.compiled.marshal(item) == marshal(item, SponsorModel)
+
+
+def test_get_serializer(request_context):
+    item = get_user_ldap_data("dummy")
+    assert get_serializer(MemberModel)(item) == {
+        "username": "dummy",
+        "uri": "https://fasjson.example.test/v1/users/dummy/",
+    }
+    # Not compiled
+    assert get_serializer(UserAgreementsModel)({"name": "agreement"}) == {"name": "agreement"}
+    assert get_serializer(UserAgreementsModel, "{}")({"name": "agreement"}) == {}
+
+
+def test_binary_field(request_context):
+    field = Binary()
+    assert field.format("AAE=") == b"\x00\x01"
+    assert isinstance(field.format("AAE="), Base64Bytes)
+    assert isinstance(field.format(b"\x00\x01"), Base64Bytes)
+    data = get_user_ldap_data("dummy")
+    data["certificates"] = ["AAE=", "AAI="]
+    assert UserModel.compiled.marshal(data)["certificates"] == [b"\x00\x01", b"\x00\x02"]
+    assert UserModel["certificates"].container.__schema__ == {
+        "type": "string",
+        "format": "byte",
+    }
+
+
+def test_serializer_record(request_context):
+    data = get_user_ldap_data("dummy")
+    record = LDAPUserModel.get_record_class()()
+    for key, value in data.items():
+        record[key] = value
+    serialize = get_serializer(UserModel)
+    assert serialize(record) == serialize(data)
+    assert serialize(record) == marshal(data, UserModel)
@@ -1,8 +1,16 @@
 import pytest
+from flask_restx.reqparse import ParseResult
+from werkzeug.exceptions import BadRequest
 
 from fasjson.lib.ldap.client import LDAPResult
 from fasjson.web.resources.groups import GroupModel
-from fasjson.web.utils.pagination import add_page_data, paged_marshal
+from fasjson.web.utils.pagination import (
+    add_page_data,
+    decode_cursor,
+    encode_cursor,
+    get_page_kwargs,
+    paged_marshal,
+)
 
 
 @pytest.fixture
@@ -83,6 +91,17 @@ def test_paged_marshal_with_mask_arg(app, ldap_result, page_output):
     }
 
 
+def test_paged_marshal_iterator(app, ldap_result, page_output):
+    ldap_result.items = (item for item in ldap_result.items)
+    with app.test_request_context("/"):
+        output = paged_marshal(ldap_result, GroupModel, mask="{groupname}")
+
+    assert output == {
+        "result": [{"groupname": "group1"}],
+        "page": page_output,
+    }
+
+
 def test_add_page_data_last_page(app, ldap_result):
     ldap_result.page_number = 2
     output = {}
@@ -103,3 +122,74 @@ def test_add_page_data_existing_qs(app, ldap_result):
 
     expected_next_page = "http://localhost/?foo=bar&page_size=1&page_number=2"
     assert output["page"]["next_page"] == expected_next_page
+
+
+def test_cursor_roundtrip(app, secret_key):
+    with app.test_request_context("/v1/users/"):
+        cursor = encode_cursor("dummy")
+        assert cursor != "dummy"
+        assert decode_cursor(cursor) == "dummy"
+
+
+def test_cursor_first_page(app, secret_key):
+    with app.test_request_context("/v1/users/"):
+        assert decode_cursor("") == ""
+
+
+def test_cursor_invalid(app, secret_key):
+    with app.test_request_context("/v1/users/"):
+        cursor = encode_cursor("dummy")
+        with pytest.raises(BadRequest):
+            decode_cursor(cursor[:-1])
+
+
+def test_cursor_other_endpoint(app, secret_key):
+    with app.test_request_context("/v1/users/"):
+        cursor = encode_cursor("dummy")
+    with app.test_request_context("/v1/groups/"):
+        with pytest.raises(BadRequest):
+            decode_cursor(cursor)
+
+
+def test_cursor_no_secret_key(app):
+    with app.test_request_context("/v1/users/"):
+        with pytest.raises(BadRequest):
+            encode_cursor("dummy")
+
+
+def test_get_page_kwargs(app, secret_key):
+    with app.test_request_context("/v1/users/"):
+        args = ParseResult(page_size=10, page_number=2)
+        assert get_page_kwargs(args) == {"page_size": 10, "page_number": 2}
+        args["cursor"] = encode_cursor("dummy")
+        assert get_page_kwargs(args) == {"page_size": 10, "page_number": 2, "after": "dummy"}
+        args["page_size"] = None
+        with pytest.raises(BadRequest):
+            get_page_kwargs(args)
+        args["page_size"] = app.config["FASJSON_CURSOR_MAX_PAGE_SIZE"] + 1
+        with pytest.raises(BadRequest):
+            get_page_kwargs(args)
+
+
+def test_add_page_data_cursor(app, secret_key, ldap_result):
+    ldap_result.keyset = True
+    ldap_result.next_key = "group1"
+    output = {}
+    with app.test_request_context("/?page_size=1&cursor=&page_number=3&foo=bar"):
+        add_page_data(output, ldap_result, GroupModel)
+        next_cursor = output["page"]["next_cursor"]
+        assert decode_cursor(next_cursor) == "group1"
+
+    assert output["page"] == {
+        "page_size": 1,
+        "next_cursor": next_cursor,
+        "next_page": f"http://localhost/?page_size=1&cursor={next_cursor}&foo=bar",
+    }
+
+
+def test_add_page_data_cursor_last_page(app, secret_key, ldap_result):
+    ldap_result.keyset = True
+    output = {}
+    with app.test_request_context("/?page_size=1&cursor=abc"):
+        add_page_data(output, ldap_result, GroupModel)
+    assert output["page"] == {"page_size": 1}
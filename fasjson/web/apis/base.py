@@ -1,18 +1,39 @@
+import json
+from itertools import chain
+
 import ldap
+from flask import current_app, g, make_response, request
 from flask_restx import Api
 from flask_restx.api import SwaggerView
 from python_freeipa.exceptions import BadRequest
 
+from fasjson.web.utils.encoding import encode_default
+
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
 
 def handle_ldap_local_error(error):
     """When an LDAP local error occurs, return a 500 status code.
 
+    The request's LDAP client is not given back to the pool, see
+    :class:`fasjson.web.extensions.flask_ldappool.LDAPPool`.
+
     Args:
         error (ldap.LOCAL_ERROR): the exception that was raised
 
     Returns:
         dict: a description of the error
     """
+    g.ldap_client_broken = True
     return (
         {
             "message": "LDAP local error",
@@ -26,12 +47,16 @@ def handle_ldap_local_error(error):
 def handle_ldap_server_error(error):
     """When the LDAP server is down, return a 500 status code.
 
+    The request's LDAP client is not given back to the pool, see
+    :class:`fasjson.web.extensions.flask_ldappool.LDAPPool`.
+
     Args:
         error (ldap.SERVER_DOWN): the exception that was raised
 
     Returns:
         dict: a description of the error
     """
+    g.ldap_client_broken = True
     return {"message": "LDAP server is down", "source": "LDAP"}, 500
 
 
@@ -56,6 +81,74 @@ def handle_rpc_error(error):
     )
 
 
+def output_json(data, code, headers=None):
+    """Make a response with a JSON encoded body, using the application's encoder.
+
+    Listings of more than ``FASJSON_JSON_CHUNK_SIZE`` items are encoded and sent incrementally.
+    If ``RESTX_JSON`` is set, the body is encoded by the ``json`` module with these settings, like
+    Flask-RESTX does. In debug mode, the body is indented.
+    """
+    settings = current_app.config.get("RESTX_JSON")
+    if settings:
+        body = json.dumps(data, **{"default": encode_default, **settings}) + "\n"
+        return _make_response(body, code, headers)
+    encoder = current_app.extensions["fasjson_json_encoder"]
+    indent = current_app.debug or not current_app.config["FASJSON_JSON_COMPACT"]
+    chunk_size = current_app.config["FASJSON_JSON_CHUNK_SIZE"]
+    items = data.get("result") if isinstance(data, dict) else None
+    if not indent and chunk_size and isinstance(items, list) and len(items) > chunk_size:
+        body = chain(encoder.iterencode(data, "result", chunk_size), [b"\n"])
+    else:
+        body = encoder.encode(data, indent=indent) + b"\n"
+    return _make_response(body, code, headers)
+
+
+def output_msgpack(data, code, headers=None):
+    """Make a response with a MessagePack encoded body.
+
+    Binary data, such as the certificates, is sent as raw bytes instead of base64.
+    """
+    return _make_response(msgpack.packb(data, default=encode_default), code, headers)
+
+
+def output_cbor(data, code, headers=None):
+    """Make a response with a CBOR encoded body.
+
+    Binary data, such as the certificates, is sent as raw bytes instead of base64. The other
+    values that CBOR has no type for are encoded like in MessagePack.
+    """
+    body = cbor2.dumps(data, default=lambda encoder, value: encoder.encode(encode_default(value)))
+    return _make_response(body, code, headers)
+
+
+def _make_response(body, code, headers):
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    # The representation depends on the request's Accept header
+    response.vary.add("Accept")
+    return response
+
+
+# Mediatype -> (output function, whether the module it needs is installed)
+BINARY_REPRESENTATIONS = {
+    "application/msgpack": (output_msgpack, msgpack is not None),
+    "application/cbor": (output_cbor, cbor2 is not None),
+}
+
+
+def get_mediatype():
+    """Return the media type of the response to the current request.
+
+    This is the representation that :meth:`FasJsonApi.make_response` chooses according to the
+    request's ``Accept`` header.
+    """
+    mediatypes = ["application/json"]
+    mediatypes.extend(
+        mediatype for mediatype, (_output, available) in BINARY_REPRESENTATIONS.items() if available
+    )
+    return request.accept_mimetypes.best_match(mediatypes, default="application/json")
+
+
 API_DEFAULTS = {
     "title": "FAS-JSON",
     "description": "The Fedora Accounts System JSON API",
@@ -74,6 +167,11 @@ class FasJsonApi(Api):
 
         super().init_app(app, **kwargs)
 
+        self.representations["application/json"] = output_json
+        for mediatype, (output, available) in BINARY_REPRESENTATIONS.items():
+            if available:
+                self.representations[mediatype] = output
+
         self.errorhandler(ldap.LOCAL_ERROR)(handle_ldap_local_error)
         self.errorhandler(ldap.SERVER_DOWN)(handle_ldap_server_error)
         self.errorhandler(BadRequest)(handle_rpc_error)
@@ -11,8 +11,13 @@ from werkzeug.routing import BaseConverter
 from .apis.errors import api as api_errors
 from .apis.errors import blueprint as blueprint_errors
 from .apis.v1 import blueprint as blueprint_v1
-from .base_routes import root
+from .base_routes import root, stats
+from .extensions.flask_compression import Compression
 from .extensions.flask_ipacfg import IPAConfig
+from .extensions.flask_jsonencoder import JSONEncoder
+from .extensions.flask_ldapcache import LDAPCache
+from .extensions.flask_ldappool import LDAPPool
+from .extensions.flask_ldapreplica import LDAPReplica
 
 
 class NameConverter(BaseConverter):
@@ -36,6 +41,11 @@ def create_app(config=None):
     # Load the config passed as argument
     app.config.update(config or {})
 
+    # Load the secret key from a file if it is not set
+    if not app.config["SECRET_KEY"] and app.config["FASJSON_SECRET_KEY_FILE"]:
+        with open(app.config["FASJSON_SECRET_KEY_FILE"], "rb") as secret_key_file:
+            app.config["SECRET_KEY"] = secret_key_file.read()
+
     # Logging
     if app.config.get("LOGGING"):
         dictConfig(app.config["LOGGING"])
@@ -43,6 +53,11 @@ def create_app(config=None):
     # Extensions
     FlaskModAuthGSSAPI(app, abort=abort)
     IPAConfig(app)
+    JSONEncoder(app)
+    LDAPPool(app)
+    LDAPCache(app)
+    LDAPReplica(app)
+    Compression(app)
 
     # URL converters
     app.url_map.converters["name"] = NameConverter
@@ -61,5 +76,7 @@ def create_app(config=None):
 
     # Register the root view
     app.add_url_rule("/", endpoint="root", view_func=root)
+    if app.config["FASJSON_STATS"]:
+        app.add_url_rule("/stats", endpoint="stats", view_func=stats)
 
     return app
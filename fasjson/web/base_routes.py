@@ -22,6 +22,24 @@ def root():
     return jsonify({"message": "Welcome to FASJSON", "apis": apis})
 
 
+def stats():
+    """Usage counters of the process' LDAP connection pool and caches, to help size them"""
+    caches = {
+        name: {"size": len(cache), **cache.stats}
+        for name, cache in current_app.extensions["fasjson_ldap_cache"].items()
+        if cache is not None
+    }
+    pool = current_app.extensions["fasjson_ldap_pool"]
+    output = {"caches": caches, "pool": {"size": len(pool), **pool.stats}}
+    directory_version = current_app.extensions["fasjson_directory_version"]
+    if directory_version is not None:
+        output["directory_version"] = directory_version.stats
+    srv_cache = current_app.extensions["fasjson_ipacfg"].srv_cache
+    if srv_cache is not None:
+        output["srv"] = srv_cache.stats
+    return jsonify(output)
+
+
 def readiness():
     """Readiness Health Check"""
     try:
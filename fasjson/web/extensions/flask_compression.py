@@ -0,0 +1,139 @@
+import zlib
+
+from flask import current_app, request
+
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson"}
+
+
+class GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# Content-Encoding -> (compressor, whether the module it needs is installed)
+COMPRESSORS = {
+    "zstd": (ZstdCompressor, zstandard is not None),
+    "br": (BrotliCompressor, brotli is not None),
+    "gzip": (GzipCompressor, True),
+}
+
+
+class Compression:
+    """Compress the responses with an encoding that the client accepts.
+
+    The encodings are listed in ``FASJSON_COMPRESSION`` by order of preference, those that
+    require a module that is not installed are ignored. Responses smaller than
+    ``FASJSON_COMPRESSION_MIN_SIZE`` are sent uncompressed. Streamed responses are compressed as
+    they are sent: each chunk is compressed and flushed, they are never buffered.
+
+    The available encodings are stored in ``app.extensions["fasjson_compression"]``.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        encodings = []
+        for encoding in app.config["FASJSON_COMPRESSION"]:
+            if encoding not in COMPRESSORS:
+                raise ValueError(f"Unsupported compression: {encoding}")
+            if COMPRESSORS[encoding][1]:
+                encodings.append(encoding)
+        app.extensions["fasjson_compression"] = encodings
+        if encodings:
+            app.after_request(self._compress)
+
+    def _compress(self, response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+        # The response depends on the request's Accept-Encoding header
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(
+            current_app.extensions["fasjson_compression"]
+        )
+        if encoding is None:
+            return response
+        compressor = COMPRESSORS[encoding][0]()
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, compressor)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < current_app.config["FASJSON_COMPRESSION_MIN_SIZE"]:
+                return response
+            response.set_data(compressor.compress(data) + compressor.finish())
+        response.headers["Content-Encoding"] = encoding
+        # The compressed representation is not byte-for-byte identical
+        etag, _weak = response.get_etag()
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def _compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+    finally:
+        # Closing the original iterable ends the streamed request's context, if any.
+        if hasattr(chunks, "close"):
+            chunks.close()
@@ -1,6 +1,8 @@
 import configparser
 import operator
 import random
+import threading
+import time
 
 import dns.rdatatype
 import dns.resolver
@@ -13,10 +15,12 @@ class IPAConfig:
 
     def __init__(self, app=None):
         self.app = app
+        self.srv_cache = None
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app):
+        app.extensions["fasjson_ipacfg"] = self
         if "FASJSON_IPA_CONFIG_PATH" not in app.config:
             app.config.setdefault("FASJSON_IPA_CONFIG_PATH", "/etc/ipa/default.conf")
         if "FASJSON_IPA_CA_CERT_PATH" not in app.config:
@@ -44,19 +48,30 @@ class IPAConfig:
         _app.config.setdefault("FASJSON_IPA_CONFIG_LOADED", True)
 
     def _detect_ldap(self) -> None:
+        current_app.config["FASJSON_LDAP_URI"] = self.get_ldap_uri()
+
+    def get_ldap_uri(self):
+        """Return the URIs of the LDAP servers, separated by spaces.
+
+        The servers are discovered from the domain's SRV records. This must be called within an
+        application context.
+        """
         # Load the config if it wasn't loaded before
         self._load_config()
         domain = current_app.config["FASJSON_IPA_DOMAIN"]
+        qname = f"_ldap._tcp.{domain}"
+        if self.srv_cache is None or self.srv_cache.qname != qname:
+            self.srv_cache = SRVCache(qname)
         servers = []
         try:
-            answers = query_srv(f"_ldap._tcp.{domain}")
+            answers = self.srv_cache.get()
         except DNSException:
             servers.append("ldap://" + current_app.config["FASJSON_IPA_SERVER"])
         else:
             for answer in answers:
                 server = str(answer.target).rstrip(".")
                 servers.append(f"ldap://{server}:{answer.port}")
-        current_app.config["FASJSON_LDAP_URI"] = " ".join(servers)
+        return " ".join(servers)
 
 
 def _mix_weight(records):
@@ -134,13 +149,97 @@ def sort_prio_weight(records):
     return result
 
 
-def query_srv(qname, resolver=None, **kwargs):
-    """Query SRV records and sort reply according to RFC 2782
+def resolve_srv(qname, resolver=None, **kwargs):
+    """Query SRV records, sort reply according to RFC 2782 and tell how long it is valid
 
     :param qname: query name, _service._proto.domain.
-    :return: list of dns.rdtypes.IN.SRV.SRV instances
+    :return: tuple of the list of dns.rdtypes.IN.SRV.SRV instances and the TTL in seconds
     """
     if resolver is None:
         resolver = dns.resolver
     answer = resolver.resolve(qname, rdtype=dns.rdatatype.SRV, **kwargs)
-    return sort_prio_weight(answer)
+    return sort_prio_weight(answer), max(answer.expiration - time.time(), 0)
+
+
+def query_srv(qname, resolver=None, **kwargs):
+    """Query SRV records and sort reply according to RFC 2782
+
+    :param qname: query name, _service._proto.domain.
+    :return: list of dns.rdtypes.IN.SRV.SRV instances
+    """
+    return resolve_srv(qname, resolver, **kwargs)[0]
+
+
+class SRVCache:
+    """Cache the reply to a SRV query for as long as the DNS record's TTL.
+
+    The records are sorted again according to RFC 2782 each time they are handed out, so that
+    the load is spread over the servers of the same priority according to their weight.
+
+    When the TTL expires the last known records are still returned while they are refreshed in a
+    background thread. If the resolver fails, the last known records keep being used and the query
+    is retried after ``retry_interval`` seconds.
+
+    :param qname: query name, _service._proto.domain.
+    :param resolver: the DNS resolver to use, defaults to the system resolver.
+    :param background: refresh expired records in a background thread.
+    """
+
+    min_ttl = 30
+    retry_interval = 60
+
+    def __init__(self, qname, resolver=None, background=True):
+        self.qname = qname
+        self.resolver = resolver
+        self.background = background
+        self.records = None
+        self.expires_at = 0
+        self.stats = {"hits": 0, "refreshes": 0, "failures": 0}
+        self._error = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def get(self):
+        """Return the sorted SRV records, resolving them if they have never been resolved.
+
+        :raises DNSException: if the records have never been successfully resolved.
+        """
+        if self.records is None:
+            if time.monotonic() < self.expires_at:
+                # The last attempt failed, don't hammer the resolver
+                raise self._error
+            with self._refresh_lock:
+                self.refresh()
+            return sort_prio_weight(self.records)
+        self._count("hits")
+        if time.monotonic() >= self.expires_at and self._refresh_lock.acquire(blocking=False):
+            if self.background:
+                threading.Thread(target=self._refresh_and_unlock, daemon=True).start()
+            else:
+                self._refresh_and_unlock()
+        return sort_prio_weight(self.records)
+
+    def refresh(self):
+        try:
+            records, ttl = resolve_srv(self.qname, self.resolver)
+        except DNSException as e:
+            self._count("failures")
+            self._error = e
+            self.expires_at = time.monotonic() + self.retry_interval
+            if self.records is None:
+                raise
+            return
+        self._count("refreshes")
+        self.records = records
+        self.expires_at = time.monotonic() + max(ttl, self.min_ttl)
+
+    def _count(self, stat):
+        # Requests run in several threads, and the refresh lock is held while resolving
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _refresh_and_unlock(self):
+        try:
+            self.refresh()
+        finally:
+            self._refresh_lock.release()
@@ -0,0 +1,17 @@
+from fasjson.web.utils.encoding import get_encoder
+
+
+class JSONEncoder:
+    """Choose the JSON encoder of the API responses.
+
+    The encoder is stored in ``app.extensions["fasjson_json_encoder"]``, see
+    :mod:`fasjson.web.utils.encoding`.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["fasjson_json_encoder"] = get_encoder(app.config["FASJSON_JSON_ENCODER"])
@@ -0,0 +1,89 @@
+from fasjson.lib.ldap.bloom import NameFilter
+from fasjson.lib.ldap.cache import SQLiteCache, TTLCache
+from fasjson.lib.ldap.version import DirectoryVersion
+
+
+# Seconds the last version of the directory is kept, see DirectoryVersion
+DIRECTORY_VERSION_TTL = 86400
+
+
+class LDAPCache:
+    """Create the caches shared by the LDAP clients.
+
+    The caches are stored in ``app.extensions["fasjson_ldap_cache"]``, by name. A cache is
+    ``None`` when it is disabled in the configuration. If ``FASJSON_CACHE_PATH`` is set, the caches
+    are stored in this SQLite database and shared by all the processes, otherwise each process has
+    its own caches in memory.
+
+    The directory's version, which clears the caches when it changes, is stored in
+    ``app.extensions["fasjson_directory_version"]``. It is ``None`` if no cache is enabled.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        caches = {
+            "pkeys": None,
+            "entries": None,
+            "missing": None,
+            "names": None,
+            "responses": None,
+        }
+        if app.config["FASJSON_PKEY_CACHE_SIZE"]:
+            caches["pkeys"] = self._make_cache(
+                app,
+                "pkeys",
+                max_size=app.config["FASJSON_PKEY_CACHE_SIZE"],
+                ttl=app.config["FASJSON_PKEY_CACHE_TTL"],
+                sizeof=len,
+            )
+        if app.config["FASJSON_ENTRY_CACHE_SIZE"]:
+            caches["entries"] = self._make_cache(
+                app,
+                "entries",
+                max_size=app.config["FASJSON_ENTRY_CACHE_SIZE"],
+                ttl=app.config["FASJSON_ENTRY_CACHE_TTL"],
+            )
+        if app.config["FASJSON_NEGATIVE_CACHE_SIZE"]:
+            caches["missing"] = self._make_cache(
+                app,
+                "missing",
+                max_size=app.config["FASJSON_NEGATIVE_CACHE_SIZE"],
+                ttl=app.config["FASJSON_NEGATIVE_CACHE_TTL"],
+            )
+        if app.config["FASJSON_RESPONSE_CACHE_SIZE"]:
+            caches["responses"] = self._make_cache(
+                app,
+                "responses",
+                max_size=app.config["FASJSON_RESPONSE_CACHE_SIZE"],
+                ttl=app.config["FASJSON_RESPONSE_CACHE_TTL"],
+                # The size of the encoded response
+                sizeof=lambda value: len(value[0]),
+            )
+        if app.config["FASJSON_NAME_FILTER"]:
+            # The filters are rebuilt by each process, they are never shared.
+            caches["names"] = NameFilter(
+                ttl=app.config["FASJSON_NAME_FILTER_TTL"],
+                error_rate=app.config["FASJSON_NAME_FILTER_ERROR_RATE"],
+            )
+        app.extensions["fasjson_ldap_cache"] = caches
+        app.extensions["fasjson_directory_version"] = None
+        # Don't probe the server for nothing if there is no cache to clear
+        if app.config["FASJSON_DIRECTORY_VERSION_INTERVAL"] and any(
+            cache is not None for cache in caches.values()
+        ):
+            app.extensions["fasjson_directory_version"] = DirectoryVersion(
+                interval=app.config["FASJSON_DIRECTORY_VERSION_INTERVAL"],
+                # Shared like the caches. If the value expires, the caches are cleared.
+                store=self._make_cache(
+                    app, "directory_version", max_size=1, ttl=DIRECTORY_VERSION_TTL
+                ),
+            )
+
+    def _make_cache(self, app, name, **kwargs):
+        if app.config["FASJSON_CACHE_PATH"]:
+            return SQLiteCache(app.config["FASJSON_CACHE_PATH"], namespace=name, **kwargs)
+        return TTLCache(**kwargs)
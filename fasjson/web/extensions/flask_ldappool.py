@@ -0,0 +1,41 @@
+import ldap
+from flask import current_app, g
+
+from fasjson.lib.ldap.pool import ConnectionPool
+
+
+class LDAPPool:
+    """Keep the bound LDAP clients open between requests.
+
+    The pool lives as long as the WSGI process. The client used by a request is stored in ``g`` by
+    :func:`fasjson.web.utils.ipa.ldap_client` and given back to the pool when the application
+    context is torn down. It is closed instead if the request failed with an LDAP error, or if an
+    error handler set ``g.ldap_client_broken``.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["fasjson_ldap_pool"] = ConnectionPool(
+            max_size=app.config["FASJSON_LDAP_POOL_SIZE"],
+            idle_timeout=app.config["FASJSON_LDAP_POOL_IDLE_TIMEOUT"],
+            check_interval=app.config["FASJSON_LDAP_POOL_CHECK_INTERVAL"],
+        )
+        app.teardown_appcontext(self._release_client)
+
+    def _release_client(self, exception=None):
+        client = g.pop("ldap_client", None)
+        key = g.pop("ldap_client_key", None)
+        broken = g.pop("ldap_client_broken", False)
+        if client is None:
+            return
+        pool = current_app.extensions["fasjson_ldap_pool"]
+        if broken or isinstance(exception, ldap.LDAPError):
+            # The connection may be in a bad state, don't reuse it.
+            pool.discard(client)
+        else:
+            client.reset()
+            pool.release(key, client)
@@ -0,0 +1,38 @@
+from functools import partial
+
+from fasjson.lib.ldap.replica import Replica
+
+
+class LDAPReplica:
+    """Keep a local replica of the users and groups, if it is enabled in the configuration.
+
+    The replica is stored in ``app.extensions["fasjson_ldap_replica"]``, or ``None`` when it is
+    disabled. It is started when the application is set up, so the IPA configuration file must be
+    readable then. The LDAP servers are detected by :class:`IPAConfig` before each connection of
+    the replica. Until it has finished its initial synchronization, the LDAP clients query the
+    server.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["fasjson_ldap_replica"] = None
+        if not app.config["FASJSON_REPLICA"]:
+            return
+        replica = Replica(
+            partial(self._get_ldap_uri, app),
+            app.config["FASJSON_IPA_BASEDN"],
+            keytab=app.config["FASJSON_REPLICA_KEYTAB"],
+            path=app.config["FASJSON_REPLICA_PATH"],
+            retry_interval=app.config["FASJSON_REPLICA_RETRY_INTERVAL"],
+            persist_interval=app.config["FASJSON_REPLICA_PERSIST_INTERVAL"],
+        )
+        replica.start()
+        app.extensions["fasjson_ldap_replica"] = replica
+
+    def _get_ldap_uri(self, app):
+        with app.app_context():
+            return app.extensions["fasjson_ipacfg"].get_ldap_uri()
@@ -1,8 +1,10 @@
 from functools import wraps
 
+from flask import Response
 from flask_restx import Namespace as RestXNamespace
 from flask_restx.utils import merge, unpack
 
+from ..utils.marshalling import get_request_mask
 from ..utils.pagination import paged_marshal
 
 
@@ -11,7 +13,31 @@ class Namespace(RestXNamespace):
         if not isinstance(fields, dict):
             return self.marshal_with_field(fields, *args, **kwargs)
         kwargs.setdefault("envelope", "result")
-        return super().marshal_with(fields, *args, **kwargs)
+        decorator = super().marshal_with(fields, *args, **kwargs)
+        compiled = getattr(fields, "compiled", None)
+        if compiled is None or self.ordered or kwargs.get("skip_none") or kwargs.get("mask"):
+            return decorator
+        envelope = kwargs["envelope"]
+
+        def marshal(data):
+            data = compiled.marshal(data, get_request_mask())
+            return {envelope: data} if envelope else data
+
+        def compiled_decorator(func):
+            # Only keep the documentation, the compiled model marshals the result.
+            decorator(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                result = func(*args, **kwargs)
+                if isinstance(result, tuple):
+                    data, code, headers = unpack(result)
+                    return marshal(data), code, headers
+                return marshal(result)
+
+            return wrapper
+
+        return compiled_decorator
 
     def paged_marshal_with(self, model, description=None, **marshal_kwargs):
         """
@@ -31,6 +57,9 @@ class Namespace(RestXNamespace):
             @wraps(func)
             def wrapper(*args, **kwargs):
                 result = func(*args, **kwargs)
+                if isinstance(result, Response):
+                    # Streamed responses are already marshalled
+                    return result
                 return paged_marshal(result, model, ordered=self.ordered, **marshal_kwargs)
 
             return wrapper
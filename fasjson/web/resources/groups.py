@@ -1,50 +1,66 @@
-from flask_restx import fields, Resource
+from flask import current_app
+from flask_restx import fields, reqparse, Resource
 
 from fasjson.lib.ldap.models import GroupModel as LDAPGroupModel
 from fasjson.lib.ldap.models import UserModel as LDAPUserModel
+from fasjson.web.utils.caching import cached_response
+from fasjson.web.utils.conditional import check_etag
 from fasjson.web.utils.ipa import (
     get_attrs_from_mask,
     get_fields_from_ldap_model,
     ldap_client,
 )
-from fasjson.web.utils.pagination import page_request_parser
+from fasjson.web.utils.marshalling import compile_model
+from fasjson.web.utils.pagination import (
+    cursor_request_parser,
+    get_page_kwargs,
+    stream_request_parser,
+)
+from fasjson.web.utils.request_parsing import string_list
+from fasjson.web.utils.streaming import stream_marshal, wants_stream
 
 from .base import Namespace
 
 
 api_v1 = Namespace("groups", description="Groups related operations")
 
-GroupModel = api_v1.model(
-    "Group",
-    get_fields_from_ldap_model(LDAPGroupModel, "v1.groups_group"),
+GroupModel = compile_model(
+    api_v1.model(
+        "Group",
+        get_fields_from_ldap_model(LDAPGroupModel, "v1.groups_group"),
+    )
 )
 
-MemberModel = api_v1.model(
-    "Member",
-    get_fields_from_ldap_model(LDAPUserModel, "v1.users_user"),
-    mask="{username,uri}",
+MemberModel = compile_model(
+    api_v1.model(
+        "Member",
+        get_fields_from_ldap_model(LDAPUserModel, "v1.users_user"),
+        mask="{username,uri}",
+    )
 )
 
-SponsorModel = api_v1.model(
-    "Sponsor",
-    get_fields_from_ldap_model(LDAPUserModel, "v1.users_user"),
-    mask="{username,uri}",
+SponsorModel = compile_model(
+    api_v1.model(
+        "Sponsor",
+        get_fields_from_ldap_model(LDAPUserModel, "v1.users_user"),
+        mask="{username,uri}",
+    )
 )
 
 
 @api_v1.route("/")
 class GroupList(Resource):
+    @cached_response
     @api_v1.doc("list_groups")
-    @api_v1.expect(page_request_parser)
+    @api_v1.expect(cursor_request_parser)
     @api_v1.paged_marshal_with(GroupModel)
     def get(self):
         """List all groups"""
-        args = page_request_parser.parse_args()
+        args = cursor_request_parser.parse_args()
         client = ldap_client()
         result = client.get_groups(
             attrs=get_attrs_from_mask(GroupModel),
-            page_size=args.page_size,
-            page_number=args.page_number,
+            **get_page_kwargs(args),
         )
         return result
 
@@ -53,6 +69,7 @@ class GroupList(Resource):
 @api_v1.param("groupname", "The group name")
 @api_v1.response(404, "Group not found")
 class Group(Resource):
+    @cached_response
     @api_v1.doc("get_group")
     @api_v1.marshal_with(GroupModel)
     def get(self, groupname):
@@ -61,6 +78,7 @@ class Group(Resource):
         res = client.get_group(groupname, attrs=get_attrs_from_mask(GroupModel))
         if res is None:
             api_v1.abort(404, "Group not found", groupname=groupname)
+        check_etag(LDAPGroupModel.get_version(res))
         return res
 
 
@@ -68,37 +86,53 @@ class Group(Resource):
 @api_v1.param("groupname", "The group name")
 @api_v1.response(404, "Group not found")
 class GroupMembers(Resource):
+    @cached_response
     @api_v1.doc("list_group_members")
-    @api_v1.expect(page_request_parser)
+    @api_v1.expect(stream_request_parser)
     @api_v1.paged_marshal_with(MemberModel)
     def get(self, groupname):
         """Fetch group members given the group name"""
-        args = page_request_parser.parse_args()
+        args = stream_request_parser.parse_args()
         client = ldap_client()
 
-        group = client.get_group(groupname)
+        group = client.get_group(groupname, attrs=["groupname"])
         if group is None:
             api_v1.abort(404, "Group not found", groupname=groupname)
 
-        return client.get_group_members(
+        if wants_stream(args):
+            members = client.iter_group_members(groupname, attrs=get_attrs_from_mask(MemberModel))
+            return stream_marshal(members, MemberModel)
+
+        result = client.get_group_members(
             groupname,
             attrs=get_attrs_from_mask(MemberModel),
-            page_size=args.page_size,
-            page_number=args.page_number,
+            **get_page_kwargs(args),
         )
+        # The group's version changes when direct members are added or removed, the members'
+        # versions change when they are modified or join a nested group.
+        check_etag(
+            LDAPGroupModel.get_version(group),
+            (result.total, result.next_key),
+            *(
+                (member.get("username"), LDAPUserModel.get_version(member))
+                for member in result.items
+            ),
+        )
+        return result
 
 
 @api_v1.route("/<name:groupname>/sponsors/")
 @api_v1.param("groupname", "The group name")
 @api_v1.response(404, "Group not found")
 class GroupSponsors(Resource):
+    @cached_response
     @api_v1.doc("list_group_sponsors")
     @api_v1.marshal_with(SponsorModel)
     def get(self, groupname):
         """Fetch group sponsors given the group name"""
         client = ldap_client()
 
-        group = client.get_group(groupname)
+        group = client.get_group(groupname, attrs=["groupname"])
         if group is None:
             api_v1.abort(404, "Group not found", groupname=groupname)
 
@@ -110,15 +144,55 @@ class GroupSponsors(Resource):
 @api_v1.param("username", "The user name")
 @api_v1.response(404, "Group not found")
 class IsMember(Resource):
+    @cached_response
     @api_v1.doc("check_membership")
     @api_v1.marshal_with(fields.Boolean())
     def get(self, groupname, username):
         """Check whether a user is a member of the group"""
         client = ldap_client()
 
-        group = client.get_group(groupname)
+        group = client.get_group(groupname, attrs=["groupname"])
         if group is None:
             api_v1.abort(404, "Group not found", groupname=groupname)
 
         result = client.check_membership(groupname, username)
         return result
+
+
+is_member_batch_request_parser = reqparse.RequestParser()
+is_member_batch_request_parser.add_argument(
+    "usernames", type=string_list, required=True, location="json", help="The user names."
+)
+is_member_batch_request_parser.add_argument(
+    "groups", type=string_list, required=True, location="json", help="The group names."
+)
+
+IsMemberBatchModel = api_v1.model(
+    "IsMemberBatch",
+    {
+        "result": fields.Raw(
+            description=(
+                "For each user name, an object mapping each group name to whether the user is a "
+                "member of it, or to null if the group does not exist."
+            )
+        ),
+    },
+)
+
+
+@api_v1.route("/is-member/")
+class IsMemberBatch(Resource):
+    @api_v1.doc("check_memberships")
+    @api_v1.expect(is_member_batch_request_parser)
+    @api_v1.response(200, "Success", IsMemberBatchModel)
+    @api_v1.response(400, "Too many users or groups requested")
+    def post(self):
+        """Check whether several users are members of several groups"""
+        args = is_member_batch_request_parser.parse_args()
+        usernames = list(dict.fromkeys(args.usernames))
+        groupnames = list(dict.fromkeys(args.groups))
+        max_size = current_app.config["FASJSON_BATCH_MAX_SIZE"]
+        if len(usernames) > max_size or len(groupnames) > max_size:
+            api_v1.abort(400, f"Too many users or groups requested, the maximum is {max_size}.")
+        client = ldap_client()
+        return {"result": client.check_memberships(usernames, groupnames)}
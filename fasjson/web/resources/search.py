@@ -3,15 +3,16 @@ from flask_restx.inputs import datetime_from_iso8601
 
 from fasjson.lib.ldap.models import UserModel as LDAPUserModel
 from fasjson.web.utils import maybe_anonymize
+from fasjson.web.utils.caching import cached_response
 from fasjson.web.utils.ipa import get_attrs_from_mask, ldap_client
-from fasjson.web.utils.pagination import page_request_parser
+from fasjson.web.utils.pagination import cursor_request_parser, decode_cursor
 from fasjson.web.utils.request_parsing import add_exact_arguments
 
 from .base import Namespace
 from .users import UserModel
 
 
-search_request_parser = page_request_parser.copy()
+search_request_parser = cursor_request_parser.copy()
 search_request_parser.add_argument("email", help="The email to search for")
 search_request_parser.add_argument("email__exact", help="DEPRECATED: use email")
 search_request_parser.add_argument("username", help="The username to search for")
@@ -40,6 +41,7 @@ api_v1 = Namespace("search", description="Search related operations")
 
 @api_v1.route("/users/")
 class SearchUsers(Resource):
+    @cached_response
     @api_v1.doc("search")
     @api_v1.expect(search_request_parser)
     @api_v1.response(400, "Validation Error")
@@ -48,7 +50,10 @@ class SearchUsers(Resource):
         """Fetch users given a search term"""
         search_args = search_request_parser.parse_args()
         page_number, page_size = self._parse_page_args(search_args)
+        cursor = search_args.pop("cursor")
         self._validate_search_args(search_args)
+        if cursor is not None:
+            search_args["after"] = decode_cursor(cursor)
 
         client = ldap_client()
         result = client.search_users(
@@ -57,7 +62,8 @@ class SearchUsers(Resource):
             page_number=page_number,
             **search_args
         )
-        result.items = [maybe_anonymize(user) for user in result.items]
+        # Anonymize the users while they are being marshalled
+        result.items = map(maybe_anonymize, result.items)
         return result
 
     def _parse_page_args(self, search_args):
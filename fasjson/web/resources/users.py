@@ -1,48 +1,106 @@
-from flask_restx import fields, Resource
+from flask import current_app
+from flask_restx import fields, reqparse, Resource
 
 from fasjson.lib.ldap.models import GroupModel as LDAPGroupModel
 from fasjson.lib.ldap.models import UserModel as LDAPUserModel
-from fasjson.web.utils import maybe_anonymize
+from fasjson.web.utils import is_own_private_entry, maybe_anonymize
+from fasjson.web.utils.caching import cached_response
+from fasjson.web.utils.conditional import check_etag
 from fasjson.web.utils.ipa import (
     get_attrs_from_mask,
     get_fields_from_ldap_model,
     ldap_client,
 )
-from fasjson.web.utils.pagination import page_request_parser
+from fasjson.web.utils.marshalling import compile_model
+from fasjson.web.utils.pagination import (
+    get_page_kwargs,
+    page_request_parser,
+    paged_marshal,
+    stream_request_parser,
+)
+from fasjson.web.utils.request_parsing import string_list
+from fasjson.web.utils.streaming import stream_marshal, wants_stream
 
 from .base import Namespace
 
 
 api_v1 = Namespace("users", description="Users related operations")
 
-UserModel = api_v1.model(
-    "User",
-    get_fields_from_ldap_model(LDAPUserModel, "v1.users_user", {"locked": {"default": False}}),
+UserModel = compile_model(
+    api_v1.model(
+        "User",
+        get_fields_from_ldap_model(LDAPUserModel, "v1.users_user", {"locked": {"default": False}}),
+    )
 )
 
 
 @api_v1.route("/")
 class UserList(Resource):
+    @cached_response
     @api_v1.doc("list_users")
-    @api_v1.expect(page_request_parser)
+    @api_v1.expect(stream_request_parser)
     @api_v1.paged_marshal_with(UserModel)
     def get(self):
         """List all users"""
-        args = page_request_parser.parse_args()
+        args = stream_request_parser.parse_args()
         client = ldap_client()
+        if wants_stream(args):
+            users = client.iter_users(attrs=get_attrs_from_mask(UserModel))
+            return stream_marshal(map(maybe_anonymize, users), UserModel)
         result = client.get_users(
             attrs=get_attrs_from_mask(UserModel),
-            page_size=args.page_size,
-            page_number=args.page_number,
+            **get_page_kwargs(args),
         )
-        result.items = [maybe_anonymize(user) for user in result.items]
+        # Anonymize the users while they are being marshalled
+        result.items = map(maybe_anonymize, result.items)
         return result
 
 
+batch_request_parser = reqparse.RequestParser()
+batch_request_parser.add_argument(
+    "usernames", type=string_list, required=True, location="json", help="The user names."
+)
+
+UserBatchModel = api_v1.model(
+    "UserBatch",
+    {
+        "result": fields.List(fields.Nested(UserModel)),
+        "not_found": fields.List(fields.String()),
+    },
+)
+
+
+@api_v1.route("/batch/")
+class UserBatch(Resource):
+    @api_v1.doc("get_users_batch")
+    @api_v1.expect(batch_request_parser)
+    @api_v1.response(200, "Success", UserBatchModel)
+    @api_v1.response(400, "Too many users requested")
+    def post(self):
+        """Fetch several users given their names
+
+        The users that don't exist are listed in the ``not_found`` key.
+        """
+        args = batch_request_parser.parse_args()
+        # Remove duplicates but keep the order
+        usernames = list(dict.fromkeys(args.usernames))
+        max_size = current_app.config["FASJSON_BATCH_MAX_SIZE"]
+        if len(usernames) > max_size:
+            api_v1.abort(400, f"Too many users requested, the maximum is {max_size}.")
+        client = ldap_client()
+        result = client.get_users_by_name(usernames, attrs=get_attrs_from_mask(UserModel))
+        found = {user["username"].lower() for user in result.items}
+        result.items = map(maybe_anonymize, result.items)
+        output = paged_marshal(result, UserModel)
+        output["not_found"] = [name for name in usernames if name.lower() not in found]
+        return output
+
+
 @api_v1.route("/<name:username>/")
 @api_v1.param("username", "The user name")
 @api_v1.response(404, "User not found")
 class User(Resource):
+    @cached_response
     @api_v1.doc("get_user")
     @api_v1.marshal_with(UserModel)
     def get(self, username):
@@ -51,14 +109,17 @@ class User(Resource):
         res = client.get_user(username, attrs=get_attrs_from_mask(UserModel))
         if res is None:
             api_v1.abort(404, "User not found", name=username)
+        check_etag(LDAPUserModel.get_version(res), personal=is_own_private_entry(res))
         res = maybe_anonymize(res)
         return res
 
 
-UserGroupsModel = api_v1.model(
-    "UserGroup",
-    get_fields_from_ldap_model(LDAPGroupModel, "v1.groups_group"),
-    mask="{groupname,uri}",
+UserGroupsModel = compile_model(
+    api_v1.model(
+        "UserGroup",
+        get_fields_from_ldap_model(LDAPGroupModel, "v1.groups_group"),
+        mask="{groupname,uri}",
+    )
 )
 
 
@@ -66,6 +127,7 @@ UserGroupsModel = api_v1.model(
 @api_v1.param("username", "The user name")
 @api_v1.response(404, "User not found")
 class UserGroups(Resource):
+    @cached_response
     @api_v1.doc("list_user_groups")
     @api_v1.expect(page_request_parser)
     @api_v1.paged_marshal_with(UserGroupsModel)
@@ -73,7 +135,8 @@ class UserGroups(Resource):
         """Fetch a user's groups given their username"""
         args = page_request_parser.parse_args()
         client = ldap_client()
-        user = client.get_user(username)
+        # Fetch the attribute that get_user_groups() needs, it will not be requested again.
+        user = client.get_user(username, attrs=["groups"])
         if user is None:
             api_v1.abort(404, "User does not exist", name=username)
         return client.get_user_groups(
@@ -94,6 +157,7 @@ UserAgreementsModel = api_v1.model(
 @api_v1.param("username", "The user name")
 @api_v1.response(404, "User not found")
 class UserAgreements(Resource):
+    @cached_response
     @api_v1.doc("list_user_agreements")
     @api_v1.expect(page_request_parser)
     @api_v1.paged_marshal_with(UserAgreementsModel)
@@ -101,7 +165,7 @@ class UserAgreements(Resource):
         """Fetch a user's agreements given their username"""
         args = page_request_parser.parse_args()
         client = ldap_client()
-        user = client.get_user(username)
+        user = client.get_user(username, attrs=["username"])
         if user is None:
             api_v1.abort(404, "User does not exist", name=username)
         return client.get_user_agreements(
@@ -4,6 +4,15 @@ from fasjson.lib.ldap.models import UserModel as LDAPUserModel
 
 
 def maybe_anonymize(user):
-    if user.get("is_private", False) and g.username != user["username"]:
-        user = LDAPUserModel.anonymize(user)
+    if user.get("is_private", False):
+        if "private_usernames" in g:
+            # The response depends on who requested it, see cached_response()
+            g.private_usernames.add(user["username"].lower())
+        if g.username != user["username"]:
+            user = LDAPUserModel.anonymize(user)
     return user
+
+
+def is_own_private_entry(user):
+    """Whether this is the authenticated user's private entry, not anonymized for them."""
+    return user.get("is_private", False) and g.username == user["username"]
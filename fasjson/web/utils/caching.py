@@ -0,0 +1,78 @@
+from functools import wraps
+
+from flask import after_this_request, current_app, g, request, Response
+
+from fasjson.web.apis.base import get_mediatype
+
+from .ipa import ldap_client
+from .streaming import NDJSON_MIMETYPE
+
+
+def cached_response(func):
+    """Cache the encoded responses of a resource's GET method.
+
+    The responses are stored in the ``responses`` cache, if it is enabled, by URL (with sorted
+    query arguments), fields mask and representation. They are shared by all the users, except
+    when a private user requests a response that contains their own entry, which is not
+    anonymized for them: it is then cached for this user only. The cache is cleared along with
+    the LDAP client's caches.
+
+    Streamed responses and errors are not cached. Requests that accept newline-delimited JSON
+    rather than JSON don't use the cache: the resource may stream its response.
+    """
+
+    @wraps(func)
+    def wrapper(resource, *args, **kwargs):
+        cache = current_app.extensions["fasjson_ldap_cache"]["responses"]
+        if cache is None or _accepts_stream():
+            return func(resource, *args, **kwargs)
+        # Authenticate, and clear the caches if the directory has changed
+        ldap_client()
+        mediatype = get_mediatype()
+        key = (
+            "responses",
+            request.path,
+            tuple(sorted(request.args.items(multi=True))),
+            request.headers.get(current_app.config["RESTX_MASK_HEADER"]),
+            mediatype,
+        )
+        username = g.username.lower()
+        cached = cache.get((*key, None))
+        if cached is None or username in cached[2]:
+            cached = cache.get((*key, username))
+        if cached is not None:
+            return _cached_to_response(mediatype, *cached)
+
+        # Filled by maybe_anonymize()
+        g.private_usernames = set()
+        result = func(resource, *args, **kwargs)
+        if isinstance(result, Response):
+            return result
+        response = resource.api.make_response(result, 200)
+
+        # Registered last, so that the ETag has been added to the response when it runs
+        @after_this_request
+        def store(response):
+            private_usernames = frozenset(g.private_usernames)
+            value = (response.get_data(), response.headers.get("ETag"), private_usernames)
+            cache.set((*key, username if username in private_usernames else None), value)
+            return response
+
+        return response
+
+    return wrapper
+
+
+def _accepts_stream():
+    # Like wants_stream(), which uses the query arguments that are part of the key
+    accepted = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return accepted == NDJSON_MIMETYPE
+
+
+def _cached_to_response(mediatype, data, etag, private_usernames):
+    headers = {"Vary": "Accept"}
+    if etag is not None:
+        headers["ETag"] = etag
+    if etag is not None and request.if_none_match.contains_weak(etag.strip('"')):
+        return Response(status=304, headers=headers)
+    return Response(data, content_type=mediatype, headers=headers)
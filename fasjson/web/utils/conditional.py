@@ -0,0 +1,58 @@
+import hashlib
+
+from flask import after_this_request, current_app, g, request
+from werkzeug.exceptions import HTTPException
+
+from fasjson.web.apis.base import get_mediatype
+
+
+class NotModified(HTTPException):
+    """The client already has the current version of the requested resource."""
+
+    code = 304
+    description = "Not Modified"
+
+    def __init__(self, etag):
+        super().__init__()
+        self.etag = etag
+
+    def get_headers(self, environ=None, scope=None):
+        return [("ETag", f'"{self.etag}"')]
+
+
+def make_etag(*versions, personal=False):
+    """Build a strong ETag for the response to the current request.
+
+    The response depends on the versions of the entries it is made of, and on the request: the URL,
+    the fields mask and the representation, as the JSON, MessagePack and CBOR bodies differ. It is
+    the same for all the users, and shared by them in the responses cache (see
+    ``cached_response()``), unless it is ``personal``: a private user's own entry is not
+    anonymized for them, so the ETag then depends on the authenticated user too.
+    """
+    mask = request.headers.get(current_app.config["RESTX_MASK_HEADER"])
+    username = g.username if personal else None
+    data = repr((versions, request.full_path, mask, get_mediatype(), username))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def check_etag(*versions, personal=False):
+    """Answer ``304 Not Modified`` if the client has the current version of the response.
+
+    This must be called before the response is built, to avoid building it for nothing. Otherwise,
+    the ETag is added to the response. Nothing is done if a version is unknown. See
+    ``make_etag()`` for ``personal``.
+
+    Raises:
+        NotModified: if the ETag matches the ``If-None-Match`` header of the request.
+    """
+    if None in versions:
+        return
+    etag = make_etag(*versions, personal=personal)
+    if request.if_none_match.contains_weak(etag):
+        raise NotModified(etag)
+
+    @after_this_request
+    def add_etag(response):
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
@@ -0,0 +1,112 @@
+import json
+from abc import ABC, abstractmethod
+from base64 import b64encode
+from datetime import date, time
+
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class Base64Bytes(bytes):
+    """Binary data, encoded in base64 in JSON and sent as is in the binary formats."""
+
+
+def encode_default(value):
+    """Encode the values that JSON has no type for."""
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Base64Bytes):
+        return b64encode(value).decode("ascii")
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+class Encoder(ABC):
+    """Encode data to JSON.
+
+    Subclasses implement :meth:`encode`. Dates, times and bytes are encoded as strings, see
+    :func:`encode_default`.
+    """
+
+    @abstractmethod
+    def encode(self, data, indent=False):
+        """Encode data to JSON.
+
+        Args:
+            data: The data to encode.
+            indent (bool): Indent the output, otherwise it has no whitespace.
+
+        Returns:
+            bytes: the UTF-8 encoded JSON document.
+        """
+
+    def iterencode(self, data, key, chunk_size):
+        """Encode a dictionary, and the list under ``key`` in chunks of ``chunk_size`` items.
+
+        The list is written first, the output is not indented.
+
+        Yields:
+            bytes: the parts of the JSON document.
+        """
+        items = data[key]
+        yield b"{" + self.encode(key) + b":["
+        for start in range(0, len(items), chunk_size):
+            # Remove the brackets around the encoded chunk
+            chunk = self.encode(items[start : start + chunk_size])[1:-1]
+            yield chunk if start == 0 else b"," + chunk
+        yield b"]"
+        for other_key, value in data.items():
+            if other_key != key:
+                yield b"," + self.encode(other_key) + b":" + self.encode(value)
+        yield b"}"
+
+
+class JSONEncoder(Encoder):
+    """Encode with the ``json`` module of the standard library."""
+
+    def encode(self, data, indent=False):
+        if indent:
+            output = json.dumps(data, default=encode_default, ensure_ascii=False, indent=2)
+        else:
+            output = json.dumps(
+                data, default=encode_default, ensure_ascii=False, separators=(",", ":")
+            )
+        return output.encode("utf-8")
+
+
+class OrjsonEncoder(Encoder):
+    """Encode with orjson, which is much faster than the standard library."""
+
+    def encode(self, data, indent=False):
+        return orjson.dumps(
+            data, default=encode_default, option=orjson.OPT_INDENT_2 if indent else 0
+        )
+
+
+ENCODERS = {"json": JSONEncoder, "orjson": OrjsonEncoder}
+
+
+def get_encoder(name="auto"):
+    """Return a JSON encoder.
+
+    Args:
+        name (str or type): ``json``, ``orjson`` or ``auto`` to use orjson if it is installed. It
+            can also be an :class:`Encoder` subclass.
+
+    Returns:
+        Encoder: the encoder.
+    """
+    if isinstance(name, type):
+        return name()
+    if name == "auto":
+        name = "json" if orjson is None else "orjson"
+    if name == "orjson" and orjson is None:
+        raise ValueError("The orjson JSON encoder requires the orjson package")
+    try:
+        return ENCODERS[name]()
+    except KeyError as e:
+        raise ValueError(f"Unknown JSON encoder: {name}") from e
@@ -4,16 +4,42 @@ from python_freeipa import ClientMeta
 
 from fasjson.lib.ldap import converters, get_client
 
+from .marshalling import Binary
+
 
 def ldap_client():
     if g.gss_creds is None or g.username is None:
         abort(401)
-    return get_client(
-        current_app.config["FASJSON_LDAP_URI"],
-        basedn=current_app.config["FASJSON_IPA_BASEDN"],
-        login=g.username,
-        timeout=current_app.config.get("FASJSON_LDAP_TIMEOUT", 30),
+    if "ldap_client" in g:
+        return g.ldap_client
+    uri = current_app.config["FASJSON_LDAP_URI"]
+    basedn = current_app.config["FASJSON_IPA_BASEDN"]
+    pool = current_app.extensions["fasjson_ldap_pool"]
+    caches = current_app.extensions["fasjson_ldap_cache"]
+    # The connection is bound with the user's credentials, only reuse it for the same user.
+    key = (uri, basedn, g.username)
+    g.ldap_client = pool.acquire(
+        key,
+        lambda: get_client(
+            uri,
+            basedn=basedn,
+            login=g.username,
+            timeout=current_app.config.get("FASJSON_LDAP_TIMEOUT", 30),
+            vlv=current_app.config["FASJSON_LDAP_VLV"],
+            pkey_cache=caches["pkeys"],
+            entry_cache=caches["entries"],
+            username=g.username,
+            replica=current_app.extensions["fasjson_ldap_replica"],
+            negative_cache=caches["missing"],
+            name_filter=caches["names"],
+            directory_version=current_app.extensions["fasjson_directory_version"],
+            response_cache=caches["responses"],
+            compact_records=current_app.config["FASJSON_LDAP_COMPACT_RECORDS"],
+        ),
     )
+    g.ldap_client_key = key
+    g.ldap_client.check_directory_version()
+    return g.ldap_client
 
 
 def rpc_client():
@@ -39,6 +65,8 @@ def get_fields_from_ldap_model(ldap_model, endpoint, field_args=None):
             field = fields.Boolean
         elif isinstance(ldap_converter, converters.GeneralTimeConverter):
             field = fields.DateTime
+        elif isinstance(ldap_converter, converters.BinaryConverter):
+            field = Binary
         else:
             field = fields.String
 
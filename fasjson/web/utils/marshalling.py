@@ -0,0 +1,241 @@
+import re
+from base64 import b64decode
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlparse, urlunparse
+
+from flask import current_app, request, url_for
+from flask_restx import fields, marshal
+from flask_restx.marshalling import make
+from flask_restx.mask import apply as apply_mask
+
+from fasjson.lib.ldap.models import Record
+
+from .encoding import Base64Bytes
+
+
+# Number of fields masks compiled per model, the least recently used are discarded.
+MASK_CACHE_SIZE = 64
+# Stands for the route argument while the URL prefix of a Url field is built.
+URL_PLACEHOLDER = "fasjson-url-placeholder"
+# The URL converters don't quote these characters, values made of them are inserted verbatim.
+UNRESERVED_RE = re.compile(r"[A-Za-z0-9_.~-]+")
+
+
+class Binary(fields.Raw):
+    """Binary data, output as base64 in JSON and as raw bytes in the binary formats.
+
+    Base64 strings, as older versions of the LDAP converters stored them, are decoded.
+    """
+
+    __schema_type__ = "string"
+    __schema_format__ = "byte"
+
+    def format(self, value):
+        if isinstance(value, str):
+            value = b64decode(value)
+        return Base64Bytes(value)
+
+
+def compile_model(model):
+    """Compile the marshalling of a flask-restx model, see :class:`CompiledModel`.
+
+    The compiled model is stored on the model, where :func:`paged_marshal`,
+    :func:`stream_marshal` and :meth:`Namespace.marshal_with` find it.
+
+    Returns:
+        flask_restx.Model: the model.
+    """
+    model.compiled = CompiledModel(model)
+    return model
+
+
+def get_request_mask():
+    """Return the fields mask requested in the headers, if any."""
+    return request.headers.get(current_app.config["RESTX_MASK_HEADER"]) or None
+
+
+def get_serializer(model, mask=None, ordered=False):
+    """Return a function that marshals one item with a model, for the current request.
+
+    The model's compiled serializer is used if it has one, otherwise the items are marshalled by
+    flask-restx.
+    """
+    compiled = getattr(model, "compiled", None)
+    if compiled is not None:
+        return compiled.serializer(mask, ordered=ordered)
+    mask = mask or getattr(model, "__mask__", None)
+    resolved = getattr(model, "resolved", model)
+    if mask:
+        resolved = apply_mask(resolved, mask, skip=True)
+    return lambda item: marshal(item, resolved, ordered=ordered)
+
+
+class CompiledModel:
+    """The marshalling of a flask-restx model, compiled into a function per fields mask.
+
+    Marshalling with flask-restx looks up and formats every field generically, for every item,
+    and builds each ``uri`` with ``url_for()``. The compiled functions do the same thing with the
+    work that only depends on the mask done once: which fields to output and how to format them.
+    The URL of the ``Url`` fields is built once per request, the item's name is inserted in it.
+
+    The output is the same as flask-restx's for the field types of the FASJSON models. Other
+    fields, and values of unexpected types, are marshalled by the fields themselves.
+
+    Args:
+        model (flask_restx.Model): The model to compile.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._compile = lru_cache(maxsize=MASK_CACHE_SIZE)(self._compile_mask)
+
+    def serializer(self, mask=None, ordered=False):
+        """Return a function that marshals one item, for the current request.
+
+        Args:
+            mask (str, optional): The fields mask, defaults to the model's mask.
+            ordered (bool): Return ordered dictionaries.
+        """
+        resolved, plan = self._compile(mask or None)
+        converters = [
+            (key, _bind_url(key, field) if convert is None else convert)
+            for key, field, convert in plan
+        ]
+
+        def serialize(item):
+            if not isinstance(item, (dict, Record)):
+                return marshal(item, resolved, ordered=ordered)
+            output = {key: convert(item) for key, convert in converters}
+            return OrderedDict(output) if ordered else output
+
+        return serialize
+
+    def marshal(self, data, mask=None):
+        """Marshal an item, or a list of items."""
+        serialize = self.serializer(mask)
+        if isinstance(data, (list, tuple)):
+            return [serialize(item) for item in data]
+        return serialize(data)
+
+    def _compile_mask(self, mask):
+        mask = mask or getattr(self.model, "__mask__", None)
+        resolved = self.model.resolved
+        if mask:
+            resolved = apply_mask(resolved, mask, skip=True)
+        plan = []
+        for key, field in resolved.items():
+            field = make(field)
+            plan.append((key, field, _compile_field(key, field)))
+        return resolved, tuple(plan)
+
+
+def _compile_field(key, field):
+    """Return a function outputting a field of an item, or ``None`` for a Url field."""
+    if isinstance(field, fields.Url):
+        return None
+    generic = _generic(key, field)
+    if field.attribute is not None or field.mask is not None or callable(field.default):
+        return generic
+    if type(field) is fields.String:
+        return _string(key, _default(field), generic)
+    if type(field) is fields.Boolean:
+        return _boolean(key, _default(field), generic)
+    if type(field) is fields.DateTime and field.dt_format == "iso8601":
+        return _datetime(key, _default(field), generic)
+    if (
+        type(field) is fields.List
+        and type(field.container) is fields.String
+        and field.container.attribute is None
+        and field.container.mask is None
+        and not callable(field.container.default)
+    ):
+        return _string_list(key, field.default, _default(field.container), generic)
+    return generic
+
+
+def _default(field):
+    # What Raw.output() returns when the value is missing
+    return field.format(field.default) if field.default else field.default
+
+
+def _generic(key, field):
+    def convert(item):
+        return field.output(key, item)
+
+    return convert
+
+
+def _string(key, default, generic):
+    def convert(item):
+        value = item.get(key)
+        if value is None:
+            return default
+        if type(value) is str:
+            return value
+        return generic(item)
+
+    return convert
+
+
+def _boolean(key, default, generic):
+    def convert(item):
+        value = item.get(key)
+        if value is None:
+            return default
+        if value is True or value is False:
+            return value
+        return generic(item)
+
+    return convert
+
+
+def _datetime(key, default, generic):
+    def convert(item):
+        value = item.get(key)
+        if value is None:
+            return default
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return generic(item)
+
+    return convert
+
+
+def _string_list(key, default, item_default, generic):
+    def convert(item):
+        value = item.get(key)
+        if value is None:
+            return default
+        if type(value) is list:
+            return [item_default if v is None else str(v) for v in value]
+        return generic(item)
+
+    return convert
+
+
+def _bind_url(key, field):
+    """Build the URL of a Url field for the current request, and insert the items' name in it."""
+    generic = _generic(key, field)
+    if field.endpoint is None:
+        return generic
+    rules = list(current_app.url_map.iter_rules(field.endpoint))
+    if len(rules) != 1 or len(rules[0].arguments) != 1 or rules[0].defaults:
+        return generic
+    (argument,) = rules[0].arguments
+    url = urlparse(url_for(field.endpoint, _external=field.absolute, **{argument: URL_PLACEHOLDER}))
+    if field.absolute:
+        scheme = field.scheme if field.scheme is not None else url.scheme
+        url = urlunparse((scheme, url.netloc, url.path, "", "", ""))
+    else:
+        url = urlunparse(("", "", url.path, "", "", ""))
+    prefix, _placeholder, suffix = url.partition(URL_PLACEHOLDER)
+
+    def convert(item):
+        value = item.get(argument)
+        if type(value) is str and UNRESERVED_RE.fullmatch(value):
+            return f"{prefix}{value}{suffix}"
+        return generic(item)
+
+    return convert
@@ -1,13 +1,81 @@
 import math
 
 from flask import current_app, request
-from flask_restx import marshal, reqparse
+from flask_restx import abort, inputs, reqparse
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from .marshalling import get_request_mask, get_serializer
 
 
 page_request_parser = reqparse.RequestParser()
 page_request_parser.add_argument("page_size", type=int, help="Page size.")
 page_request_parser.add_argument("page_number", type=int, default=1, help="Page number.")
 
+cursor_request_parser = page_request_parser.copy()
+cursor_request_parser.add_argument(
+    "cursor",
+    help=(
+        "Pagination cursor, from the next_cursor value of the previous page. Use an empty value "
+        "to get the first page. Replaces page_number, and requires page_size."
+    ),
+)
+
+stream_request_parser = cursor_request_parser.copy()
+stream_request_parser.add_argument(
+    "stream",
+    type=inputs.boolean,
+    default=False,
+    help=(
+        "Stream all the results as newline-delimited JSON, one entry per line. This can also be "
+        "requested with the Accept: application/x-ndjson header."
+    ),
+)
+
+
+def _get_cursor_serializer():
+    secret_key = current_app.config.get("SECRET_KEY")
+    if not secret_key:
+        abort(400, "Cursor pagination is not available, the SECRET_KEY setting is not set.")
+    return URLSafeSerializer(secret_key, salt="fasjson.pagination.cursor")
+
+
+def encode_cursor(key):
+    """Build an opaque and signed cursor for the page after the primary key ``key``.
+
+    The cursor is only valid on the endpoint it was generated for.
+    """
+    return _get_cursor_serializer().dumps({"path": request.path, "after": key})
+
+
+def decode_cursor(cursor):
+    """Return the primary key encoded in a cursor, or an empty string for the first page."""
+    if not cursor:
+        return ""
+    try:
+        data = _get_cursor_serializer().loads(cursor)
+    except BadSignature:
+        abort(400, "Invalid cursor.", cursor=cursor)
+    if data.get("path") != request.path:
+        abort(400, "This cursor is not valid on this endpoint.", cursor=cursor)
+    return data["after"]
+
+
+def get_page_kwargs(args):
+    """Build the pagination arguments for the LDAP client from the request arguments.
+
+    If a cursor was passed, the ``after`` argument is set and the page number is ignored.
+    """
+    kwargs = {"page_size": args.page_size, "page_number": args.page_number}
+    cursor = args.get("cursor")
+    if cursor is not None:
+        if not args.page_size:
+            abort(400, "A page size is required with a cursor.")
+        max_page_size = current_app.config["FASJSON_CURSOR_MAX_PAGE_SIZE"]
+        if args.page_size > max_page_size:
+            abort(400, f"The page size can't be more than {max_page_size} with a cursor.")
+        kwargs["after"] = decode_cursor(cursor)
+    return kwargs
+
 
 def add_page_data(output, result, model):
     """Use the pagination data from the LDAP result to add page info to the output.
@@ -22,12 +90,30 @@ def add_page_data(output, result, model):
       * ``next_page``: the URL to the next page if there is one. On the last page, this key
         is absent.
 
+    If the query was paginated with a cursor, the ``page`` dictionary contains:
+
+      * ``page_size``: the number of items per page
+      * ``next_cursor``: the cursor to request the next page with, if there is one.
+      * ``next_page``: the URL to the next page if there is one.
+
     If the query was not paginated, this ``page`` dictionary is not added to the output dictionary.
 
     This function does not return anything, the output dictionary is modified in-place.
     """
     if not result.page_size:
         return
+    if result.keyset:
+        output["page"] = {"page_size": result.page_size}
+        if result.next_key is not None:
+            next_cursor = encode_cursor(result.next_key)
+            output["page"]["next_cursor"] = next_cursor
+            qs = request.args.copy()
+            qs.pop("page_number", None)
+            qs["page_size"] = result.page_size
+            qs["cursor"] = next_cursor
+            qs = "&".join(f"{k}={v}" for k, v in qs.items())
+            output["page"]["next_page"] = f"{request.base_url}?{qs}"
+        return
     total_pages = math.ceil(result.total / result.page_size)
     output["page"] = {
         "total_results": result.total,
@@ -48,10 +134,15 @@ def add_page_data(output, result, model):
         output["page"]["next_page"] = f"{base_url}?{qs}"
 
 
-def paged_marshal(result, model, **kwargs):
-    if kwargs.get("mask") is None:
-        mask_header = current_app.config["RESTX_MASK_HEADER"]
-        kwargs["mask"] = request.headers.get(mask_header)
-    output = marshal(result.items, model, envelope="result", **kwargs)
+def paged_marshal(result, model, mask=None, **kwargs):
+    """Marshal the items of an LDAP result and add the pagination data.
+
+    The items can be any iterable, such as a generator applying a transformation to the entries:
+    it is consumed once, while marshalling. The mask is only applied to the model once.
+    """
+    if mask is None:
+        mask = get_request_mask()
+    serialize = get_serializer(model, mask, **kwargs)
+    output = {"result": [serialize(item) for item in result.items]}
     add_page_data(output, result, model)
     return output
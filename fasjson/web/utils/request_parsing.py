@@ -3,7 +3,7 @@ from copy import deepcopy
 
 def add_exact_arguments(parser, model):
     for argument in parser.args:
-        if argument.name in ("page_size", "page_number"):
+        if argument.name in ("page_size", "page_number", "cursor"):
             continue
         if "__" in argument.name:
             continue
@@ -14,3 +14,10 @@ def add_exact_arguments(parser, model):
         new_argument.name = f"{argument.name}__exact"
         new_argument.help = f"{argument.help} (exact match)"
         parser.add_argument(new_argument)
+
+
+def string_list(value):
+    """A request argument type for a JSON list of strings."""
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError("must be a list of strings")
+    return value
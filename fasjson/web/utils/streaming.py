@@ -0,0 +1,49 @@
+from itertools import islice
+
+from flask import current_app, request, Response, stream_with_context
+from flask_restx import abort
+
+from .marshalling import get_request_mask, get_serializer
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Number of entries written at once, this matches the size of the LDAP pages.
+CHUNK_SIZE = 1000
+
+
+def wants_stream(args):
+    """Whether the client asked for a streamed response.
+
+    Streaming is requested with ``?stream=1`` or with the ``Accept: application/x-ndjson``
+    header. It is only available when the listing is not paginated.
+    """
+    accepted = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    if not args.get("stream") and accepted != NDJSON_MIMETYPE:
+        return False
+    if args.get("page_size") or args.get("cursor") is not None:
+        abort(400, "Streamed responses can't be paginated.")
+    return True
+
+
+def stream_marshal(items, model):
+    """Marshal the items one by one and stream them as newline-delimited JSON.
+
+    Args:
+        items (iterable): The items to marshal, they are consumed lazily.
+        model (flask_restx.Model): The model to marshal the items with.
+
+    Returns:
+        flask.Response: a streamed response.
+    """
+    serialize = get_serializer(model, get_request_mask())
+    encoder = current_app.extensions["fasjson_json_encoder"]
+
+    def generate():
+        iterator = iter(items)
+        while True:
+            chunk = [encoder.encode(serialize(item)) for item in islice(iterator, CHUNK_SIZE)]
+            if not chunk:
+                break
+            yield b"\n".join(chunk) + b"\n"
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1 @@
+Convert the LDAP result pages attribute by attribute, and parse the generalized times without strptime()
@@ -0,0 +1 @@
+Encode the responses in MessagePack or CBOR, according to the Accept header, with the certificates as raw bytes
@@ -0,0 +1 @@
+Optionally store the entries of the listings in compact records instead of dictionaries (`FASJSON_LDAP_COMPACT_RECORDS`), and intern the DNs of the group memberships and sponsors
@@ -0,0 +1 @@
+Marshal the users, groups and members with serializers compiled per fields mask
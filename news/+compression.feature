@@ -0,0 +1 @@
+Compress the responses with zstd, brotli or gzip, according to the Accept-Encoding header, including streamed responses
@@ -0,0 +1 @@
+Only convert the LDAP attributes that a result contains, with a plan computed once per projection, and keep the certificates as bytes until the response is serialized
@@ -0,0 +1 @@
+Add cursor-based pagination to the users, groups, group members and users search listings: pass `cursor=` with a `page_size` and follow the returned `next_cursor`. This requires the `SECRET_KEY` setting to be set, with the same value in all processes
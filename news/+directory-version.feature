@@ -0,0 +1 @@
+Clear the caches as soon as the directory is modified, by checking its `lastusn` every `FASJSON_DIRECTORY_VERSION_INTERVAL` seconds
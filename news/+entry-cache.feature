@@ -0,0 +1 @@
+Optionally cache the users and groups fetched by name between requests, and report the cache usage at `/stats` when `FASJSON_STATS` is enabled
@@ -0,0 +1 @@
+Send an `ETag` with users, groups and group members, and answer `304 Not Modified` to conditional requests when they have not changed
@@ -0,0 +1 @@
+Don't request the same LDAP entry twice in a request
@@ -0,0 +1 @@
+Add the `POST /v1/groups/is-member/` endpoint to check the memberships of several users in several groups at once
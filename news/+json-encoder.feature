@@ -0,0 +1 @@
+Encode the responses with orjson when it is installed, without whitespace, and incrementally for large listings
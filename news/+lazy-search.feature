@@ -0,0 +1 @@
+Process LDAP results as a lazy pipeline, marshalling and anonymizing entries in a single pass
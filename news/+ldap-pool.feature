@@ -0,0 +1 @@
+Reuse the bound LDAP connections between requests of the same user instead of binding again for every request
@@ -0,0 +1 @@
+Stream the users and group members listings as newline-delimited JSON with `?stream=1` or `Accept: application/x-ndjson`
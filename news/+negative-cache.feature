@@ -0,0 +1 @@
+Optionally answer the requests for users and groups that do not exist without querying LDAP, with a negative cache (`FASJSON_NEGATIVE_CACHE_SIZE`) and a Bloom filter of the existing names (`FASJSON_NAME_FILTER`)
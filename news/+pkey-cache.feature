@@ -0,0 +1 @@
+Cache the list of primary keys of paginated queries for a short time, so that crawling the following pages does not require scanning the directory again
@@ -0,0 +1 @@
+Serve users, group members and membership checks from an optional local replica kept up to date with LDAP content synchronization
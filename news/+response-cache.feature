@@ -0,0 +1 @@
+Optionally cache the encoded responses of the users, groups and search endpoints
@@ -0,0 +1 @@
+Optionally share the LDAP caches between the WSGI processes in a SQLite database, with `FASJSON_CACHE_PATH`
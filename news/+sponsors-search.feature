@@ -0,0 +1 @@
+Resolve the sponsors of a group with a single LDAP search, whatever the number of sponsor groups
@@ -0,0 +1 @@
+Cache the LDAP servers discovered with DNS SRV records for the duration of their TTL, refresh them in the background, and keep using the last known servers when the resolver is down
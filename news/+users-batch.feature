@@ -0,0 +1 @@
+Add the `POST /v1/users/batch/` endpoint to fetch several users with a single request
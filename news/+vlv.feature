@@ -0,0 +1 @@
+Optionally use the LDAP Virtual List View control to only fetch the requested page when the server has a matching VLV index